@@ -0,0 +1,193 @@
+# app/api/admin.py
+import asyncio
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+
+from app.schemas.admin import AnnTuneIn, ReadCacheIn, ModelReloadIn, SgbMapIn
+from app.utils.response import success, error
+from app.config import EMBEDDING_MODEL_VERSION, ADMIN_TOKEN
+
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """ADMIN_TOKEN bo'lsa — header bilan solishtiriladi; bo'lmasa /admin faqat ichki (loopback) so'rovlar uchun."""
+    if ADMIN_TOKEN:
+        if x_admin_token and hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+            return
+    elif request.client is not None and request.client.host in LOOPBACK_HOSTS:
+        return
+    raise HTTPException(status_code=403, detail="Admin access denied")
+
+
+# rebuild / cache / compact / model reload — hammasi og'ir yoki holatni o'zgartiradi
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def get_ann_index(request: Request):
+    return getattr(request.app.state, "ann_index", None)
+
+
+@router.get("/ann")
+async def ann_stats(request: Request):
+    index = get_ann_index(request)
+    if index is None:
+        return error(message="ANN index is disabled", data=None)
+    return success(data=index.stats())
+
+
+@router.post("/ann")
+async def ann_tune(request: Request, payload: AnnTuneIn):
+    index = get_ann_index(request)
+    if index is None:
+        return error(message="ANN index is disabled", data=None)
+
+    if payload.ef_search is not None:
+        index.set_ef(payload.ef_search)
+
+    rebuild = (
+        (payload.m is not None and payload.m != index.m)
+        or (payload.ef_construction is not None and payload.ef_construction != index.ef_construction)
+    )
+    if rebuild:
+        # og'ir operatsiya — fon rejimida, qidiruv eski graph'da davom etadi
+        asyncio.create_task(
+            asyncio.to_thread(index.rebuild, m=payload.m, ef_construction=payload.ef_construction)
+        )
+
+    return success(
+        message="ANN index rebuild started" if rebuild else "ANN index updated",
+        data=index.stats(),
+    )
+
+
+@router.get("/sgb-map")
+async def sgb_map_stats(request: Request):
+    sgb_map = getattr(request.app.state, "sgb_map", None)
+    if sgb_map is None:
+        return error(message="sgb map cache is disabled", data=None)
+    return success(data=sgb_map.stats())
+
+
+@router.post("/sgb-map")
+async def sgb_map_invalidate(request: Request, payload: SgbMapIn):
+    sgb_map = getattr(request.app.state, "sgb_map", None)
+    if sgb_map is None:
+        return error(message="sgb map cache is disabled", data=None)
+    if payload.clear:
+        sgb_map.clear()
+    elif payload.sgb_person_id is not None:
+        sgb_map.invalidate(payload.sgb_person_id)
+    return success(message="sgb map updated", data=sgb_map.stats())
+
+
+@router.get("/caches")
+async def cache_stats(request: Request):
+    caches = {
+        "best_photo": getattr(request.app.state, "best_photo_cache", None),
+        "read": getattr(request.app.state, "read_cache", None),
+        "idempotency": getattr(request.app.state, "idempotency", None),
+    }
+    return success(data={name: c.stats() if c is not None else None for name, c in caches.items()})
+
+
+@router.post("/caches")
+async def read_cache_update(request: Request, payload: ReadCacheIn):
+    cache = getattr(request.app.state, "read_cache", None)
+    if cache is None:
+        return error(message="Read cache is disabled", data=None)
+    if payload.bypass is not None:
+        cache.bypass = payload.bypass
+    if payload.clear:
+        cache.clear()
+    return success(message="Read cache updated", data=cache.stats())
+
+
+@router.get("/ingest-queue")
+async def ingest_queue_stats(request: Request):
+    queue = getattr(request.app.state, "ingest_queue", None)
+    if queue is None:
+        return error(message="Async ingest is disabled", data=None)
+    return success(data=await asyncio.to_thread(queue.stats))
+
+
+@router.get("/inference")
+async def inference_stats(request: Request):
+    gate = getattr(request.app.state, "inference_gate", None)
+    if gate is None:
+        return error(message="Inference admission control is disabled", data=None)
+    return success(data=gate.stats())
+
+
+@router.get("/model")
+async def model_reload_stats(request: Request):
+    reloader = getattr(request.app.state, "model_reloader", None)
+    if reloader is None:
+        return error(message="Model reload is disabled", data=None)
+    broadcast = getattr(request.app.state, "model_reload_broadcast", None)
+    if broadcast is None:
+        return success(data=reloader.stats())
+    # ko'p worker: so'rov shu worker'ga tushdi, holat — har bir worker bo'yicha
+    return success(data={
+        "requested": broadcast.requested(),
+        "workers": await asyncio.to_thread(broadcast.workers),
+    })
+
+
+@router.post("/model/reload")
+async def model_reload(request: Request, payload: ModelReloadIn):
+    state = request.app.state
+    reloader = getattr(state, "model_reloader", None)
+    if reloader is None:
+        return error(message="Model reload is disabled", data=None)
+
+    version = payload.version or EMBEDDING_MODEL_VERSION
+    models = getattr(state, "embedding_models", None)
+    loaded = set(models.face_apps) if models is not None else {EMBEDDING_MODEL_VERSION}
+    if version not in loaded:
+        return error(message=f"Model version {version} is not loaded", data=sorted(loaded))
+
+    prepare = {k: v for k, v in (("det_size", payload.det_size), ("det_thresh", payload.det_thresh)) if v is not None}
+    broadcast = getattr(state, "model_reload_broadcast", None)
+    if broadcast is not None:
+        # har bir worker o'zi poll qilib, navbat bilan reload qiladi
+        generation = await asyncio.to_thread(broadcast.request, version, **prepare)
+        return success(
+            message="Model reload requested for all workers",
+            data={"generation": generation, "workers": await asyncio.to_thread(broadcast.workers)},
+        )
+
+    # yangi instance fonda quriladi va warm-up qilinadi; so'rovlar shu vaqtda eski instance'da
+    if not reloader.start(version, **prepare):
+        return error(message="Model reload is already running", data=reloader.stats())
+    return success(message="Model reload started", data=reloader.stats())
+
+
+@router.get("/embedding-service")
+async def embedding_service_stats(request: Request):
+    client = getattr(request.app.state, "embedding_client", None)
+    if client is None:
+        return error(message="Embedding service is not configured", data=None)
+    return success(data=client.stats())
+
+
+@router.get("/flat")
+async def flat_stats(request: Request):
+    store = getattr(request.app.state, "flat_store", None)
+    if store is None:
+        return error(message="Flat index is disabled", data=None)
+    return success(data=await asyncio.to_thread(store.stats))
+
+
+@router.post("/flat/compact")
+async def flat_compact(request: Request):
+    store = getattr(request.app.state, "flat_store", None)
+    if store is None:
+        return error(message="Flat index is disabled", data=None)
+    compacted = await asyncio.to_thread(store.compact)
+    return success(
+        message="Flat index compacted" if compacted else "Nothing to compact",
+        data=await asyncio.to_thread(store.stats),
+    )
@@ -0,0 +1,82 @@
+# app/api/embedding.py
+import functools
+
+from fastapi import APIRouter, Request
+
+from app.config import INFERENCE_RETRY_AFTER_SEC
+from app.schemas.embedding import EmbedStrictIn, EmbedDetectIn
+from app.services.embedding_remote import encode_strict, encode_candidate
+from app.services.face_search_pipeline import detect_all_faces_with_quality
+from app.services.image_service import decode_base64, decode_cv2, ImageError
+from app.services.inference_gate import BusyError, LANE_INGEST, LANE_SEARCH, lane_hint
+from app.utils.response import success, error, busy
+
+router = APIRouter()
+
+
+def face_apps(request: Request) -> dict:
+    return request.app.state.embedding_models.face_apps
+
+
+@router.post("/strict")
+async def embed_strict(request: Request, payload: EmbedStrictIn):
+    state = request.app.state
+    if not getattr(state, "ready", False):
+        return busy(INFERENCE_RETRY_AFTER_SEC, message="Model is not ready", data=None)
+
+    version = payload.version or state.embedding_models.primary
+    if version not in face_apps(request):
+        return error(message=f"Model version {version} is not loaded", data=None)
+
+    # strict faqat ingest'dan keladi -> default ingest lane
+    lane = lane_hint(request.headers.get("x-inference-lane"), LANE_INGEST)
+    key = (version, lane, payload.min_det_score, payload.min_face_size, payload.min_blur)
+    try:
+        results = await state.embed_batcher.submit(payload.photos, key)
+    except BusyError as e:
+        return busy(e.retry_after, message=str(e), data=None)
+    return success(data={"version": version, "results": [encode_strict(r) for r in results]})
+
+
+@router.post("/detect")
+async def embed_detect(request: Request, payload: EmbedDetectIn):
+    state = request.app.state
+    if not getattr(state, "ready", False):
+        return busy(INFERENCE_RETRY_AFTER_SEC, message="Model is not ready", data=None)
+
+    try:
+        img = decode_cv2(decode_base64(payload.image))
+    except ImageError as e:
+        return error(message=str(e), data=None)
+
+    apps = face_apps(request)
+    version = payload.version or state.embedding_models.primary
+    if version not in apps:
+        return error(message=f"Model version {version} is not loaded", data=None)
+    detect = functools.partial(
+        detect_all_faces_with_quality,
+        img,
+        apps[version],
+        min_det_score=payload.min_det_score,
+        min_face_size=payload.min_face_size,
+        min_blur=payload.min_blur,
+        max_faces=payload.max_faces,
+        extra_models={v: apps[v] for v in payload.extra_versions if v in apps} or None,
+    )
+    try:
+        faces = await state.inference_gate.submit(
+            detect, lane=lane_hint(request.headers.get("x-inference-lane"), LANE_SEARCH),
+        )
+    except BusyError as e:
+        return busy(e.retry_after, message=str(e), data=None)
+    return success(data={"version": version, "faces": [encode_candidate(f) for f in faces]})
+
+
+@router.get("/stats")
+async def embed_stats(request: Request):
+    state = request.app.state
+    return success(data={
+        "versions": sorted(face_apps(request)) if getattr(state, "embedding_models", None) else [],
+        "batcher": state.embed_batcher.stats(),
+        "inference": state.inference_gate.stats(),
+    })
@@ -0,0 +1,35 @@
+# app/api/health.py
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from app.utils.response import success, error
+from app.services.process_stats import memory_usage
+from app.services.warmup import unstable_versions
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def live():
+    # process tirik va event loop javob beryapti — model holatiga bog'liq emas
+    return success(message="alive")
+
+
+@router.get("/ready")
+async def ready(request: Request):
+    state = request.app.state
+    data = {
+        "model_loaded": getattr(state, "face_app", None) is not None,
+        "warmup": getattr(state, "warmup", None),
+        "startup": getattr(state, "startup", None),
+        "memory": memory_usage(),
+    }
+    if not getattr(state, "ready", False):
+        return JSONResponse(status_code=503, content=error(message="not ready", data=data))
+    # warm-up WARMUP_MAX_ROUNDS ichida barqarorlashmagan: xizmat qiladi, lekin birinchi so'rovlar sekin bo'lishi mumkin
+    unstable = unstable_versions(data["warmup"])
+    data["degraded"] = bool(unstable)
+    if unstable:
+        data["degraded_reason"] = f"warm-up latency did not stabilize: {', '.join(unstable)}"
+        return success(message="ready (degraded)", data=data)
+    return success(message="ready", data=data)
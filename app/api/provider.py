@@ -1,19 +1,65 @@
 # app/api/provider.py
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
 from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError as PydanticValidationError
+from app.config import BULK_INGEST_BATCH_SIZE, INFERENCE_RETRY_AFTER_SEC
 from app.services.database import client
 from app.utils.validation import validate_all_fields, ValidationError
-from app.utils.response import success, error
+from app.utils.response import success, error, busy
 from app.schemas.provider import ProviderPersonIn
 from app.repositories.faceid_repo import FaceIdRepo
 from app.services.provider_ingest_service import ProviderIngestService
+from app.services.inference_gate import BusyError, LANE_INGEST, lane_hint
 from app.schemas.common import PersonResponse
 
 router = APIRouter()
 
 def build_service(request: Request) -> ProviderIngestService:
-    face_app = request.app.state.face_app
+    service = build_service_from_state(request.app.state)
+    service.inference_lane = lane_hint(request.headers.get("x-inference-lane"), LANE_INGEST)
+    return service
+
+def build_service_from_state(state) -> ProviderIngestService:
+    face_app = state.face_app
     repo = FaceIdRepo(client)
-    return ProviderIngestService(repo=repo, face_app=face_app)
+    ann_index = getattr(state, "ann_index", None)
+    flat_store = getattr(state, "flat_store", None)
+    ivf_centroids = getattr(state, "ivf_centroids", None)
+    sgb_map = getattr(state, "sgb_map", None)
+    best_photo_cache = getattr(state, "best_photo_cache", None)
+    read_cache = getattr(state, "read_cache", None)
+    idempotency = getattr(state, "idempotency", None)
+    embedding_models = getattr(state, "embedding_models", None)
+    inference_gate = getattr(state, "inference_gate", None)
+    embedding_client = getattr(state, "embedding_client", None)
+    persons_via_mv = getattr(state, "persons_mv", False)
+    templates_per_person = getattr(state, "templates_per_person", 1)
+    template_locks = getattr(state, "template_locks", None)
+    sgb_locks = getattr(state, "sgb_locks", None)
+    db_executor = getattr(state, "db_executor", None)
+    return ProviderIngestService(
+        repo=repo,
+        face_app=face_app,
+        ann_index=ann_index,
+        flat_store=flat_store,
+        ivf_centroids=ivf_centroids,
+        sgb_map=sgb_map,
+        best_photo_cache=best_photo_cache,
+        read_cache=read_cache,
+        idempotency=idempotency,
+        embedding_models=embedding_models,
+        inference_gate=inference_gate,
+        embedding_client=embedding_client,
+        persons_via_mv=persons_via_mv,
+        templates_per_person=templates_per_person,
+        template_locks=template_locks,
+        sgb_locks=sgb_locks,
+        db_executor=db_executor,
+    )
 
 def transform_codes(payload):
     # Original nusxasini saqlab qo'ymaslik uchun dict ga o'tkazamiz
@@ -81,6 +127,8 @@ Check `status` field:
     }
 )
 async def ingest_person(request: Request, payload: ProviderPersonIn):
+    if not getattr(request.app.state, "ready", False):
+        return busy(INFERENCE_RETRY_AFTER_SEC, message="Model is not ready", person_id=None)
     try:
         # 1. Kodlarni transformatsiya qilish
         payload = transform_codes(payload)
@@ -98,28 +146,193 @@ async def ingest_person(request: Request, payload: ProviderPersonIn):
             person_id=person_id
         )
 
-    except ValidationError as e:
-        error_msg = f"{e.message}"
+    except BusyError as e:
+        return busy(e.retry_after, message=str(e), person_id=None)
+
+    except Exception as e:
+        return error(message=ingest_error_message(e), person_id=None)
+
+
+def ingest_error_message(e: Exception) -> str:
+    if isinstance(e, ValidationError):
         if e.field:
-            error_msg = f"{e.field}: {e.message}"
+            return f"{e.field}: {e.message}"
+        return f"{e.message}"
 
-        return error(message=error_msg, person_id=None)
+    if isinstance(e, ValueError):
+        return str(e)
 
-    except ValueError as e:
-        return error(message=str(e), person_id=None)
+    error_msg = str(e)
 
+    if "validation" in error_msg.lower():
+        lines = error_msg.split('\n')
+        if len(lines) >= 2:
+            for i, line in enumerate(lines):
+                if "Input should be a valid date" in line or "value is outside expected range" in line:
+                    if i > 0:
+                        field = lines[i-1].strip()
+                        msg = line.strip().replace('  ', '')
+                        error_msg = f"{field}: {msg}"
+                        break
+
+    return error_msg
+
+
+# -------------------------
+# ASYNC INGEST (durable queue)
+# -------------------------
+@router.post(
+    "/register-persons/async",
+    summary="Queue person registration and return a receipt immediately",
+    description="""
+Validates the payload like `/register-persons`, stores it in a durable local queue
+and returns `receipt_id` without waiting for inference or database writes.
+
+Poll `/register-persons/status/{receipt_id}` for the result.
+""",
+)
+async def ingest_person_async(request: Request, payload: ProviderPersonIn):
+    queue = getattr(request.app.state, "ingest_queue", None)
+    if queue is None:
+        return error(message="Async ingest is disabled", receipt_id=None)
+    try:
+        payload = transform_codes(payload)
+        validate_all_fields(payload)
+        receipt_id = await asyncio.to_thread(queue.enqueue, payload.dict())
+        return success(message="Person registration queued", receipt_id=receipt_id)
     except Exception as e:
-        error_msg = str(e)
-
-        if "validation" in error_msg.lower():
-            lines = error_msg.split('\n')
-            if len(lines) >= 2:
-                for i, line in enumerate(lines):
-                    if "Input should be a valid date" in line or "value is outside expected range" in line:
-                        if i > 0:
-                            field = lines[i-1].strip()
-                            msg = line.strip().replace('  ', '')
-                            error_msg = f"{field}: {msg}"
-                            break
-
-        return error(message=error_msg, person_id=None)
\ No newline at end of file
+        return error(message=ingest_error_message(e), receipt_id=None)
+
+
+@router.get("/register-persons/status/{receipt_id}")
+async def ingest_status(request: Request, receipt_id: str):
+    queue = getattr(request.app.state, "ingest_queue", None)
+    if queue is None:
+        return error(message="Async ingest is disabled", data=None)
+    status = await asyncio.to_thread(queue.status, receipt_id)
+    if status is None:
+        return error(message="Unknown receipt_id", data=None)
+    return success(data=status)
+
+
+# -------------------------
+# BULK / NDJSON INGEST
+# -------------------------
+async def iter_bulk_records(request: Request) -> AsyncIterator[Any]:
+    """application/x-ndjson -> qatorma-qator (stream); aks holda JSON array."""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        body = await request.json()
+        if not isinstance(body, list):
+            raise ValueError("Request body must be a JSON array or NDJSON stream")
+        for record in body:
+            yield record
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def parse_bulk_record(record: Any) -> ProviderPersonIn:
+    if isinstance(record, (bytes, str)):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e.msg}")
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+
+    try:
+        payload = ProviderPersonIn(**record)
+    except PydanticValidationError as e:
+        # main.py dagi RequestValidationError handler bilan bir xil format
+        raise ValueError("; ".join(
+            f"{err['loc'][-1] if err['loc'] else 'unknown'}: {err['msg']}" for err in e.errors()
+        ))
+
+    payload = transform_codes(payload)
+    validate_all_fields(payload)
+    return payload
+
+
+def bulk_line(index: int, person_id: Any = None, message: Any = None) -> bytes:
+    if message is None:
+        body = success(message="Person registered successfully", person_id=str(person_id))
+    elif isinstance(message, BusyError):
+        # faqat shu yozuv qayta yuborilsin: busy() konverti bilan bir xil
+        body = error(message=str(message), code="busy", retry_after=message.retry_after, person_id=None)
+    else:
+        body = error(message=message, person_id=None)
+    return (json.dumps({"index": index, **body}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@router.post(
+    "/register-persons/batch",
+    summary="Bulk register persons (JSON array or NDJSON stream)",
+    description="""
+Accepts a JSON array of `ProviderPersonIn` records, or an `application/x-ndjson` body
+with one record per line.
+
+Responds with an NDJSON stream: one line per input record, in input order:
+`{"index": 0, "status": "ok" | "error", "message": "...", "person_id": ...}`
+
+Records not processed because inference is saturated get `"code": "busy"` and `"retry_after"`;
+only those need to be resent.
+""",
+)
+async def ingest_persons_batch(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return busy(INFERENCE_RETRY_AFTER_SEC, message="Model is not ready", person_id=None)
+    service = build_service(request)
+
+    async def run() -> AsyncIterator[bytes]:
+        pending: List[Tuple[int, Any]] = []  # (index, payload | xato matni)
+
+        async def flush() -> AsyncIterator[bytes]:
+            valid = [(i, p) for i, p in pending if isinstance(p, ProviderPersonIn)]
+            results: Dict[int, Tuple[Any, Any]] = {}
+            if valid:
+                try:
+                    batch = await service.ingest_many([p for _, p in valid])
+                except BusyError as e:
+                    batch = [(None, e)] * len(valid)
+                except Exception as e:
+                    batch = [(None, ingest_error_message(e))] * len(valid)
+                results = {i: r for (i, _), r in zip(valid, batch)}
+            for i, p in pending:
+                if i in results:
+                    person_id, message = results[i]
+                    yield bulk_line(i, person_id, message)
+                else:
+                    yield bulk_line(i, message=p)
+            pending.clear()
+
+        index = 0
+        try:
+            async for record in iter_bulk_records(request):
+                try:
+                    pending.append((index, parse_bulk_record(record)))
+                except Exception as e:
+                    pending.append((index, ingest_error_message(e)))
+                index += 1
+                if len(pending) >= BULK_INGEST_BATCH_SIZE:
+                    async for line in flush():
+                        yield line
+        except Exception as e:
+            # body o'qib bo'lmadi — shu paytgacha qabul qilinganlar baribir qayta ishlanadi
+            async for line in flush():
+                yield line
+            yield bulk_line(index, message=ingest_error_message(e))
+            return
+
+        async for line in flush():
+            yield line
+
+    return StreamingResponse(run(), media_type="application/x-ndjson")
\ No newline at end of file
@@ -5,13 +5,36 @@ from app.utils.validation import validate_all_fields, ValidationError, validate_
 from app.schemas.search import SearchByPhotoIn
 from app.repositories.search_repo import SearchRepo
 from app.services.search_service import SearchService
+from app.services.inference_gate import BusyError, LANE_SEARCH, lane_hint
+from app.utils.response import busy
+from app.config import INFERENCE_RETRY_AFTER_SEC
 
 router = APIRouter()
 
 def build_service(request: Request) -> SearchService:
     face_app = request.app.state.face_app
     repo = SearchRepo(client)
-    return SearchService(repo=repo, face_app=face_app)
+    ann_index = getattr(request.app.state, "ann_index", None)
+    flat_store = getattr(request.app.state, "flat_store", None)
+    ivf_centroids = getattr(request.app.state, "ivf_centroids", None)
+    read_cache = getattr(request.app.state, "read_cache", None)
+    embedding_models = getattr(request.app.state, "embedding_models", None)
+    inference_gate = getattr(request.app.state, "inference_gate", None)
+    embedding_client = getattr(request.app.state, "embedding_client", None)
+    templates_per_person = getattr(request.app.state, "templates_per_person", 1)
+    return SearchService(
+        repo=repo,
+        face_app=face_app,
+        ann_index=ann_index,
+        flat_store=flat_store,
+        ivf_centroids=ivf_centroids,
+        read_cache=read_cache,
+        embedding_models=embedding_models,
+        inference_gate=inference_gate,
+        inference_lane=lane_hint(request.headers.get("x-inference-lane"), LANE_SEARCH),
+        embedding_client=embedding_client,
+        templates_per_person=templates_per_person,
+    )
 
 def transform_codes(payload):
     data = payload.dict()
@@ -23,6 +46,8 @@ def transform_codes(payload):
 
 @router.post("/search-by-photo")
 async def search_by_photo(request: Request, payload: SearchByPhotoIn):
+    if not getattr(request.app.state, "ready", False):
+        return busy(INFERENCE_RETRY_AFTER_SEC, message="Model is not ready", data=None)
     try:
         payload = transform_codes(payload)
 
@@ -36,6 +61,9 @@ async def search_by_photo(request: Request, payload: SearchByPhotoIn):
             "data": result
         }
 
+    except BusyError as e:
+        return busy(e.retry_after, message=str(e), data=None)
+
     except ValidationError as e:
         msg = e.message
         if e.field:
@@ -0,0 +1,251 @@
+# app/config.py
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    return int(raw) if raw not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    return float(raw) if raw not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw in (None, ""):
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name: str, default: str) -> str:
+    raw = os.getenv(name)
+    return raw if raw not in (None, "") else default
+
+
+# -------------------------
+# SEARCH: quantized two-stage scan
+# -------------------------
+# 0 -> eski exact scan (polygons bo'yicha to'liq).
+# >0 -> avval polygons_bin (Hamming) bo'yicha shuncha kandidat, keyin exact rerank.
+# Yoqishdan oldin scripts/backfill_polygons_bin.py ishga tushirilgan bo'lishi kerak.
+SEARCH_COARSE_CANDIDATES = env_int("SEARCH_COARSE_CANDIDATES", 0)
+
+# -------------------------
+# SEARCH: IVF coarse partitioning (cluster_id)
+# -------------------------
+# 0 -> IVF o'chiq. Per-request SearchByPhotoIn.nprobe ustun turadi (IVF_ENABLED bo'lsa).
+# Yoqishdan oldin scripts/train_ivf.py ishga tushirilgan bo'lishi kerak.
+SEARCH_NPROBE = env_int("SEARCH_NPROBE", 0)
+# centroidlarni yuklash + refresh loop (ingest cluster_id tayinlashi ham shunga bog'liq)
+IVF_ENABLED = env_bool("IVF_ENABLED", SEARCH_NPROBE > 0)
+IVF_REFRESH_SEC = env_float("IVF_REFRESH_SEC", 60.0)
+
+# -------------------------
+# SEARCH: multi-template gallery (person_embeddings slot 0 = centroid, 1..K = template)
+# -------------------------
+# Ingest: har bir person uchun quality_score bo'yicha eng yaxshi K ta EMB_OK rasm saqlanadi.
+# Search: centroidlar bo'yicha TEMPLATE_RERANK_CANDIDATES ta kandidat -> template'lar bilan rerank.
+# TEMPLATES_PER_PERSON = 1 -> rerank o'chiq (eski xatti-harakat). Startup'da migrations 0003/0004 tekshiriladi —
+# qo'llanmagan bo'lsa (yoki tekshiruv yiqilsa) ish vaqtida 1 (app.state.templates_per_person).
+TEMPLATES_PER_PERSON = env_int("TEMPLATES_PER_PERSON", 5)
+# template gallery read-modify-write: person bo'yicha process'lararo lock fayli
+TEMPLATE_LOCK_PATH = env_str("TEMPLATE_LOCK_PATH", "data/person_templates.lock")
+TEMPLATE_RERANK_CANDIDATES = env_int("TEMPLATE_RERANK_CANDIDATES", 50)
+# centroid template'lardan uzoqroq bo'ladi, shuning uchun birinchi bosqich chegarasi kengroq
+TEMPLATE_CENTROID_MAX_DISTANCE = env_float("TEMPLATE_CENTROID_MAX_DISTANCE", 0.85)
+
+# -------------------------
+# FACE QUALITY: blur gate (Laplacian variance, QUALITY_CHIP_SIZE=112 chip'da)
+# -------------------------
+# Eski 60.0 asl rasmdagi crop uchun edi. Chip'da minimal (80px) yuz 112px ga kattalashtiriladi —
+# Laplacian variance ~ (80/112)^4 ≈ 0.26 marta kamayadi: 60 * 0.26 ≈ 15.
+QUALITY_MIN_BLUR = env_float("QUALITY_MIN_BLUR", 15.0)
+
+# -------------------------
+# INGEST: sgb_person_id -> person_id in-process map
+# -------------------------
+# 0 -> o'chiq (har bir ingest ClickHouse'ga argMax so'rovi).
+# Yangi person yaratish migrations/0005 (persons_v2 MV) ga tayanadi — startup'da tekshiriladi,
+# MV bo'lmasa persons_v2 ga to'g'ridan-to'g'ri yoziladi (insert_person).
+SGB_MAP_CAPACITY = env_int("SGB_MAP_CAPACITY", 2_000_000)
+# yozuv shuncha vaqtdan keyin ClickHouse'dan qayta tekshiriladi (0 -> muddatsiz)
+SGB_MAP_TTL_SEC = env_float("SGB_MAP_TTL_SEC", 3600.0)
+# yangi person yaratish: sgb_person_id bo'yicha process'lararo lock fayli (worker'lar bitta sgb uchun ikki UUID yaratmasin)
+SGB_LOCK_PATH = env_str("SGB_LOCK_PATH", "data/sgb_person_map.lock")
+
+# -------------------------
+# INGEST: person -> joriy best photo metrikalari (choose_best_photo uchun)
+# -------------------------
+# Cache per-process: boshqa worker yangilagan person TTL o'tguncha eski metrika bilan ko'rinadi va eski rasm
+# yangi yaxshiroq rasmni bosib ketadi. Shuning uchun bir nechta yozuvchi bo'lsa (SERVER_WORKERS > 1 yoki async
+# queue) default o'chiq; aniq BEST_PHOTO_CACHE_SIZE berilsa — o'sha. 0 -> o'chiq.
+_SINGLE_INGEST_WRITER = env_int("SERVER_WORKERS", 1) <= 1 and not env_bool("INGEST_QUEUE_ENABLED", False)
+BEST_PHOTO_CACHE_SIZE = env_int("BEST_PHOTO_CACHE_SIZE", 500_000 if _SINGLE_INGEST_WRITER else 0)
+BEST_PHOTO_CACHE_TTL_SEC = env_float("BEST_PHOTO_CACHE_TTL_SEC", 300.0)
+
+# -------------------------
+# SEARCH: profiles / sgb ids / border summary read cache
+# -------------------------
+# Ingest shu worker'da person'ni darhol invalidatsiya qiladi; boshqa worker'lar uchun TTL.
+# READ_CACHE_SIZE = 0 -> o'chiq; READ_CACHE_BYPASS -> audit (runtime: POST /admin/caches).
+READ_CACHE_SIZE = env_int("READ_CACHE_SIZE", 200_000)
+READ_CACHE_TTL_SEC = env_float("READ_CACHE_TTL_SEC", 60.0)
+READ_CACHE_MAX_MB = env_int("READ_CACHE_MAX_MB", 512)
+READ_CACHE_BYPASS = env_bool("READ_CACHE_BYPASS", False)
+
+# -------------------------
+# INGEST: bulk / NDJSON endpoint
+# -------------------------
+# Shuncha yozuv bitta inference batch + bitta columnar insert bo'ladi.
+BULK_INGEST_BATCH_SIZE = env_int("BULK_INGEST_BATCH_SIZE", 64)
+
+# -------------------------
+# STARTUP: model warm-up + readiness (/health/ready)
+# -------------------------
+# Sintetik yuzlar bilan aylanalar: latency barqarorlashgach (oxirgi 3 aylana WARMUP_STABLE_RATIO ichida)
+# ready=True. WARMUP_MAX_ROUNDS ichida barqarorlashmasa ham ready, lekin /health/ready "degraded". WARMUP_BATCH_SIZES — recognition get_feat batch o'lchamlari (bulk ingest batch'i ham).
+WARMUP_ENABLED = env_bool("WARMUP_ENABLED", True)
+WARMUP_BATCH_SIZES = env_str("WARMUP_BATCH_SIZES", f"1,{BULK_INGEST_BATCH_SIZE}")
+WARMUP_MIN_ROUNDS = env_int("WARMUP_MIN_ROUNDS", 3)
+WARMUP_MAX_ROUNDS = env_int("WARMUP_MAX_ROUNDS", 20)
+WARMUP_STABLE_RATIO = env_float("WARMUP_STABLE_RATIO", 1.25)
+
+# -------------------------
+# INGEST: durable async queue (SQLite) — /auth/register-persons/async
+# -------------------------
+INGEST_QUEUE_ENABLED = env_bool("INGEST_QUEUE_ENABLED", False)
+INGEST_QUEUE_PATH = env_str("INGEST_QUEUE_PATH", "data/ingest_queue.sqlite3")
+INGEST_QUEUE_WORKERS = env_int("INGEST_QUEUE_WORKERS", 1)  # har bir process uchun
+INGEST_QUEUE_POLL_SEC = env_float("INGEST_QUEUE_POLL_SEC", 0.5)
+INGEST_QUEUE_VISIBILITY_SEC = env_float("INGEST_QUEUE_VISIBILITY_SEC", 300.0)
+INGEST_QUEUE_RETENTION_SEC = env_float("INGEST_QUEUE_RETENTION_SEC", 7 * 24 * 3600.0)
+
+# -------------------------
+# INGEST: idempotency (border_id, sgb_person_id, reg_date, action)
+# -------------------------
+# 0 -> o'chiq. IDEMPOTENCY_DB_LOOKUP: LRU miss'da ClickHouse'dan tekshirish (restart / boshqa worker).
+IDEMPOTENCY_CACHE_SIZE = env_int("IDEMPOTENCY_CACHE_SIZE", 500_000)
+IDEMPOTENCY_TTL_SEC = env_float("IDEMPOTENCY_TTL_SEC", 24 * 3600.0)
+IDEMPOTENCY_DB_LOOKUP = env_bool("IDEMPOTENCY_DB_LOOKUP", True)
+
+# -------------------------
+# INGEST: request path ClickHouse lookup'lari (idempotency) — event loop'dan tashqarida
+# -------------------------
+# har bir thread o'z ulanishi bilan (shared client thread-safe emas). 0 -> event loop'da shared client bilan.
+DB_LOOKUP_THREADS = env_int("DB_LOOKUP_THREADS", 4)
+
+# -------------------------
+# INFERENCE: admission control / load shedding (search + ingest)
+# -------------------------
+# 0 -> o'chiq (cheksiz asyncio.to_thread, eski xatti-harakat).
+# Bir vaqtda INFERENCE_MAX_CONCURRENCY ta inference (alohida executor); INFERENCE_MAX_QUEUE ta kutadi,
+# ortig'i yoki INFERENCE_QUEUE_TIMEOUT_SEC dan ko'p kutgani -> "busy" javobi (retry_after).
+INFERENCE_MAX_CONCURRENCY = env_int("INFERENCE_MAX_CONCURRENCY", 4)
+INFERENCE_MAX_QUEUE = env_int("INFERENCE_MAX_QUEUE", 32)
+INFERENCE_QUEUE_TIMEOUT_SEC = env_float("INFERENCE_QUEUE_TIMEOUT_SEC", 10.0)
+INFERENCE_RETRY_AFTER_SEC = env_float("INFERENCE_RETRY_AFTER_SEC", 2.0)
+# Lane'lar: search har doim birinchi; ingest kutayotgan bo'lsa slotlarning kamida shu ulushi ingest'ga.
+# So'rov X-Inference-Lane header'i bilan o'zini pastroq lane'ga qo'ya oladi (search -> ingest).
+INFERENCE_INGEST_MIN_SHARE = env_float("INFERENCE_INGEST_MIN_SHARE", 0.2)
+
+# -------------------------
+# INFERENCE: ONNX Runtime session'lari
+# -------------------------
+# ORT_INTRA_OP_THREADS = 0 -> cpu_count / (INFERENCE_MAX_CONCURRENCY * SERVER_WORKERS) (session butun CPU'ni olmasin).
+# ORT_INTER_OP_THREADS faqat ORT_EXECUTION_MODE=parallel bo'lganda ishlatiladi.
+# INFERENCE_CPU_CORES ("0-7"): inference thread'larini core'larga bog'lash (ORT_INTRA_OP_THREADS=1 bilan).
+ORT_INTRA_OP_THREADS = env_int("ORT_INTRA_OP_THREADS", 0)
+ORT_INTER_OP_THREADS = env_int("ORT_INTER_OP_THREADS", 0)
+ORT_EXECUTION_MODE = env_str("ORT_EXECUTION_MODE", "sequential")  # sequential | parallel
+ORT_GRAPH_OPT_LEVEL = env_str("ORT_GRAPH_OPT_LEVEL", "all")  # disable | basic | extended | all
+ORT_CPU_MEM_ARENA = env_bool("ORT_CPU_MEM_ARENA", True)
+ORT_PROVIDERS = env_str("ORT_PROVIDERS", "CUDAExecutionProvider,CPUExecutionProvider")
+INFERENCE_CPU_CORES = env_str("INFERENCE_CPU_CORES", "")
+# Optimallashtirilgan graph'lar cache'i (birinchi start yozadi, keyingilari qayta optimallashtirmaydi). "" -> o'chiq.
+ORT_MODEL_CACHE_DIR = env_str("ORT_MODEL_CACHE_DIR", "data/ort_cache")
+
+# -------------------------
+# SERVER: preload-and-fork (gunicorn -c gunicorn.conf.py app.main:app)
+# -------------------------
+# MODEL_PRELOAD=true -> og'irliklar gunicorn master'da bir marta o'qiladi, worker'lar ularni copy-on-write
+# bo'lishadi; ONNX session'lar (va thread pool'lar) har bir worker'da fork'dan keyin yaratiladi.
+# ORT_PREPACK_SHARED_WEIGHTS=false -> MatMul/Gemm prepack o'chiq (prepack har bir worker'da xususiy nusxa).
+SERVER_BIND = env_str("SERVER_BIND", "0.0.0.0:8000")
+SERVER_WORKERS = env_int("SERVER_WORKERS", 1)
+SERVER_TIMEOUT_SEC = env_int("SERVER_TIMEOUT_SEC", 120)
+MODEL_PRELOAD = env_bool("MODEL_PRELOAD", True)
+ORT_PREPACK_SHARED_WEIGHTS = env_bool("ORT_PREPACK_SHARED_WEIGHTS", False)
+
+# -------------------------
+# MODEL: prepare() parametrlari + hot reload (POST /admin/model/reload)
+# -------------------------
+# Reload yangi face_app'ni fonda quradi va warm-up qiladi, keyin almashtiradi; eski instance unga tegishli
+# so'rovlar tugagach bo'shatiladi (MODEL_RELOAD_RELEASE_TIMEOUT_SEC gacha kutiladi, keyin faqat ogohlantirish).
+FACE_DET_SIZE = env_int("FACE_DET_SIZE", 640)
+FACE_DET_THRESH = env_float("FACE_DET_THRESH", 0.5)
+MODEL_RELOAD_RELEASE_TIMEOUT_SEC = env_float("MODEL_RELOAD_RELEASE_TIMEOUT_SEC", 120.0)
+# SERVER_WORKERS > 1: reload so'rovi shu katalog orqali barcha worker'larga yetkaziladi (har biri poll qiladi,
+# navbat bilan reload qiladi) va har bir worker holati shu yerda (GET /admin/model)
+MODEL_RELOAD_DIR = env_str("MODEL_RELOAD_DIR", "data/model_reload")
+MODEL_RELOAD_POLL_SEC = env_float("MODEL_RELOAD_POLL_SEC", 2.0)
+
+# -------------------------
+# EMBEDDING SERVICE (alohida inference process)
+# -------------------------
+#   uvicorn app.embedding_main:app --uds /run/faceid/embed.sock   (yoki --host/--port; gunicorn.conf.py ham mos)
+# API tomonda EMBED_SERVICE_URL ("unix:///run/faceid/embed.sock" | "http://host:8100") berilsa strict embedding
+# va search detection shu service'da; xato bo'lsa EMBED_SERVICE_RETRY_SEC davomida in-process fallback.
+# EMBED_LOCAL_MODEL=false -> API worker model yuklamaydi (xotira tejaladi, fallback yo'q; dual-write /
+# mixed-version search faqat lokal modellar bilan).
+EMBED_SERVICE_URL = env_str("EMBED_SERVICE_URL", "")
+EMBED_SERVICE_TIMEOUT_SEC = env_float("EMBED_SERVICE_TIMEOUT_SEC", 30.0)
+EMBED_SERVICE_RETRY_SEC = env_float("EMBED_SERVICE_RETRY_SEC", 5.0)
+EMBED_LOCAL_MODEL = env_bool("EMBED_LOCAL_MODEL", True)
+# Service tomonda: turli so'rovlardagi rasmlar bitta recognition batch'iga (max / birinchi so'rovdan keyin kutish)
+EMBED_BATCH_MAX = env_int("EMBED_BATCH_MAX", 32)
+EMBED_BATCH_WAIT_MS = env_float("EMBED_BATCH_WAIT_MS", 5.0)
+
+# -------------------------
+# EMBEDDING MODEL VERSIONS (dual-write + mixed-version search)
+# -------------------------
+# EMBEDDING_MODEL_VERSION: asosiy model (insightface model pack nomi) — snapshot'lar shu bilan yoziladi.
+# EMBEDDING_DUAL_WRITE: ingest'da qo'shimcha person_embeddings'ga yoziladigan versiyalar ("antelopev2").
+# EMBEDDING_SEARCH_VERSIONS: search qo'shimcha so'raydigan versiyalar.
+# EMBEDDING_MAX_DISTANCE: versiyaga xos chegaralar ("buffalo_l:0.75,antelopev2:0.70").
+EMBEDDING_MODEL_VERSION = env_str("EMBEDDING_MODEL_VERSION", "buffalo_l")
+EMBEDDING_DUAL_WRITE = env_str("EMBEDDING_DUAL_WRITE", "")
+EMBEDDING_SEARCH_VERSIONS = env_str("EMBEDDING_SEARCH_VERSIONS", "")
+EMBEDDING_MAX_DISTANCE = env_str("EMBEDDING_MAX_DISTANCE", "")
+
+# -------------------------
+# SEARCH: in-process HNSW index (best embedding per person)
+# -------------------------
+# hnswlib o'rnatilmagan yoki index tayyor bo'lmasa -> ClickHouse fallback.
+ANN_INDEX_ENABLED = env_bool("ANN_INDEX_ENABLED", False)
+ANN_INDEX_PATH = env_str("ANN_INDEX_PATH", "data/ann_index")
+ANN_M = env_int("ANN_M", 32)
+ANN_EF_CONSTRUCTION = env_int("ANN_EF_CONSTRUCTION", 200)
+ANN_EF_SEARCH = env_int("ANN_EF_SEARCH", 128)
+ANN_REFRESH_SEC = env_float("ANN_REFRESH_SEC", 30.0)
+ANN_SNAPSHOT_SEC = env_float("ANN_SNAPSHOT_SEC", 600.0)
+
+# -------------------------
+# SEARCH: memory-mapped flat embedding matrix (exact scan, shared page cache)
+# -------------------------
+FLAT_INDEX_ENABLED = env_bool("FLAT_INDEX_ENABLED", False)
+FLAT_INDEX_PATH = env_str("FLAT_INDEX_PATH", "data/flat_index")
+FLAT_INDEX_DTYPE = env_str("FLAT_INDEX_DTYPE", "float16")  # float16 | float32
+FLAT_SCAN_THREADS = env_int("FLAT_SCAN_THREADS", os.cpu_count() or 4)
+FLAT_BLOCK_ROWS = env_int("FLAT_BLOCK_ROWS", 16384)
+FLAT_COMPACT_SEC = env_float("FLAT_COMPACT_SEC", 300.0)
+FLAT_COMPACT_MIN_TAIL = env_int("FLAT_COMPACT_MIN_TAIL", 10000)
+# SearchFilters kandidatlari shundan kam bo'lsa — faqat o'sha qatorlar exact baholanadi
+FLAT_EXACT_CANDIDATES_MAX = env_int("FLAT_EXACT_CANDIDATES_MAX", 200000)
+
+# -------------------------
+# ADMIN API (/admin/*)
+# -------------------------
+# Bo'sh bo'lsa /admin faqat loopback'dan (127.0.0.1 / ::1) ochiladi; aks holda "X-Admin-Token" header talab qilinadi.
+ADMIN_TOKEN = env_str("ADMIN_TOKEN", "")
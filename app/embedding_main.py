@@ -0,0 +1,127 @@
+"""
+Alohida embedding service: faqat face pipeline (strict embedding + search detection), ClickHouse'siz.
+
+    uvicorn app.embedding_main:app --uds /run/faceid/embed.sock
+    uvicorn app.embedding_main:app --host 0.0.0.0 --port 8100
+    SERVER_WORKERS=2 gunicorn -c gunicorn.conf.py app.embedding_main:app   # og'irliklar worker'lar orasida umumiy
+
+API node'lar EMBED_SERVICE_URL orqali ulanadi (app.services.embedding_remote.EmbeddingClient).
+"""
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+
+from fastapi import FastAPI
+
+from app.api import embedding, health
+from app.services.face_recognition import create_face_app
+from app.services.embedding_models import load_embedding_models, parse_versions, parse_thresholds
+from app.services.embedding_batcher import StrictBatcher, strict_batch
+from app.services.inference_gate import InferenceGate
+from app.services.onnx_runtime import parse_cpu_list, pinning_initializer
+from app.services.process_stats import process_uptime_sec, memory_usage
+from app.services.warmup import warm_up, unstable_versions
+from app.config import (
+    INFERENCE_MAX_CONCURRENCY, INFERENCE_MAX_QUEUE, INFERENCE_QUEUE_TIMEOUT_SEC, INFERENCE_RETRY_AFTER_SEC,
+    INFERENCE_INGEST_MIN_SHARE, INFERENCE_CPU_CORES, ORT_INTRA_OP_THREADS,
+    WARMUP_ENABLED, WARMUP_BATCH_SIZES, WARMUP_MIN_ROUNDS, WARMUP_MAX_ROUNDS, WARMUP_STABLE_RATIO,
+    EMBEDDING_MODEL_VERSION, EMBEDDING_DUAL_WRITE, EMBEDDING_SEARCH_VERSIONS, EMBEDDING_MAX_DISTANCE,
+    EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS,
+)
+
+IMPORT_SEC = time.perf_counter() - _IMPORT_STARTED
+
+app = FastAPI(title="Embedding Service", version="1.0", docs_url="/docs", redoc_url=None)
+
+app.include_router(embedding.router, prefix="/embed", tags=["Embedding"])
+app.include_router(health.router, prefix="/health", tags=["Health"])
+
+
+# -------------------------
+# STARTUP: modellar (barcha versiyalar) -> gate + batcher -> warm-up -> ready
+# -------------------------
+@app.on_event("startup")
+async def load_models():
+    app.state.ready = False
+    app.state.warmup = None
+    app.state.startup = {"import_sec": round(IMPORT_SEC, 2)}
+    started = time.perf_counter()
+    try:
+        app.state.face_app = await asyncio.to_thread(create_face_app, EMBEDDING_MODEL_VERSION)
+    except Exception as e:
+        logging.error(f"Model load failed: {e}")
+        app.state.face_app = None
+        app.state.embedding_models = None
+        return
+    app.state.embedding_models = await asyncio.to_thread(
+        load_embedding_models,
+        app.state.face_app,
+        primary=EMBEDDING_MODEL_VERSION,
+        write_versions=parse_versions(EMBEDDING_DUAL_WRITE),
+        search_versions=parse_versions(EMBEDDING_SEARCH_VERSIONS),
+        max_distance=parse_thresholds(EMBEDDING_MAX_DISTANCE),
+        create_face_app=create_face_app,
+    )
+    app.state.startup["model_load_sec"] = round(time.perf_counter() - started, 2)
+
+
+@app.on_event("startup")
+async def create_batcher():
+    # service'da gate doim yoqiq: admission control + lane'lar + batch'lar bitta executor'da
+    app.state.inference_gate = InferenceGate(
+        max(1, INFERENCE_MAX_CONCURRENCY),
+        max_queue=INFERENCE_MAX_QUEUE,
+        queue_timeout_sec=INFERENCE_QUEUE_TIMEOUT_SEC,
+        retry_after_sec=INFERENCE_RETRY_AFTER_SEC,
+        ingest_min_share=INFERENCE_INGEST_MIN_SHARE,
+        thread_initializer=pinning_initializer(
+            parse_cpu_list(INFERENCE_CPU_CORES),
+            cores_per_thread=max(1, ORT_INTRA_OP_THREADS),
+        ),
+    )
+    app.state.embed_batcher = StrictBatcher(
+        lambda version, photos, gates: strict_batch(app.state.embedding_models.face_apps[version], photos, gates),
+        app.state.inference_gate,
+        max_batch=EMBED_BATCH_MAX,
+        wait_ms=EMBED_BATCH_WAIT_MS,
+    )
+
+
+@app.on_event("startup")
+async def start_warmup():
+    if app.state.embedding_models is None:
+        return  # /health/ready 503 bo'lib qoladi
+    app.state.warmup_task = asyncio.create_task(run_warmup())
+
+
+async def run_warmup():
+    started = time.perf_counter()
+    if WARMUP_ENABLED:
+        reports = {}
+        try:
+            for version, face_app in app.state.embedding_models.face_apps.items():
+                reports[version] = await asyncio.to_thread(
+                    warm_up,
+                    face_app,
+                    batch_sizes=[int(b) for b in WARMUP_BATCH_SIZES.split(",") if b.strip()],
+                    min_rounds=WARMUP_MIN_ROUNDS,
+                    max_rounds=WARMUP_MAX_ROUNDS,
+                    stable_ratio=WARMUP_STABLE_RATIO,
+                )
+        except Exception as e:
+            logging.error(f"Model warm-up failed, staying not ready: {e}")
+            app.state.warmup = {"error": str(e)}
+            return
+        app.state.warmup = reports
+        app.state.startup["warmup_sec"] = round(time.perf_counter() - started, 2)
+        unstable = unstable_versions(reports)
+        if unstable:
+            # max_rounds tugadi — ready, lekin /health/ready "degraded" deb ko'rsatadi
+            logging.warning(f"Model warm-up did not stabilize for {unstable}, ready as degraded")
+
+    app.state.startup["ready_after_process_start_sec"] = process_uptime_sec()
+    app.state.ready = True
+    logging.info(f"Embedding service ready: {app.state.startup}, memory: {memory_usage()}")
@@ -1,16 +1,65 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()  # worker start vaqti: import'lar ham hisobga kiradi
+
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import provider, search
+from app.api import provider, search, admin, health
 from app.services.face_recognition import create_face_app
+from app.services.database import client
+from app.services.db_clients import DbExecutor, dedicated_client
+from app.repositories.search_repo import SearchRepo
+from app.repositories.ivf_repo import IvfRepo
+from app.repositories.faceid_repo import FaceIdRepo
+from app.services.sgb_map import SgbPersonMap
+from app.services.person_locks import PersonLocks
+from app.services.lru import LruCache
+from app.services.read_cache import PersonReadCache
+from app.services.ingest_queue import IngestQueue, run_queue_worker
+from app.services.idempotency import IdempotencyGuard
+from app.services.inference_gate import InferenceGate
+from app.services.warmup import warm_up, unstable_versions
+from app.services.model_reload import ModelReloader, ReloadBroadcast
+from app.services.embedding_remote import EmbeddingClient
+from app.services.process_stats import process_uptime_sec, memory_usage
+from app.services.onnx_runtime import parse_cpu_list, pinning_initializer
+from app.services.embedding_models import load_embedding_models, parse_versions, parse_thresholds
+from app.schemas.provider import ProviderPersonIn
+from app.services.ivf import IvfCentroids, run_centroid_refresh_loop
+from app.config import (
+    ANN_INDEX_ENABLED, ANN_INDEX_PATH, ANN_M, ANN_EF_CONSTRUCTION, ANN_EF_SEARCH,
+    ANN_REFRESH_SEC, ANN_SNAPSHOT_SEC,
+    FLAT_INDEX_ENABLED, FLAT_INDEX_PATH, FLAT_INDEX_DTYPE, FLAT_SCAN_THREADS, FLAT_BLOCK_ROWS,
+    FLAT_COMPACT_SEC, FLAT_COMPACT_MIN_TAIL, FLAT_EXACT_CANDIDATES_MAX,
+    IVF_ENABLED, IVF_REFRESH_SEC,
+    SGB_MAP_CAPACITY, SGB_MAP_TTL_SEC, SGB_LOCK_PATH,
+    TEMPLATES_PER_PERSON, TEMPLATE_LOCK_PATH,
+    BEST_PHOTO_CACHE_SIZE, BEST_PHOTO_CACHE_TTL_SEC,
+    READ_CACHE_SIZE, READ_CACHE_TTL_SEC, READ_CACHE_MAX_MB, READ_CACHE_BYPASS,
+    BULK_INGEST_BATCH_SIZE,
+    IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SEC, DB_LOOKUP_THREADS,
+    INGEST_QUEUE_ENABLED, INGEST_QUEUE_PATH, INGEST_QUEUE_WORKERS, INGEST_QUEUE_POLL_SEC,
+    INGEST_QUEUE_VISIBILITY_SEC, INGEST_QUEUE_RETENTION_SEC,
+    INFERENCE_MAX_CONCURRENCY, INFERENCE_MAX_QUEUE, INFERENCE_QUEUE_TIMEOUT_SEC, INFERENCE_RETRY_AFTER_SEC,
+    INFERENCE_INGEST_MIN_SHARE, INFERENCE_CPU_CORES, ORT_INTRA_OP_THREADS,
+    WARMUP_ENABLED, WARMUP_BATCH_SIZES, WARMUP_MIN_ROUNDS, WARMUP_MAX_ROUNDS, WARMUP_STABLE_RATIO,
+    EMBEDDING_MODEL_VERSION, EMBEDDING_DUAL_WRITE, EMBEDDING_SEARCH_VERSIONS, EMBEDDING_MAX_DISTANCE,
+    MODEL_RELOAD_RELEASE_TIMEOUT_SEC, MODEL_RELOAD_DIR, MODEL_RELOAD_POLL_SEC, SERVER_WORKERS,
+    EMBED_SERVICE_URL, EMBED_SERVICE_TIMEOUT_SEC, EMBED_SERVICE_RETRY_SEC, EMBED_LOCAL_MODEL,
+)
 
+import asyncio
+import dataclasses
 import logging
 
 # -------------------------
 # APP INIT
 # -------------------------
+IMPORT_SEC = time.perf_counter() - _IMPORT_STARTED
+
 app = FastAPI(
     title="Universal API",
     version="1.0",
@@ -56,19 +105,411 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 # -------------------------
 app.include_router(provider.router, prefix="/auth", tags=["Authentication"])
 app.include_router(search.router, prefix="/search", tags=["Search"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+app.include_router(health.router, prefix="/health", tags=["Health"])
+
+# -------------------------
+# STARTUP (EMBEDDING SERVICE CLIENT: EMBED_SERVICE_URL)
+# -------------------------
+@app.on_event("startup")
+async def create_embedding_client():
+    app.state.embedding_client = (
+        EmbeddingClient(EMBED_SERVICE_URL, timeout_sec=EMBED_SERVICE_TIMEOUT_SEC, retry_sec=EMBED_SERVICE_RETRY_SEC)
+        if EMBED_SERVICE_URL else None
+    )
 
 # -------------------------
 # STARTUP (MODEL LOAD)
 # -------------------------
 @app.on_event("startup")
 async def load_model_once():
+    app.state.startup = {"import_sec": round(IMPORT_SEC, 2)}
+    app.state.reloaded_versions = {}
+    if SERVER_WORKERS > 1:
+        try:
+            app.state.reloaded_versions = ReloadBroadcast.reloaded_versions(MODEL_RELOAD_DIR)
+        except Exception as e:
+            logging.warning(f"Model reload state not read, using startup models: {e}")
+    if app.state.embedding_client is not None and not EMBED_LOCAL_MODEL:
+        logging.info(f"Inference is served by {EMBED_SERVICE_URL}, local model is not loaded")
+        app.state.face_app = None
+        return
+    started = time.perf_counter()
     try:
-        app.state.face_app = create_face_app()
+        app.state.face_app = load_face_app(EMBEDDING_MODEL_VERSION)
+        app.state.startup["model_load_sec"] = round(time.perf_counter() - started, 2)
         logging.info("Face recognition model loaded successfully")
     except Exception as e:
         logging.error(f"Model load failed: {e}")
         app.state.face_app = None  # server yiqilmasin
 
+
+def load_face_app(version):
+    """
+    Qayta tug'ilgan worker: shu versiya ishlayotganda reload qilingan bo'lsa — o'sha prepare bilan diskdan
+    (shared_weights=False; master'dagi _PRELOADED reload'dan oldingi og'irliklar), aks holda odatdagidek.
+    """
+    reloaded = app.state.reloaded_versions.get(version)
+    if reloaded is None:
+        return create_face_app(version)
+    try:
+        face_app = create_face_app(version, shared_weights=False, **(reloaded.get("prepare") or {}))
+    except Exception as e:
+        logging.error(f"Reloaded model {version} (generation {reloaded.get('generation')}) failed to load: {e}")
+        return create_face_app(version)
+    logging.info(f"Model {version} loaded as reload generation {reloaded.get('generation')}")
+    return face_app
+
+# -------------------------
+# STARTUP (EMBEDDING MODEL VERSIONS: dual-write / mixed-version search)
+# -------------------------
+@app.on_event("startup")
+async def load_secondary_models():
+    app.state.embedding_models = None
+    if app.state.face_app is None:
+        return
+    started = time.perf_counter()
+    app.state.embedding_models = await asyncio.to_thread(
+        load_embedding_models,
+        app.state.face_app,
+        primary=EMBEDDING_MODEL_VERSION,
+        write_versions=parse_versions(EMBEDDING_DUAL_WRITE),
+        search_versions=parse_versions(EMBEDDING_SEARCH_VERSIONS),
+        max_distance=parse_thresholds(EMBEDDING_MAX_DISTANCE),
+        create_face_app=load_face_app,
+    )
+    app.state.startup["secondary_models_sec"] = round(time.perf_counter() - started, 2)
+
+# -------------------------
+# STARTUP (MODEL WARM-UP -> READINESS)
+# -------------------------
+@app.on_event("startup")
+async def start_warmup():
+    app.state.ready = False
+    app.state.warmup = None
+    if app.state.face_app is None:
+        if app.state.embedding_client is not None and not EMBED_LOCAL_MODEL:
+            mark_ready()  # inference faqat service'da (uning holati har bir chaqiruvda)
+        return  # aks holda /health/ready 503 bo'lib qoladi
+    # fon rejimida: /health/live darhol javob beradi, ready warm-up tugagach
+    app.state.warmup_task = asyncio.create_task(run_warmup())
+
+
+async def run_warmup():
+    models = app.state.embedding_models
+    face_apps = models.face_apps if models is not None else {EMBEDDING_MODEL_VERSION: app.state.face_app}
+    if not WARMUP_ENABLED:
+        mark_ready()
+        return
+
+    started = time.perf_counter()
+    reports = {}
+    try:
+        for version, face_app in face_apps.items():
+            reports[version] = await asyncio.to_thread(warm_face_app, face_app)
+    except Exception as e:
+        logging.error(f"Model warm-up failed, staying not ready: {e}")
+        app.state.warmup = {"error": str(e)}
+        return
+
+    app.state.warmup = reports
+    app.state.startup["warmup_sec"] = round(time.perf_counter() - started, 2)
+    unstable = unstable_versions(reports)
+    if unstable:
+        # max_rounds tugadi — ready, lekin /health/ready "degraded" deb ko'rsatadi
+        logging.warning(f"Model warm-up did not stabilize for {unstable}, ready as degraded")
+    mark_ready()
+
+
+def warm_face_app(face_app):
+    return warm_up(
+        face_app,
+        batch_sizes=[int(b) for b in WARMUP_BATCH_SIZES.split(",") if b.strip()],
+        min_rounds=WARMUP_MIN_ROUNDS,
+        max_rounds=WARMUP_MAX_ROUNDS,
+        stable_ratio=WARMUP_STABLE_RATIO,
+    )
+
+
+def mark_ready():
+    app.state.startup["ready_after_process_start_sec"] = process_uptime_sec()
+    app.state.ready = True
+    logging.info(f"Worker ready: {app.state.startup}, memory: {memory_usage()}")
+
+# -------------------------
+# STARTUP (HOT MODEL RELOAD: POST /admin/model/reload)
+# -------------------------
+@app.on_event("startup")
+async def create_model_reloader():
+    app.state.model_reloader = ModelReloader(
+        load=lambda version, **prepare: create_face_app(version, shared_weights=False, **prepare),
+        warm=warm_face_app if WARMUP_ENABLED else (lambda face_app: None),
+        swap=swap_face_app,
+        release_timeout_sec=MODEL_RELOAD_RELEASE_TIMEOUT_SEC,
+    )
+    app.state.model_reload_broadcast = None
+    if SERVER_WORKERS > 1:
+        # so'rov bitta worker'ga tushadi — qolganlari MODEL_RELOAD_DIR orqali oladi
+        try:
+            broadcast = ReloadBroadcast(MODEL_RELOAD_DIR, app.state.model_reloader, poll_sec=MODEL_RELOAD_POLL_SEC)
+        except Exception as e:
+            logging.error(f"Model reload broadcast disabled: {e}")
+            return
+        app.state.model_reload_broadcast = broadcast
+        app.state.model_reload_task = asyncio.create_task(broadcast.run())
+
+
+def swap_face_app(version, face_app):
+    """
+    Await'siz — so'rovlar eski yoki yangi to'plamni ko'radi, aralashini emas. Yaratilgan service'lar
+    eski instance'ni ushlab turadi: in-flight so'rovlar shu instance'da tugaydi.
+    """
+    models = app.state.embedding_models
+    old = models.face_apps.get(version) if models is not None else app.state.face_app
+    if models is not None:
+        app.state.embedding_models = dataclasses.replace(models, face_apps={**models.face_apps, version: face_app})
+    if version == EMBEDDING_MODEL_VERSION:
+        app.state.face_app = face_app
+        if not app.state.ready:
+            mark_ready()  # startup'da yuklanmagan / warm-up yiqilgan model reload bilan tiklanadi
+    return old
+
+# -------------------------
+# STARTUP (INFERENCE ADMISSION CONTROL)
+# -------------------------
+@app.on_event("startup")
+async def create_inference_gate():
+    app.state.inference_gate = (
+        InferenceGate(
+            INFERENCE_MAX_CONCURRENCY,
+            max_queue=INFERENCE_MAX_QUEUE,
+            queue_timeout_sec=INFERENCE_QUEUE_TIMEOUT_SEC,
+            retry_after_sec=INFERENCE_RETRY_AFTER_SEC,
+            ingest_min_share=INFERENCE_INGEST_MIN_SHARE,
+            thread_initializer=pinning_initializer(
+                parse_cpu_list(INFERENCE_CPU_CORES),
+                cores_per_thread=max(1, ORT_INTRA_OP_THREADS),
+            ),
+        )
+        if INFERENCE_MAX_CONCURRENCY > 0 else None
+    )
+
+# -------------------------
+# STARTUP (ANN INDEX: snapshot + delta)
+# -------------------------
+@app.on_event("startup")
+async def load_ann_index():
+    app.state.ann_index = None
+    if not ANN_INDEX_ENABLED:
+        return
+    try:
+        from app.services.ann_index import PersonAnnIndex, run_refresh_loop
+
+        index = PersonAnnIndex(
+            ANN_INDEX_PATH,
+            m=ANN_M,
+            ef_construction=ANN_EF_CONSTRUCTION,
+            ef_search=ANN_EF_SEARCH,
+        )
+        # hydrate / delta refresh thread'da ishlaydi -> o'z ulanishi (shared client event loop'niki)
+        repo = SearchRepo(dedicated_client(client))
+        await asyncio.to_thread(index.hydrate, repo)
+        app.state.ann_index = index
+        app.state.ann_refresh_task = asyncio.create_task(
+            run_refresh_loop(index, repo, refresh_sec=ANN_REFRESH_SEC, snapshot_sec=ANN_SNAPSHOT_SEC)
+        )
+    except Exception as e:
+        logging.error(f"ANN index load failed, using ClickHouse search: {e}")
+        app.state.ann_index = None
+
+# -------------------------
+# STARTUP (FLAT MMAP INDEX)
+# -------------------------
+@app.on_event("startup")
+async def open_flat_store():
+    app.state.flat_store = None
+    if not FLAT_INDEX_ENABLED:
+        return
+    try:
+        from app.services.flat_index import FlatEmbeddingStore, run_compaction_loop
+
+        store = FlatEmbeddingStore(
+            FLAT_INDEX_PATH,
+            dtype=FLAT_INDEX_DTYPE,
+            threads=FLAT_SCAN_THREADS,
+            block_rows=FLAT_BLOCK_ROWS,
+            exact_candidates_max=FLAT_EXACT_CANDIDATES_MAX,
+        )
+        logging.info(f"Flat index opened: {store.stats()}")
+        app.state.flat_store = store
+        app.state.flat_compaction_task = asyncio.create_task(
+            run_compaction_loop(store, interval_sec=FLAT_COMPACT_SEC, min_tail_rows=FLAT_COMPACT_MIN_TAIL)
+        )
+    except Exception as e:
+        logging.error(f"Flat index open failed: {e}")
+        app.state.flat_store = None
+
+# -------------------------
+# STARTUP (IVF CENTROIDS)
+# -------------------------
+@app.on_event("startup")
+async def load_ivf_centroids():
+    app.state.ivf_centroids = None
+    if not IVF_ENABLED:
+        return
+    # centroidlar bo'lmasa ham obyekt turadi: refresh loop keyin yuklab oladi
+    centroids = IvfCentroids()
+    try:
+        # refresh thread'da ishlaydi -> o'z ulanishi (shared client event loop'niki)
+        repo = IvfRepo(dedicated_client(client))
+    except Exception as e:
+        logging.error(f"IVF disabled, ClickHouse client for refresh failed: {e}")
+        return
+    try:
+        await asyncio.to_thread(centroids.refresh, repo)
+    except Exception as e:
+        logging.warning(f"IVF centroids not loaded: {e}")
+    app.state.ivf_centroids = centroids
+    app.state.ivf_refresh_task = asyncio.create_task(
+        run_centroid_refresh_loop(centroids, repo, interval_sec=IVF_REFRESH_SEC)
+    )
+
+# -------------------------
+# STARTUP (SGB -> PERSON_ID MAP)
+# -------------------------
+@app.on_event("startup")
+async def warm_sgb_map():
+    app.state.sgb_map = None
+    app.state.sgb_locks = None
+    try:
+        app.state.sgb_locks = PersonLocks(SGB_LOCK_PATH)
+    except Exception as e:
+        logging.warning(f"sgb create locks disabled ({SGB_LOCK_PATH}): {e}")
+    if SGB_MAP_CAPACITY <= 0:
+        return
+    sgb_map = SgbPersonMap(SGB_MAP_CAPACITY, ttl_sec=SGB_MAP_TTL_SEC if SGB_MAP_TTL_SEC > 0 else None)
+    warm_client = None
+    try:
+        # execute_iter thread'da oxirigacha o'qiladi -> o'z ulanishi (shared client event loop'niki)
+        warm_client = dedicated_client(client)
+        repo = FaceIdRepo(warm_client)
+        loaded = await asyncio.to_thread(lambda: sgb_map.warm(repo.iter_active_sgb_map(SGB_MAP_CAPACITY)))
+        logging.info(f"sgb map warmed: {loaded} entries")
+    except Exception as e:
+        # bo'sh map bilan ham ishlaydi: miss -> ClickHouse lookup
+        logging.warning(f"sgb map warm failed: {e}")
+    finally:
+        if warm_client is not None:
+            warm_client.disconnect()
+    app.state.sgb_map = sgb_map
+
+# -------------------------
+# STARTUP (PERSONS_V2 MV CHECK: migrations/0005)
+# -------------------------
+@app.on_event("startup")
+async def check_persons_mv():
+    # MV bo'lmasa create_person persons_v2 ga o'zi yozadi (aks holda yangi person'lar persons_v2 da bo'lmaydi)
+    try:
+        app.state.persons_mv = FaceIdRepo(client).has_table("persons_v2_from_sgb_map")
+    except Exception as e:
+        logging.warning(f"persons_v2 MV check failed, writing persons_v2 directly: {e}")
+        app.state.persons_mv = False
+    if not app.state.persons_mv:
+        logging.warning("persons_v2_from_sgb_map MV is missing (migrations/0005), using insert_person")
+
+# -------------------------
+# STARTUP (MULTI-TEMPLATE GALLERY CHECK: migrations/0003, 0004)
+# -------------------------
+@app.on_event("startup")
+async def check_person_templates():
+    # tekshirilmaguncha bitta template (best photo) — rerank va K ta slot yoqilmaydi
+    app.state.templates_per_person = 1
+    app.state.template_locks = None
+    try:
+        app.state.template_locks = PersonLocks(TEMPLATE_LOCK_PATH)
+    except Exception as e:
+        logging.warning(f"Template locks disabled ({TEMPLATE_LOCK_PATH}): {e}")
+    if TEMPLATES_PER_PERSON <= 1:
+        return
+    try:
+        ready = FaceIdRepo(client).person_templates_ready()
+    except Exception as e:
+        logging.warning(f"person_embeddings template check failed, TEMPLATES_PER_PERSON=1: {e}")
+        return
+    if not ready:
+        logging.warning("person_embeddings templates are missing (migrations/0003, 0004), TEMPLATES_PER_PERSON=1")
+        return
+    app.state.templates_per_person = TEMPLATES_PER_PERSON
+
+# -------------------------
+# STARTUP (BEST PHOTO METRICS CACHE)
+# -------------------------
+@app.on_event("startup")
+async def create_best_photo_cache():
+    app.state.best_photo_cache = (
+        LruCache(BEST_PHOTO_CACHE_SIZE, ttl_sec=BEST_PHOTO_CACHE_TTL_SEC)
+        if BEST_PHOTO_CACHE_SIZE > 0 else None
+    )
+    if app.state.best_photo_cache is not None and (SERVER_WORKERS > 1 or INGEST_QUEUE_ENABLED):
+        logging.warning(
+            f"Best photo cache is per process (TTL {BEST_PHOTO_CACHE_TTL_SEC}s): other writers' updates "
+            "are not seen until it expires"
+        )
+
+# -------------------------
+# STARTUP (SEARCH READ CACHE)
+# -------------------------
+@app.on_event("startup")
+async def create_read_cache():
+    app.state.read_cache = (
+        PersonReadCache(
+            READ_CACHE_SIZE,
+            ttl_sec=READ_CACHE_TTL_SEC,
+            max_bytes=READ_CACHE_MAX_MB * 1024 * 1024,
+            bypass=READ_CACHE_BYPASS,
+        )
+        if READ_CACHE_SIZE > 0 else None
+    )
+
+# -------------------------
+# STARTUP (INGEST IDEMPOTENCY)
+# -------------------------
+@app.on_event("startup")
+async def create_idempotency_guard():
+    app.state.idempotency = (
+        IdempotencyGuard(IDEMPOTENCY_CACHE_SIZE, ttl_sec=IDEMPOTENCY_TTL_SEC)
+        if IDEMPOTENCY_CACHE_SIZE > 0 else None
+    )
+    # ulanishlar birinchi lookup'da ochiladi
+    app.state.db_executor = DbExecutor(DB_LOOKUP_THREADS, client) if DB_LOOKUP_THREADS > 0 else None
+
+# -------------------------
+# STARTUP (ASYNC INGEST QUEUE WORKERS)
+# -------------------------
+@app.on_event("startup")
+async def start_ingest_queue():
+    app.state.ingest_queue = None
+    if not INGEST_QUEUE_ENABLED:
+        return
+    try:
+        queue = IngestQueue(INGEST_QUEUE_PATH, visibility_sec=INGEST_QUEUE_VISIBILITY_SEC)
+    except Exception as e:
+        logging.error(f"Ingest queue open failed: {e}")
+        return
+    app.state.ingest_queue = queue
+    app.state.ingest_queue_tasks = [
+        asyncio.create_task(run_queue_worker(
+            queue,
+            lambda: provider.build_service_from_state(app.state),
+            lambda data: ProviderPersonIn(**data),
+            batch_size=BULK_INGEST_BATCH_SIZE,
+            poll_sec=INGEST_QUEUE_POLL_SEC,
+            retention_sec=INGEST_QUEUE_RETENTION_SEC,
+            ready=lambda: getattr(app.state, "ready", False),
+        ))
+        for _ in range(max(1, INGEST_QUEUE_WORKERS))
+    ]
+
 # -------------------------
 # ROOT
 # -------------------------
@@ -1,7 +1,27 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator, Tuple
 from uuid import UUID
 
+DOCUMENT_COLUMNS = (
+    "id", "person_id", "citizen", "citizen_sgb", "dtb", "passport", "passport_expired",
+    "sex", "full_name", "face_url", "polygons", "polygons_bin", "cluster_id", "embedding_status",
+    "det_score", "blur", "face_size", "faces_found", "quality_scale", "model_version",
+)
+BORDER_COLUMNS = (
+    "id", "border_id", "person_id", "reg_date", "direction_country", "direction_country_sgb",
+    "visa_type", "visa_number", "visa_organ", "visa_date_from", "visa_date_to", "action", "kpp",
+)
+
+
+def _event_time(value: Any) -> str:
+    # clickhouse_driver parametrni shu ko'rinishda yuboradi — natija qatorlari bilan solishtirish uchun
+    return value.strftime("%Y-%m-%d %H:%M:%S") if hasattr(value, "strftime") else str(value)
+
+
+def _columnar(rows: List[Dict[str, Any]], columns) -> List[List[Any]]:
+    return [[row[c] for row in rows] for c in columns]
+
+
 class FaceIdRepo:
     def __init__(self, client):
         self.client = client
@@ -20,6 +40,46 @@ class FaceIdRepo:
         val = rows[0][0] if rows else None
         return None if val == ZERO_UUID else val
 
+    def iter_active_sgb_map(self, limit: int, *, batch_size: int = 100000) -> Iterator[Tuple[int, Any]]:
+        """Oxirgi yangilanganlari birinchi: (sgb_person_id, person_id) — in-process map warm uchun."""
+        return self.client.execute_iter(
+            """
+            SELECT sgb_person_id, argMax(person_id, version) AS person_id
+            FROM person_sgb_map_v2
+            GROUP BY sgb_person_id
+            HAVING argMax(is_active, version) = 1
+            ORDER BY max(version) DESC
+            LIMIT %(limit)s
+            """,
+            {"limit": int(limit)},
+            settings={"max_block_size": int(batch_size)},
+        )
+
+    def has_table(self, name: str) -> bool:
+        rows = self.client.execute(
+            "SELECT count() FROM system.tables WHERE database = currentDatabase() AND name = %(name)s",
+            {"name": name},
+        )
+        return bool(rows and rows[0][0])
+
+    def person_templates_ready(self) -> bool:
+        """migrations 0003 (person_embeddings) + 0004 (har bir person'da slot > 0 template) qo'llanganmi."""
+        if not self.has_table("person_embeddings"):
+            return False
+        rows = self.client.execute(
+            """
+            SELECT count()
+            FROM (
+                SELECT person_id
+                FROM person_embeddings
+                GROUP BY person_id
+                HAVING countIf(slot > 0) = 0
+                LIMIT 1
+            )
+            """
+        )
+        return not (rows and rows[0][0])
+
     def insert_person(self, person_id: str) -> None:
         self.client.execute(
             "INSERT INTO persons_v2 (id) VALUES",
@@ -46,7 +106,8 @@ class FaceIdRepo:
               argMax(det_score, version) AS det_score,
               argMax(blur, version) AS blur,
               argMax(face_size, version) AS face_size,
-              argMax(faces_found, version) AS faces_found
+              argMax(faces_found, version) AS faces_found,
+              argMax(quality_scale, version) AS quality_scale
             FROM person_documents_v2
             WHERE person_id = %(pid)s
             """,
@@ -55,7 +116,7 @@ class FaceIdRepo:
         if not rows:
             return None
 
-        face_url, polygons, embedding_status, det_score, blur, face_size, faces_found = rows[0]
+        face_url, polygons, embedding_status, det_score, blur, face_size, faces_found, quality_scale = rows[0]
         if embedding_status is None and face_url is None and not polygons:
             return None
 
@@ -67,21 +128,242 @@ class FaceIdRepo:
             "blur": float(blur or 0.0),
             "face_size": int(face_size or 0),
             "faces_found": int(faces_found or 0),
+            "quality_scale": int(quality_scale or 0),
+        }
+
+    # --- latest face metrics (polygons'siz) + embedding faqat kerak bo'lganda ---
+    def get_latest_face_meta(self, person_id: str) -> Optional[Dict[str, Any]]:
+        rows = self.client.execute(
+            """
+            SELECT
+              argMax(id, version) AS document_id,
+              argMax(face_url, version) AS face_url,
+              argMax(embedding_status, version) AS embedding_status,
+              argMax(det_score, version) AS det_score,
+              argMax(blur, version) AS blur,
+              argMax(face_size, version) AS face_size,
+              argMax(faces_found, version) AS faces_found,
+              argMax(quality_scale, version) AS quality_scale
+            FROM person_documents_v2
+            WHERE person_id = %(pid)s
+            """,
+            {"pid": person_id},
+        )
+        if not rows:
+            return None
+
+        document_id, face_url, embedding_status, det_score, blur, face_size, faces_found, quality_scale = rows[0]
+        if embedding_status is None and face_url is None:
+            return None
+
+        return {
+            "document_id": document_id,
+            "face_url": face_url,
+            "embedding_status": int(embedding_status or 0),
+            "det_score": float(det_score or 0.0),
+            "blur": float(blur or 0.0),
+            "face_size": int(face_size or 0),
+            "faces_found": int(faces_found or 0),
+            "quality_scale": int(quality_scale or 0),
         }
 
+    def get_document_polygons(self, person_id: str, document_id: Any) -> Optional[List[float]]:
+        rows = self.client.execute(
+            """
+            SELECT polygons
+            FROM person_documents_v2
+            WHERE person_id = %(pid)s AND id = %(id)s
+            LIMIT 1
+            """,
+            {"pid": person_id, "id": document_id},
+        )
+        return rows[0][0] if rows else None
+
     # --- insert document snapshot WITH metrics ---
     def insert_document_snapshot(self, row: Dict[str, Any]) -> None:
         self.client.execute(
             """
             INSERT INTO person_documents_v2
             (id, person_id, citizen, citizen_sgb, dtb, passport, passport_expired,
-             sex, full_name, face_url, polygons, embedding_status,
-             det_score, blur, face_size, faces_found)
+             sex, full_name, face_url, polygons, polygons_bin, cluster_id, embedding_status,
+             det_score, blur, face_size, faces_found, quality_scale, model_version)
             VALUES
             """,
             [row],
         )
 
+    # --- bulk ingest: ustunli (columnar) insert, bitta so'rov ---
+    def insert_document_snapshots(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self.client.execute(
+            f"INSERT INTO person_documents_v2 ({', '.join(DOCUMENT_COLUMNS)}) VALUES",
+            _columnar(rows, DOCUMENT_COLUMNS),
+            columnar=True,
+        )
+
+    def insert_border_events(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        self.client.execute(
+            f"INSERT INTO person_borders_v2 ({', '.join(BORDER_COLUMNS)}) VALUES",
+            _columnar(rows, BORDER_COLUMNS),
+            columnar=True,
+        )
+
+    # --- offline re-embedding: har bir person'ning oxirgi snapshot'i (polygons'siz), sahifalab ---
+    def page_latest_snapshots(
+        self,
+        *,
+        after_person_id: Optional[Any],
+        limit: int,
+        statuses: Optional[List[int]] = None,
+    ) -> List[Dict[str, Any]]:
+        having = ["face_url IS NOT NULL", "face_url != ''"]
+        params: Dict[str, Any] = {"limit": int(limit)}
+        if statuses:
+            having.append("embedding_status IN %(statuses)s")
+            params["statuses"] = tuple(int(s) for s in statuses)
+        where = ""
+        if after_person_id is not None:
+            where = "WHERE person_id > toUUID(%(after)s)"
+            params["after"] = str(after_person_id)
+
+        rows = self.client.execute(
+            f"""
+            SELECT
+                person_id,
+                argMax(citizen, version)          AS citizen,
+                argMax(citizen_sgb, version)      AS citizen_sgb,
+                argMax(dtb, version)              AS dtb,
+                argMax(passport, version)         AS passport,
+                argMax(passport_expired, version) AS passport_expired,
+                argMax(sex, version)              AS sex,
+                argMax(full_name, version)        AS full_name,
+                argMax(face_url, version)         AS face_url,
+                argMax(embedding_status, version) AS embedding_status
+            FROM person_documents_v2
+            {where}
+            GROUP BY person_id
+            HAVING {" AND ".join(having)}
+            ORDER BY person_id
+            LIMIT %(limit)s
+            """,
+            params,
+        )
+        keys = (
+            "person_id", "citizen", "citizen_sgb", "dtb", "passport", "passport_expired",
+            "sex", "full_name", "face_url", "embedding_status",
+        )
+        return [dict(zip(keys, r)) for r in rows]
+
+    # --- per-person embedding store: slot 0 = centroid, 1..K = template'lar ---
+    def load_person_templates(self, person_id: str, model_version: str) -> List[Dict[str, Any]]:
+        rows = self.client.execute(
+            """
+            SELECT slot, document_id, face_url, polygons, det_score, blur, face_size, faces_found, quality_scale
+            FROM person_embeddings FINAL
+            WHERE person_id = %(pid)s
+              AND model_version = %(model_version)s
+              AND slot > 0
+              AND is_active = 1
+            ORDER BY slot
+            """,
+            {"pid": person_id, "model_version": model_version},
+        )
+        return [
+            {
+                "slot": int(r[0]),
+                "document_id": r[1],
+                "face_url": r[2],
+                "polygons": r[3],
+                "det_score": float(r[4] or 0.0),
+                "blur": float(r[5] or 0.0),
+                "face_size": int(r[6] or 0),
+                "faces_found": int(r[7] or 0),
+                "quality_scale": int(r[8] or 0),
+            }
+            for r in rows
+        ]
+
+    def upsert_person_embeddings(self, rows: List[Dict[str, Any]]) -> None:
+        self.client.execute(
+            """
+            INSERT INTO person_embeddings
+            (person_id, slot, document_id, face_url, polygons, polygons_bin, cluster_id,
+             det_score, blur, face_size, faces_found, quality_scale, is_active, model_version)
+            VALUES
+            """,
+            rows,
+        )
+
+    # --- idempotency: provider retry'i allaqachon yozilganmi ---
+    def find_border_event_person(
+        self,
+        sgb_person_id: int,
+        border_id: int,
+        reg_date: Any,
+        action: int,
+    ) -> Optional[Any]:
+        rows = self.client.execute(
+            """
+            SELECT person_id
+            FROM person_borders_v2
+            WHERE person_id IN (
+                SELECT argMax(person_id, version)
+                FROM person_sgb_map_v2
+                WHERE sgb_person_id = %(sgb)s
+            )
+              AND border_id = %(border_id)s
+              AND reg_date = %(reg_date)s
+              AND action = %(action)s
+            LIMIT 1
+            """,
+            {"sgb": sgb_person_id, "border_id": border_id, "reg_date": reg_date, "action": action},
+        )
+        return rows[0][0] if rows else None
+
+    def find_border_event_persons(self, events: List[Tuple[int, int, Any, int]]) -> List[Optional[Any]]:
+        """
+        find_border_event_person bir nechta hodisa uchun bitta so'rovda (bulk partiya).
+        events: (sgb_person_id, border_id, reg_date, action) -> har biri uchun person_id yoki None (tartib saqlanadi).
+        """
+        if not events:
+            return []
+        sgbs = tuple(sorted({int(e[0]) for e in events}))
+        rows = self.client.execute(
+            """
+            SELECT m.sgb_person_id, b.border_id, b.reg_date, b.action, b.person_id
+            FROM person_borders_v2 AS b
+            INNER JOIN (
+                SELECT sgb_person_id, argMax(person_id, version) AS person_id
+                FROM person_sgb_map_v2
+                WHERE sgb_person_id IN %(sgbs)s
+                GROUP BY sgb_person_id
+            ) AS m ON b.person_id = m.person_id
+            WHERE b.person_id IN (
+                SELECT argMax(person_id, version)
+                FROM person_sgb_map_v2
+                WHERE sgb_person_id IN %(sgbs)s
+                GROUP BY sgb_person_id
+            )
+              AND (b.border_id, b.reg_date, b.action) IN %(events)s
+            LIMIT 1 BY m.sgb_person_id, b.border_id, b.reg_date, b.action
+            """,
+            {
+                "sgbs": sgbs,
+                "events": tuple((int(border_id), reg_date, int(action)) for _, border_id, reg_date, action in events),
+            },
+        )
+        found = {
+            (int(sgb), int(border_id), _event_time(reg_date), int(action)): person_id
+            for sgb, border_id, reg_date, action, person_id in rows
+        }
+        return [
+            found.get((int(sgb), int(border_id), _event_time(reg_date), int(action)))
+            for sgb, border_id, reg_date, action in events
+        ]
+
     # --- borders ---
     def insert_border_event(self, row: Dict[str, Any]) -> None:
         self.client.execute(
@@ -0,0 +1,149 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class IvfRepo:
+    def __init__(self, client):
+        self.client = client
+
+    # --- centroids ---
+    def centroid_versions(self) -> Tuple[Optional[int], Optional[int]]:
+        """
+        (faol, pending): faol = ivf_active'dagi oxirgi versiya; pending = undan yangi, hali faollashtirilmagan versiya.
+        Versiyalar 1 dan boshlanadi (bo'sh jadvalda max() = 0).
+        """
+        rows = self.client.execute(
+            """
+            SELECT
+                (SELECT max(version) FROM ivf_active)    AS active,
+                (SELECT max(version) FROM ivf_centroids) AS latest
+            """
+        )
+        active, latest = (int(v or 0) for v in rows[0]) if rows else (0, 0)
+        return active or None, latest if latest > active else None
+
+    def load_centroids(self, version: int) -> Optional[Tuple[List[int], List[List[float]]]]:
+        rows = self.client.execute(
+            """
+            SELECT groupArray(cluster_id) AS cluster_ids, groupArray(centroid) AS centroids
+            FROM
+            (
+                SELECT cluster_id, centroid
+                FROM ivf_centroids
+                WHERE version = %(version)s
+                ORDER BY cluster_id
+            )
+            """,
+            {"version": int(version)},
+        )
+        if not rows or not rows[0][1]:
+            return None
+        return [int(c) for c in rows[0][0]], rows[0][1]
+
+    def next_centroid_version(self) -> int:
+        rows = self.client.execute("SELECT max(version) FROM ivf_centroids")
+        return int(rows[0][0] or 0) + 1 if rows else 1
+
+    def insert_centroids(self, version: int, cluster_ids: List[int], centroids: List[List[float]]) -> None:
+        # cluster_id'lar versiya bo'yicha kesishmaydi (0 = tayinlanmagan), qarang: ivf.cluster_ids_for
+        self.client.execute(
+            "INSERT INTO ivf_centroids (version, cluster_id, centroid) VALUES",
+            [{"version": version, "cluster_id": int(cid), "centroid": c} for cid, c in zip(cluster_ids, centroids)],
+        )
+
+    def activate_centroids(self, version: int) -> None:
+        self.client.execute("INSERT INTO ivf_active (version) VALUES", [{"version": int(version)}])
+
+    # --- training sample / backfill ---
+    def sample_embeddings(self, limit: int, model_version: str) -> List[List[float]]:
+        rows = self.client.execute(
+            """
+            SELECT polygons
+            FROM person_documents_v2
+            WHERE has_embedding = 1
+              AND model_version = %(model_version)s
+            ORDER BY rand()
+            LIMIT %(limit)s
+            """,
+            {"limit": int(limit), "model_version": model_version},
+        )
+        return [r[0] for r in rows]
+
+    def iter_embedding_rows(self, model_version: str, *, batch_size: int = 10000) -> Iterator[Tuple[Any, List[float]]]:
+        return self.client.execute_iter(
+            """
+            SELECT id, polygons
+            FROM person_documents_v2
+            WHERE has_embedding = 1
+              AND model_version = %(model_version)s
+            """,
+            {"model_version": model_version},
+            settings={"max_block_size": int(batch_size)},
+        )
+
+    def iter_person_embedding_rows(
+        self,
+        model_version: str,
+        *,
+        batch_size: int = 10000,
+    ) -> Iterator[Tuple[Any, int, Any, List[float]]]:
+        """
+        person_embeddings qatorlari o'z vektori bilan: (person_id, slot, version, polygons).
+        Slot 0 — centroid, uning vektori hech bir snapshot'da yo'q (document_id bo'yicha klaster olib bo'lmaydi).
+        FINAL'siz: har bir qator (person_id, slot, version) kaliti bilan alohida tayinlanadi.
+        """
+        return self.client.execute_iter(
+            """
+            SELECT person_id, slot, version, polygons
+            FROM person_embeddings
+            WHERE model_version = %(model_version)s
+              AND is_active = 1
+            """,
+            {"model_version": model_version},
+            settings={"max_block_size": int(batch_size)},
+        )
+
+    def create_assignment_table(self, table: str) -> None:
+        self.client.execute(f"DROP TABLE IF EXISTS {table}")
+        self.client.execute(
+            f"CREATE TABLE {table} (id UUID, cluster_id UInt32) ENGINE = Join(ANY, LEFT, id)"
+        )
+
+    def create_embedding_assignment_table(self, table: str) -> None:
+        # version kalitda: tayinlashdan keyin ingest qayta yozgan qator (yangi vektor) mutation'da o'zgarmaydi
+        self.client.execute(f"DROP TABLE IF EXISTS {table}")
+        self.client.execute(
+            f"""
+            CREATE TABLE {table} (person_id UUID, slot UInt8, version DateTime64(3), cluster_id UInt32)
+            ENGINE = Join(ANY, LEFT, person_id, slot, version)
+            """
+        )
+
+    def insert_assignments(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        self.client.execute(f"INSERT INTO {table} (id, cluster_id) VALUES", rows)
+
+    def insert_embedding_assignments(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        self.client.execute(f"INSERT INTO {table} (person_id, slot, version, cluster_id) VALUES", rows)
+
+    def apply_assignments(self, table: str, embeddings_table: str, model_version: str) -> None:
+        self.client.execute(
+            f"""
+            ALTER TABLE person_documents_v2
+            UPDATE cluster_id = joinGet('{table}', 'cluster_id', id)
+            WHERE isNotNull(joinGetOrNull('{table}', 'cluster_id', id))
+            """
+        )
+        # search person_embeddings'ni o'qiydi; har bir qator o'z vektori bo'yicha tayinlangan
+        # (dual-write versiyalari boshqa vektor fazosida — ular UNASSIGNED bo'lib qoladi)
+        self.client.execute(
+            f"""
+            ALTER TABLE person_embeddings
+            UPDATE cluster_id = joinGet('{embeddings_table}', 'cluster_id', person_id, slot, version)
+            WHERE isNotNull(joinGetOrNull('{embeddings_table}', 'cluster_id', person_id, slot, version))
+              AND model_version = %(model_version)s
+            """,
+            {"model_version": model_version},
+        )
+
+    def drop_table(self, table: str) -> None:
+        self.client.execute(f"DROP TABLE IF EXISTS {table}")
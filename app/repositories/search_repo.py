@@ -1,5 +1,8 @@
 from __future__ import annotations
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+
+from app.config import SEARCH_COARSE_CANDIDATES
+from app.services.quantization import pack_sign_bits, HAMMING_SQL
 
 
 class SearchRepo:
@@ -19,31 +22,62 @@ class SearchRepo:
         dtb_from: Optional[str] = None,
         dtb_to: Optional[str] = None,
         max_distance: float = 0.75,
+        coarse_candidates: Optional[int] = None,
+        clusters: Optional[List[int]] = None,
+        model_version: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
-
-        where = [
-            "has_embedding = 1",
-            "cosineDistance(polygons, reference_vec) <= %(max_distance)s"
-        ]
+        """
+        person_embeddings centroidlari (slot 0) bo'yicha qidiruv — har bir person uchun bitta qator,
+        document snapshot'lar va template'lar soniga bog'liq emas.
+
+        coarse_candidates > 0 bo'lsa ikki bosqichli qidiruv:
+          1) polygons_bin (sign bits) bo'yicha Hamming scan -> coarse_candidates ta qator
+          2) faqat shu qatorlar uchun polygons bo'yicha exact cosineDistance
+        clusters berilsa — faqat shu IVF klasterlari o'qiladi.
+        person_embeddings ReplacingMergeTree: FINAL — har bir (person_id, slot, model_version) uchun faqat oxirgi
+        qator (almashtirilgan centroid / eski cluster_id qatorlari baholanmaydi).
+        model_version berilsa — faqat shu model embeddinglari (ref_vec ham shu model bilan olingan bo'lishi kerak).
+        citizen / dtb filtrlari person_documents_v2 dagi yengil ustunlar bo'yicha person_id to'plamiga aylanadi.
+        """
+        if coarse_candidates is None:
+            coarse_candidates = SEARCH_COARSE_CANDIDATES
+
+        filters = ["slot = 0", "is_active = 1"]
+        attr_filters = []
 
         params: Dict[str, Any] = {
             "ref": ref_vec,
             "max_distance": max_distance,
         }
 
+        if model_version is not None:
+            filters.append("model_version = %(model_version)s")
+            params["model_version"] = model_version
+
+        if clusters:
+            filters.append("cluster_id IN %(clusters)s")
+            params["clusters"] = tuple(int(c) for c in clusters)
+
         if citizen is not None:
-            where.append("citizen = %(citizen)s")
+            attr_filters.append("citizen = %(citizen)s")
             params["citizen"] = int(citizen)
 
         if dtb_from is not None:
-            where.append("dtb >= toDate32(%(dtb_from)s)")
+            attr_filters.append("dtb >= toDate32(%(dtb_from)s)")
             params["dtb_from"] = dtb_from
 
         if dtb_to is not None:
-            where.append("dtb <= toDate32(%(dtb_to)s)")
+            attr_filters.append("dtb <= toDate32(%(dtb_to)s)")
             params["dtb_to"] = dtb_to
 
-        where_sql = " AND ".join(where)
+        if attr_filters:
+            filters.append(
+                "person_id IN (SELECT person_id FROM person_documents_v2 WHERE "
+                + " AND ".join(attr_filters)
+                + ")"
+            )
+
+        filter_sql = " AND ".join(filters)
 
         settings_sql = ""
         if ef_search is not None:
@@ -51,13 +85,30 @@ class SearchRepo:
                 f" SETTINGS hnsw_candidate_list_size_for_search = {int(ef_search)}"
             )
 
+        with_sql = "%(ref)s AS reference_vec"
+        if coarse_candidates and coarse_candidates > 0:
+            params["ref_bin"] = pack_sign_bits(ref_vec)
+            with_sql += ", %(ref_bin)s AS reference_bin"
+            # tashqi scan ham o'sha filtrlar bilan: kalit bo'yicha eski (birlashmagan) qatorlar qaytib kirmaydi
+            where_sql = f"""{filter_sql}
+            AND (person_id, slot, model_version) IN (
+                SELECT person_id, slot, model_version
+                FROM person_embeddings FINAL
+                WHERE {filter_sql} AND length(polygons_bin) > 0
+                ORDER BY {HAMMING_SQL} ASC
+                LIMIT {int(coarse_candidates)}
+            )
+            AND cosineDistance(polygons, reference_vec) <= %(max_distance)s"""
+        else:
+            where_sql = f"{filter_sql} AND cosineDistance(polygons, reference_vec) <= %(max_distance)s"
+
         rows = self.client.execute(
             f"""
-            WITH %(ref)s AS reference_vec
+            WITH {with_sql}
             SELECT
                 person_id,
                 cosineDistance(polygons, reference_vec) AS distance
-            FROM person_documents_v2
+            FROM person_embeddings FINAL
             WHERE {where_sql}
             ORDER BY distance ASC
             LIMIT 1 BY person_id
@@ -75,6 +126,70 @@ class SearchRepo:
             for r in rows
         ]
 
+    # ==========================================================
+    # Templates (slot 1..K) — centroid kandidatlarini rerank qilish uchun
+    # ==========================================================
+    def load_templates(self, person_ids: List[Any], model_version: str) -> Dict[Any, List[List[float]]]:
+        if not person_ids:
+            return {}
+
+        rows = self.client.execute(
+            """
+            SELECT person_id, polygons
+            FROM person_embeddings FINAL
+            WHERE person_id IN %(ids)s
+              AND model_version = %(model_version)s
+              AND slot > 0
+              AND is_active = 1
+            """,
+            {"ids": tuple(person_ids), "model_version": model_version},
+        )
+
+        out: Dict[Any, List[List[float]]] = {}
+        for pid, polygons in rows:
+            out.setdefault(pid, []).append(polygons)
+        return out
+
+    # ==========================================================
+    # Best (latest) embedding per person — in-process index hydrate
+    # ==========================================================
+    def iter_best_embeddings(
+        self,
+        since: Any = None,
+        *,
+        batch_size: int = 10000,
+        model_version: Optional[str] = None,
+    ) -> Iterator[Tuple[Any, List[float], Any, Optional[int], Any]]:
+        """
+        (person_id, polygons, version, citizen, dtb) oqimi.
+        since berilsa — faqat version > since bo'lgan personlar (delta).
+        model_version berilsa — faqat shu model snapshot'lari.
+        """
+        where = ["has_embedding = 1"]
+        params: Dict[str, Any] = {}
+        if since is not None:
+            where.append("version > %(since)s")
+            params["since"] = since
+        if model_version is not None:
+            where.append("model_version = %(model_version)s")
+            params["model_version"] = model_version
+
+        return self.client.execute_iter(
+            f"""
+            SELECT
+                person_id,
+                argMax(polygons, version) AS polygons,
+                max(version)              AS version,
+                argMax(citizen, version)  AS citizen,
+                argMax(dtb, version)      AS dtb
+            FROM person_documents_v2
+            WHERE {" AND ".join(where)}
+            GROUP BY person_id
+            """,
+            params,
+            settings={"max_block_size": int(batch_size)},
+        )
+
     # ==========================================================
     # Load current profile snapshot
     # ==========================================================
@@ -0,0 +1,37 @@
+# app/schemas/admin.py
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class AnnTuneIn(BaseModel):
+    ef_search: Optional[int] = Field(None, ge=1, le=4096, description="HNSW search candidate list size")
+    m: Optional[int] = Field(None, ge=4, le=128, description="HNSW M (graph is rebuilt in background)")
+    ef_construction: Optional[int] = Field(None, ge=8, le=2048, description="HNSW ef_construction (graph is rebuilt)")
+
+    class Config:
+        extra = "ignore"
+
+
+class ReadCacheIn(BaseModel):
+    bypass: Optional[bool] = Field(None, description="true -> search reads go straight to ClickHouse (audit)")
+    clear: bool = Field(False, description="Drop all cached entries")
+
+    class Config:
+        extra = "ignore"
+
+
+class SgbMapIn(BaseModel):
+    sgb_person_id: Optional[int] = Field(None, description="Drop one cached mapping")
+    clear: bool = Field(False, description="Drop all cached mappings")
+
+    class Config:
+        extra = "ignore"
+
+
+class ModelReloadIn(BaseModel):
+    version: Optional[str] = Field(None, description="Loaded model version to reload (default: primary)")
+    det_size: Optional[int] = Field(None, ge=160, le=1920, description="prepare() det_size (square)")
+    det_thresh: Optional[float] = Field(None, gt=0, lt=1, description="prepare() det_thresh")
+
+    class Config:
+        extra = "ignore"
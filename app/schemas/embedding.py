@@ -0,0 +1,29 @@
+# app/schemas/embedding.py
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.config import QUALITY_MIN_BLUR
+
+
+class EmbedStrictIn(BaseModel):
+    photos: List[Optional[str]] = Field(..., description="base64 photos (null -> null result)")
+    version: Optional[str] = Field(None, description="Model version (default: primary)")
+    min_det_score: float = 0.60
+    min_face_size: int = 80
+    min_blur: float = QUALITY_MIN_BLUR
+
+    class Config:
+        extra = "ignore"
+
+
+class EmbedDetectIn(BaseModel):
+    image: str = Field(..., description="base64 image")
+    version: Optional[str] = Field(None, description="Model version (default: primary)")
+    extra_versions: List[str] = Field(default_factory=list, description="Secondary versions to embed detected faces with")
+    min_det_score: float = 0.60
+    min_face_size: int = 80
+    min_blur: float = QUALITY_MIN_BLUR
+    max_faces: int = Field(10, ge=1, le=100)
+
+    class Config:
+        extra = "ignore"
@@ -10,6 +10,9 @@ class SearchByPhotoIn(BaseModel):
     date_of_birth_from: Optional[date] = None
     date_of_birth_to: Optional[date] = None
 
+    # IVF: nechta eng yaqin klaster o'qiladi (None -> SEARCH_NPROBE)
+    nprobe: Optional[int] = Field(None, ge=1, le=4096)
+
     # ----------------
     # FIELD VALIDATION
     # ----------------
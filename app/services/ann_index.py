@@ -0,0 +1,313 @@
+from __future__ import annotations
+import asyncio
+import fcntl
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+EMB_SIZE = 512
+
+logger = logging.getLogger(__name__)
+
+
+class PersonAnnIndex:
+    """
+    Har bir person uchun bitta (eng yaxshi) embedding bo'yicha in-process HNSW index.
+
+    - person_id <-> hnswlib label (uint64) mapping ichkarida saqlanadi
+    - snapshot: <path>/index.bin + <path>/meta.pkl
+    - watermark: oxirgi ko'rilgan person_documents_v2.version (delta query uchun)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 128,
+        initial_capacity: int = 100_000,
+    ):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed")
+
+        self.path = path
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+        self._lock = threading.RLock()
+        self._index = self._new_index(initial_capacity, m, ef_construction, ef_search)
+        self._labels: Dict[str, int] = {}
+        self._person_ids: List[str] = []
+        self.watermark: Any = None
+        self._rebuild_touched: Optional[set] = None
+        self.ready = False
+        self.dirty = False
+
+    # ------------------------------------------------------
+    # internals
+    # ------------------------------------------------------
+    @staticmethod
+    def _new_index(capacity: int, m: int, ef_construction: int, ef_search: int):
+        index = hnswlib.Index(space="cosine", dim=EMB_SIZE)
+        index.init_index(max_elements=max(capacity, 1), M=m, ef_construction=ef_construction)
+        index.set_ef(ef_search)
+        return index
+
+    def _ensure_capacity(self, extra: int) -> None:
+        need = self._index.get_current_count() + extra
+        cap = self._index.get_max_elements()
+        if need > cap:
+            self._index.resize_index(max(need, cap * 2))
+
+    # ------------------------------------------------------
+    # write
+    # ------------------------------------------------------
+    def upsert_many(self, person_ids: List[str], vectors: np.ndarray) -> None:
+        if not person_ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(person_ids), EMB_SIZE)
+
+        with self._lock:
+            labels = []
+            new_count = sum(1 for pid in person_ids if pid not in self._labels)
+            self._ensure_capacity(new_count)
+            for pid in person_ids:
+                label = self._labels.get(pid)
+                if label is None:
+                    label = len(self._person_ids)
+                    self._labels[pid] = label
+                    self._person_ids.append(pid)
+                labels.append(label)
+
+            self._index.add_items(vectors, np.asarray(labels, dtype=np.uint64))
+            if self._rebuild_touched is not None:
+                self._rebuild_touched.update(labels)
+            self.dirty = True
+
+    def upsert(self, person_id: str, vector: List[float]) -> None:
+        self.upsert_many([str(person_id)], np.asarray([vector], dtype=np.float32))
+
+    # ------------------------------------------------------
+    # read
+    # ------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._person_ids)
+
+    def search(
+        self,
+        ref_vec: List[float],
+        *,
+        top_k: int = 10,
+        max_distance: float = 0.75,
+        ef_search: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        q = np.asarray(ref_vec, dtype=np.float32).reshape(1, EMB_SIZE)
+
+        with self._lock:
+            count = len(self._person_ids)
+            if count == 0:
+                return []
+            k = min(int(top_k), count)
+
+            if ef_search is not None and ef_search != self.ef_search:
+                self._index.set_ef(max(int(ef_search), k))
+                try:
+                    labels, dists = self._index.knn_query(q, k=k)
+                finally:
+                    self._index.set_ef(self.ef_search)
+            else:
+                labels, dists = self._index.knn_query(q, k=k)
+
+            out = []
+            for label, dist in zip(labels[0], dists[0]):
+                if float(dist) > max_distance:
+                    continue
+                # ClickHouse yo'li bilan bir xil: person_id -> UUID (load_profiles kalitlari)
+                out.append({"person_id": UUID(self._person_ids[int(label)]), "distance": float(dist)})
+            return out
+
+    # ------------------------------------------------------
+    # runtime tuning
+    # ------------------------------------------------------
+    def set_ef(self, ef_search: int) -> None:
+        with self._lock:
+            self.ef_search = int(ef_search)
+            self._index.set_ef(self.ef_search)
+
+    def rebuild(self, *, m: Optional[int] = None, ef_construction: Optional[int] = None) -> None:
+        """M / ef_construction o'zgarsa — mavjud vektorlardan yangi graph quriladi, keyin swap."""
+        m = int(m or self.m)
+        ef_construction = int(ef_construction or self.ef_construction)
+
+        with self._lock:
+            self._rebuild_touched = set()
+            person_ids = list(self._person_ids)
+            vectors = (
+                np.asarray(self._index.get_items(list(range(len(person_ids)))), dtype=np.float32)
+                if person_ids else np.empty((0, EMB_SIZE), dtype=np.float32)
+            )
+
+        # og'ir qism lock'siz; bu orada kelgan upsert'lar pastda qayta qo'shiladi
+        started = time.perf_counter()
+        index = self._new_index(len(person_ids) + 1024, m, ef_construction, self.ef_search)
+        if person_ids:
+            index.add_items(vectors, np.arange(len(person_ids), dtype=np.uint64))
+
+        with self._lock:
+            # rebuild paytida qo'shilgan/yangilangan label'lar eski index'dan ko'chiriladi
+            touched = sorted(self._rebuild_touched)
+            self._rebuild_touched = None
+            if touched:
+                extra = np.asarray(self._index.get_items(touched), dtype=np.float32)
+                index.resize_index(len(self._person_ids) + 1024)
+                index.add_items(extra, np.asarray(touched, dtype=np.uint64))
+            self._index = index
+            self.m = m
+            self.ef_construction = ef_construction
+            self.dirty = True
+
+        logger.info("ANN index rebuilt: %d items, M=%d in %.1fs", len(self), m, time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "count": len(self),
+            "capacity": self._index.get_max_elements(),
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "watermark": str(self.watermark) if self.watermark is not None else None,
+        }
+
+    # ------------------------------------------------------
+    # snapshot persistence
+    # ------------------------------------------------------
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        index_path = os.path.join(self.path, "index.bin")
+        meta_path = os.path.join(self.path, "meta.pkl")
+
+        with self._lock:
+            self._index.save_index(index_path + ".tmp")
+            meta = {
+                "person_ids": list(self._person_ids),
+                "watermark": self.watermark,
+                "m": self.m,
+                "ef_construction": self.ef_construction,
+            }
+            self.dirty = False
+
+        with open(meta_path + ".tmp", "wb") as fh:
+            pickle.dump(meta, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(index_path + ".tmp", index_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def load(self) -> bool:
+        index_path = os.path.join(self.path, "index.bin")
+        meta_path = os.path.join(self.path, "meta.pkl")
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            return False
+
+        with open(meta_path, "rb") as fh:
+            meta = pickle.load(fh)
+
+        index = hnswlib.Index(space="cosine", dim=EMB_SIZE)
+        index.load_index(index_path, max_elements=len(meta["person_ids"]) + 1024)
+        if index.get_current_count() != len(meta["person_ids"]):
+            logger.warning("ANN snapshot is inconsistent, ignoring it")
+            return False
+        index.set_ef(self.ef_search)
+
+        with self._lock:
+            self._index = index
+            self._person_ids = list(meta["person_ids"])
+            self._labels = {pid: i for i, pid in enumerate(self._person_ids)}
+            self.watermark = meta["watermark"]
+            self.m = meta.get("m", self.m)
+            self.ef_construction = meta.get("ef_construction", self.ef_construction)
+        return True
+
+    # ------------------------------------------------------
+    # hydrate: snapshot + delta from ClickHouse
+    # ------------------------------------------------------
+    def refresh_from_repo(self, repo, *, batch_size: int = 10000) -> int:
+        """watermark'dan keyingi embeddinglarni yuklaydi. Qo'shilganlar sonini qaytaradi."""
+        added = 0
+        ids: List[str] = []
+        vecs: List[List[float]] = []
+        max_version = None
+
+        for person_id, polygons, version, *_ in repo.iter_best_embeddings(self.watermark, batch_size=batch_size):
+            if len(polygons) != EMB_SIZE:
+                continue
+            ids.append(str(person_id))
+            vecs.append(polygons)
+            if max_version is None or version > max_version:
+                max_version = version
+            if len(ids) >= batch_size:
+                self.upsert_many(ids, np.asarray(vecs, dtype=np.float32))
+                added += len(ids)
+                ids, vecs = [], []
+
+        if ids:
+            self.upsert_many(ids, np.asarray(vecs, dtype=np.float32))
+            added += len(ids)
+
+        # watermark faqat to'liq delta yuklangandan keyin suriladi
+        if max_version is not None:
+            with self._lock:
+                if self.watermark is None or max_version > self.watermark:
+                    self.watermark = max_version
+        return added
+
+    def hydrate(self, repo) -> None:
+        started = time.perf_counter()
+        loaded = self.load()
+        delta = self.refresh_from_repo(repo)
+        self.ready = True
+        logger.info(
+            "ANN index hydrated: snapshot=%s delta=%d total=%d in %.1fs",
+            loaded, delta, len(self), time.perf_counter() - started,
+        )
+        if delta:
+            _save_if_leader(self)
+
+
+# ----------------------------------------------------------
+# Background refresh (delta) + snapshot (faqat bitta worker yozadi)
+# ----------------------------------------------------------
+def _save_if_leader(index: PersonAnnIndex) -> bool:
+    os.makedirs(index.path, exist_ok=True)
+    with open(os.path.join(index.path, ".snapshot.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        index.save()
+        return True
+
+
+async def run_refresh_loop(index: PersonAnnIndex, repo, *, refresh_sec: float, snapshot_sec: float) -> None:
+    last_snapshot = time.monotonic()
+    while True:
+        await asyncio.sleep(refresh_sec)
+        try:
+            await asyncio.to_thread(index.refresh_from_repo, repo)
+            if index.dirty and time.monotonic() - last_snapshot >= snapshot_sec:
+                await asyncio.to_thread(_save_if_leader, index)
+                last_snapshot = time.monotonic()
+        except Exception as e:
+            logger.warning("ANN index refresh failed: %s", e)
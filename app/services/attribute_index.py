@@ -0,0 +1,119 @@
+from __future__ import annotations
+from datetime import date
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# dtb -> int32 (1970-01-01 dan beri kunlar); NULL -> DTB_NONE (hech bir diapazonga tushmaydi)
+DTB_NONE = np.iinfo(np.int32).min
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# citizen posting: zich bo'lsa packed bitmap, siyrak bo'lsa sorted row-id (int32) ro'yxati
+_BITMAP_MIN_DENSITY = 1.0 / 32
+
+
+def dtb_to_days(value: Any) -> int:
+    if value is None or value == "":
+        return int(DTB_NONE)
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return int(value.toordinal() - _EPOCH_ORDINAL)
+
+
+class AttributeIndex:
+    """
+    Flat store qatorlari (row id) bo'yicha SearchFilters pre-filter:
+      - citizen -> bitmap yoki sorted row ids
+      - dtb     -> qiymat bo'yicha saralangan (dtb, row) juftlari; diapazon = searchsorted
+    """
+
+    def __init__(self, citizen: np.ndarray, dtb: np.ndarray):
+        n = len(citizen)
+        self.rows = n
+
+        self._citizen: Dict[int, np.ndarray] = {}
+        self._citizen_is_bitmap: Dict[int, bool] = {}
+        if n:
+            order = np.argsort(citizen, kind="stable")
+            values, starts = np.unique(citizen[order], return_index=True)
+            bounds = list(starts[1:]) + [n]
+            for value, start, stop in zip(values, starts, bounds):
+                row_ids = np.sort(order[start:stop]).astype(np.int32)
+                if len(row_ids) >= n * _BITMAP_MIN_DENSITY:
+                    mask = np.zeros(n, dtype=bool)
+                    mask[row_ids] = True
+                    self._citizen[int(value)] = np.packbits(mask)
+                    self._citizen_is_bitmap[int(value)] = True
+                else:
+                    self._citizen[int(value)] = row_ids
+                    self._citizen_is_bitmap[int(value)] = False
+
+        dtb_order = np.argsort(dtb, kind="stable")
+        self._dtb_sorted = np.asarray(dtb)[dtb_order].astype(np.int32)
+        self._dtb_rows = dtb_order.astype(np.int32)
+
+    def nbytes(self) -> int:
+        return int(
+            sum(v.nbytes for v in self._citizen.values())
+            + self._dtb_sorted.nbytes
+            + self._dtb_rows.nbytes
+        )
+
+    def _citizen_rows(self, citizen: int) -> np.ndarray:
+        posting = self._citizen.get(int(citizen))
+        if posting is None:
+            return np.empty(0, dtype=np.int32)
+        if self._citizen_is_bitmap[int(citizen)]:
+            return np.flatnonzero(np.unpackbits(posting, count=self.rows)).astype(np.int32)
+        return posting
+
+    def _dtb_rows_between(self, dtb_from: Optional[int], dtb_to: Optional[int]) -> np.ndarray:
+        lo = 0 if dtb_from is None else np.searchsorted(self._dtb_sorted, dtb_from, side="left")
+        hi = len(self._dtb_sorted) if dtb_to is None else np.searchsorted(self._dtb_sorted, dtb_to, side="right")
+        # DTB_NONE eng boshida turadi; dtb_from berilmasa ham NULL qatorlar chiqarib tashlanadi
+        lo = max(lo, int(np.searchsorted(self._dtb_sorted, DTB_NONE, side="right")))
+        return np.sort(self._dtb_rows[lo:hi])
+
+    def candidates(
+        self,
+        *,
+        citizen: Optional[int] = None,
+        dtb_from: Optional[Any] = None,
+        dtb_to: Optional[Any] = None,
+    ) -> Optional[np.ndarray]:
+        """Filtr yo'q bo'lsa None; aks holda mos keladigan row id'lar (sorted int32)."""
+        has_dtb = dtb_from is not None or dtb_to is not None
+        if citizen is None and not has_dtb:
+            return None
+
+        rows: Optional[np.ndarray] = None
+        if citizen is not None:
+            rows = self._citizen_rows(citizen)
+        if has_dtb:
+            dtb_rows = self._dtb_rows_between(
+                dtb_to_days(dtb_from) if dtb_from is not None else None,
+                dtb_to_days(dtb_to) if dtb_to is not None else None,
+            )
+            rows = dtb_rows if rows is None else np.intersect1d(rows, dtb_rows, assume_unique=True)
+        return rows
+
+
+def match_attributes(
+    citizen_col: np.ndarray,
+    dtb_col: np.ndarray,
+    *,
+    citizen: Optional[int] = None,
+    dtb_from: Optional[Any] = None,
+    dtb_to: Optional[Any] = None,
+) -> np.ndarray:
+    """Kichik segmentlar (tail) uchun to'g'ridan-to'g'ri mask."""
+    mask = np.ones(len(citizen_col), dtype=bool)
+    if citizen is not None:
+        mask &= citizen_col == int(citizen)
+    if dtb_from is not None or dtb_to is not None:
+        mask &= dtb_col != DTB_NONE
+    if dtb_from is not None:
+        mask &= dtb_col >= dtb_to_days(dtb_from)
+    if dtb_to is not None:
+        mask &= dtb_col <= dtb_to_days(dtb_to)
+    return mask
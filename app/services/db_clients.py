@@ -0,0 +1,75 @@
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# shared client'dan ko'chiriladigan client sozlamalari (qolganlari clickhouse_driver default'lari)
+_CLIENT_SETTINGS = ("use_numpy", "strings_as_bytes", "strings_encoding")
+
+
+def dedicated_client(shared: Any = None):
+    """
+    Fon ishlari (asyncio.to_thread ichidagi refresh / warm loop'lari) uchun alohida ClickHouse ulanishi.
+
+    app.services.database.client bitta ulanish va thread-safe emas — request handler'lar uni event loop'da
+    ishlatadi, thread'dagi so'rov (ayniqsa ochiq execute_iter) ular bilan to'qnashadi. Yangi client shared
+    client'ning ulanish sozlamalari (host'lar, database, user, timeout'lar, settings) bilan quriladi.
+    """
+    from clickhouse_driver import Client
+
+    if shared is None:
+        from app.services.database import client as shared
+
+    conn = shared.connection
+    hosts = list(getattr(conn, "hosts", None) or [(conn.host, conn.port)])
+    (host, port), alt_hosts = hosts[0], hosts[1:]
+
+    settings: Dict[str, Any] = dict(getattr(shared, "settings", None) or {})
+    client_settings = getattr(shared, "client_settings", None) or {}
+    for key in _CLIENT_SETTINGS:
+        if key in client_settings:
+            settings[key] = client_settings[key]
+
+    kwargs: Dict[str, Any] = {
+        "host": host,
+        "port": port,
+        "database": conn.database,
+        "user": conn.user,
+        "password": conn.password,
+        "connect_timeout": conn.connect_timeout,
+        "send_receive_timeout": conn.send_receive_timeout,
+        "secure": getattr(conn, "secure_socket", False),
+        "verify": getattr(conn, "verify_cert", True),
+        "settings": settings,
+    }
+    if alt_hosts:
+        kwargs["alt_hosts"] = ",".join(f"{h}:{p}" for h, p in alt_hosts)
+    return Client(**kwargs)
+
+
+class DbExecutor:
+    """
+    Request path'dagi sync ClickHouse lookup'lari event loop'dan tashqarida: chegaralangan thread pool,
+    har bir thread'ning o'z dedicated_client'i (birinchi so'rovda ochiladi, keyin qayta ishlatiladi).
+    """
+
+    def __init__(self, threads: int, shared: Any = None):
+        self.threads = max(1, int(threads))
+        self._shared = shared
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="db-lookup")
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = dedicated_client(self._shared)
+        return client
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """fn(client, *args) pool thread'ida."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, lambda: fn(self._client(), *args))
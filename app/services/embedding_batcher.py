@@ -0,0 +1,128 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.face_pipeline import get_face_embeddings_strict_batch
+from app.services.image_service import decode_base64, decode_cv2
+from app.services.inference_gate import InferenceGate
+
+logger = logging.getLogger(__name__)
+
+# (version, lane, min_det_score, min_face_size, min_blur) — bitta batch'ga faqat bir xil parametrli so'rovlar
+BatchKey = Tuple[Optional[str], str, float, int, float]
+
+
+def strict_batch(face_app, photos: List[Optional[str]], gates: Dict[str, Any]) -> List[Tuple[bool, Any]]:
+    """Sync (gate executor'ida): decode + strict batch. -> (failed, FaceEmbeddingResult | None) har bir rasm uchun."""
+    images: List[Any] = [None] * len(photos)
+    failed = [False] * len(photos)
+    for i, photo_b64 in enumerate(photos):
+        if not photo_b64:
+            continue
+        try:
+            images[i] = decode_cv2(decode_base64(photo_b64))
+        except Exception:
+            failed[i] = True
+    try:
+        results = get_face_embeddings_strict_batch(images, face_app, **gates)
+    except Exception as e:
+        # batch yiqilsa — har bir rasm alohida (xato faqat o'sha rasmga tegadi)
+        logger.warning("Strict batch of %d failed, retrying one by one: %s", len(images), e)
+        results = []
+        for i, image in enumerate(images):
+            try:
+                results.append(get_face_embeddings_strict_batch([image], face_app, **gates)[0])
+            except Exception:
+                failed[i] = True
+                results.append(None)
+    return [(failed[i], None if failed[i] else res) for i, res in enumerate(results)]
+
+
+class _Pending:
+    def __init__(self):
+        self.items: List[Tuple[List[Optional[str]], asyncio.Future]] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class StrictBatcher:
+    """
+    Embedding service: turli so'rovlardagi (API node'lar, bulk ingest guruhlari) rasmlarni bitta
+    get_face_embeddings_strict_batch chaqiruviga yig'adi — recognition bitta get_feat batch'ida.
+    Birinchi so'rovdan keyin wait_ms kutiladi yoki max_batch ta rasm yig'ilganda darhol yuboriladi.
+    run_batch(version, photos, gates) — sync, gate executor'ida.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Optional[str], List[Optional[str]], Dict[str, Any]], List[Any]],
+        gate: InferenceGate,
+        *,
+        max_batch: int,
+        wait_ms: float,
+    ):
+        self.run_batch = run_batch
+        self.gate = gate
+        self.max_batch = max(1, int(max_batch))
+        self.wait_sec = max(0.0, wait_ms) / 1000.0
+        self._pending: Dict[BatchKey, _Pending] = {}
+        self.batches = 0
+        self.photos = 0
+
+    async def submit(self, photos: List[Optional[str]], key: BatchKey) -> List[Any]:
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending()
+            pending.timer = asyncio.get_running_loop().call_later(self.wait_sec, self._flush, key)
+        pending.items.append((photos, future))
+        pending.size += len(photos)
+        if pending.size >= self.max_batch:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: BatchKey) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+
+        version, lane, min_det_score, min_face_size, min_blur = key
+        photos = [p for items, _ in pending.items for p in items]
+        gates = {"min_det_score": min_det_score, "min_face_size": min_face_size, "min_blur": min_blur}
+        try:
+            task = self.gate.submit(self.run_batch, version, photos, gates, lane=lane)
+        except Exception as e:  # BusyError — batch'dagi barcha so'rovlar "busy" oladi
+            for _, future in pending.items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.photos += len(photos)
+        task.add_done_callback(lambda t: self._deliver(t, pending.items))
+
+    @staticmethod
+    def _deliver(task: asyncio.Future, items: List[Tuple[List[Optional[str]], asyncio.Future]]) -> None:
+        error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+        results = task.result() if error is None else None
+        offset = 0
+        for photos, future in items:
+            if future.done():  # so'rov bekor qilingan
+                offset += len(photos)
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[offset:offset + len(photos)])
+            offset += len(photos)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "wait_ms": round(self.wait_sec * 1000.0, 1),
+            "batches": self.batches,
+            "photos": self.photos,
+            "avg_batch": round(self.photos / self.batches, 2) if self.batches else 0.0,
+        }
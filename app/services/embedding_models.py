@@ -0,0 +1,87 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Barcha versiyalar bir xil o'lchamda bo'lishi shart: flat / ANN / IVF / sign-bits 512 ga qurilgan
+EMB_SIZE = 512
+
+
+def parse_versions(raw: str) -> List[str]:
+    return [v.strip() for v in (raw or "").split(",") if v.strip()]
+
+
+def parse_thresholds(raw: str) -> Dict[str, float]:
+    """'buffalo_l:0.75,antelopev2:0.70' -> {'buffalo_l': 0.75, 'antelopev2': 0.70}"""
+    out: Dict[str, float] = {}
+    for item in parse_versions(raw):
+        version, _, value = item.partition(":")
+        if value:
+            out[version.strip()] = float(value)
+    return out
+
+
+@dataclass
+class EmbeddingModels:
+    """
+    Embedding model versiyalari:
+      primary         -> asosiy face_app (snapshot polygons, flat / ANN / IVF)
+      write_versions  -> ingest'da qo'shimcha yoziladigan (dual-write) versiyalar
+      search_versions -> search'da so'raladigan versiyalar (primary doim birinchi)
+    max_distance: versiyaga xos "maybe" chegarasi; natijalar primary shkalasiga keltiriladi.
+    """
+
+    primary: str
+    face_apps: Dict[str, Any]
+    write_versions: List[str] = field(default_factory=list)
+    search_versions: List[str] = field(default_factory=list)
+    max_distance: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def primary_app(self) -> Any:
+        return self.face_apps.get(self.primary)
+
+    def secondary_write_apps(self) -> Dict[str, Any]:
+        return {v: self.face_apps[v] for v in self.write_versions if v != self.primary and v in self.face_apps}
+
+    def secondary_search_apps(self) -> Dict[str, Any]:
+        return {v: self.face_apps[v] for v in self.search_versions if v != self.primary and v in self.face_apps}
+
+    def threshold(self, version: str, default: float) -> float:
+        return self.max_distance.get(version, default)
+
+    def normalize_distance(self, version: str, distance: float, default: float) -> float:
+        """Versiya masofasini primary shkalasiga: chegara -> chegara."""
+        own = self.threshold(version, default)
+        base = self.threshold(self.primary, default)
+        return distance * base / own if own > 0 else distance
+
+
+def load_embedding_models(
+    primary_app: Any,
+    *,
+    primary: str,
+    write_versions: List[str],
+    search_versions: List[str],
+    max_distance: Dict[str, float],
+    create_face_app,
+) -> EmbeddingModels:
+    face_apps: Dict[str, Any] = {primary: primary_app}
+    for version in dict.fromkeys(write_versions + search_versions):
+        if version == primary:
+            continue
+        try:
+            face_apps[version] = create_face_app(version)
+            logger.info("Embedding model loaded: %s", version)
+        except Exception as e:
+            logger.error("Embedding model %s failed to load, skipping it: %s", version, e)
+
+    return EmbeddingModels(
+        primary=primary,
+        face_apps=face_apps,
+        write_versions=[v for v in write_versions if v in face_apps],
+        search_versions=[primary] + [v for v in search_versions if v in face_apps and v != primary],
+        max_distance=max_distance,
+    )
@@ -0,0 +1,254 @@
+from __future__ import annotations
+import base64
+import http.client
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from app.services.face_pipeline import FaceEmbeddingResult, FaceMeta
+from app.services.face_search_pipeline import FaceCandidate
+from app.services.inference_gate import BusyError
+
+logger = logging.getLogger(__name__)
+
+# strict natijasi: (failed, result) — failed: rasm decode bo'lmadi; result None: quality gate'dan o'tmadi
+StrictOutcome = Tuple[bool, Optional[FaceEmbeddingResult]]
+
+
+class EmbeddingServiceUnavailable(Exception):
+    """Embedding service javob bermadi (ulanish / timeout / 5xx) — chaqiruvchi in-process fallback qiladi."""
+
+
+# ----------------------------------------------------------
+# wire format: embedding'lar float32 little-endian base64 (JSON float ro'yxatidan ~3x kichik, aniq)
+# ----------------------------------------------------------
+def encode_vector(values) -> str:
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(raw: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(raw), dtype="<f4").tolist()
+
+
+def encode_strict(outcome: StrictOutcome) -> Optional[Dict[str, Any]]:
+    failed, res = outcome
+    if failed:
+        return {"failed": True}
+    if res is None:
+        return None
+    return {"embedding": encode_vector(res.embedding), "meta": asdict(res.meta)}
+
+
+def decode_strict(item: Optional[Dict[str, Any]]) -> StrictOutcome:
+    if item is None:
+        return False, None
+    if item.get("failed"):
+        return True, None
+    meta = dict(item["meta"])
+    meta["bbox"] = tuple(meta["bbox"])
+    return False, FaceEmbeddingResult(embedding=decode_vector(item["embedding"]), meta=FaceMeta(**meta))
+
+
+def encode_candidate(c: FaceCandidate) -> Dict[str, Any]:
+    data = asdict(c)
+    data["embedding"] = encode_vector(c.embedding) if c.embedding is not None else None
+    data["extra_embeddings"] = {v: encode_vector(e) for v, e in c.extra_embeddings.items()}
+    return data
+
+
+def decode_candidate(data: Dict[str, Any]) -> FaceCandidate:
+    data = dict(data)
+    data["bbox"] = tuple(data["bbox"])
+    data["embedding"] = decode_vector(data["embedding"]) if data.get("embedding") is not None else None
+    data["extra_embeddings"] = {v: decode_vector(e) for v, e in (data.get("extra_embeddings") or {}).items()}
+    return FaceCandidate(**data)
+
+
+# ----------------------------------------------------------
+# client: keep-alive HTTP (TCP yoki Unix socket), stdlib
+# ----------------------------------------------------------
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self._path)
+        self.sock = sock
+
+
+class EmbeddingClient:
+    """
+    Alohida embedding service (app.embedding_main) uchun sync client — executor thread'ida chaqiriladi.
+      url: "unix:///run/faceid/embed.sock" yoki "http://10.0.0.5:8100"
+    Service yiqilsa retry_sec davomida so'rov yuborilmaydi (darhol EmbeddingServiceUnavailable -> fallback).
+    Service "busy" javobi (band yoki hali tayyor emas) -> BusyError, boshqa xato (masalan versiya yuklanmagan) ->
+    ValueError: lokal model bo'lsa chaqiruvchi unga o'tadi, aks holda endpoint'lar "retry after" / xato qaytaradi.
+    """
+
+    def __init__(self, url: str, *, timeout_sec: float, retry_sec: float, pool_size: int = 16):
+        parts = urlsplit(url)
+        if parts.scheme == "unix":
+            self._unix_path: Optional[str] = parts.path
+            self._host, self._port, self._prefix = None, None, ""
+        elif parts.scheme == "http":
+            self._unix_path = None
+            self._host, self._port, self._prefix = parts.hostname, parts.port or 80, parts.path.rstrip("/")
+        else:
+            raise ValueError(f"Unsupported embedding service url: {url}")
+        self.url = url
+        self.timeout_sec = timeout_sec
+        self.retry_sec = retry_sec
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _connect(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if self._unix_path is not None:
+            return _UnixHTTPConnection(self._unix_path, self.timeout_sec)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self.timeout_sec)
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _post(self, path: str, payload: Dict[str, Any], lane: Optional[str]) -> Dict[str, Any]:
+        if not self.available:
+            raise EmbeddingServiceUnavailable(f"{self.url} is marked down")
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if lane:
+            headers["X-Inference-Lane"] = lane
+
+        with self._lock:
+            self.calls += 1
+        # 2 urinish: pool'dagi keep-alive ulanish server tomonidan yopilgan bo'lishi mumkin
+        for attempt in range(2):
+            conn = self._connect()
+            try:
+                conn.request("POST", self._prefix + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if attempt == 0:
+                    continue
+                self._mark_down(e)
+                raise EmbeddingServiceUnavailable(str(e)) from e
+            self._release(conn)
+            break
+
+        if resp.status >= 500:
+            self._mark_down(f"HTTP {resp.status}")
+            raise EmbeddingServiceUnavailable(f"HTTP {resp.status}")
+        if resp.status != 200:
+            # 4xx (masalan bitta so'rovning validation xatosi) — service tirik, faqat shu so'rov rad etildi
+            raise ValueError(f"Embedding service rejected the request: HTTP {resp.status} {data[:200]!r}")
+        result = json.loads(data)
+        if result.get("code") == "busy":
+            raise BusyError(float(result.get("retry_after") or 1.0), result.get("message") or "Embedding service is busy")
+        if result.get("status") != "ok":
+            raise ValueError(result.get("message") or "Embedding service error")
+        return result.get("data") or {}
+
+    def _mark_down(self, reason) -> None:
+        with self._lock:
+            self.failures += 1
+            self._down_until = time.monotonic() + self.retry_sec
+        logger.warning("Embedding service %s unavailable for %.0fs: %s", self.url, self.retry_sec, reason)
+
+    # ------------------------------------------------------
+    # API
+    # ------------------------------------------------------
+    @staticmethod
+    def _check_version(data: Dict[str, Any], version: str) -> None:
+        # service boshqa (o'zining primary) modeli bilan embedding qilgan bo'lsa — vektorlar boshqa versiya nomi
+        # bilan yozilmasin (rolling model almashtirish paytida)
+        if data.get("version") != version:
+            raise ValueError(f"Embedding service answered with model {data.get('version')}, expected {version}")
+
+    def strict(
+        self,
+        photos_b64: List[Optional[str]],
+        *,
+        version: str,
+        lane: Optional[str] = None,
+        min_det_score: float,
+        min_face_size: int,
+        min_blur: float,
+    ) -> List[StrictOutcome]:
+        """get_face_embedding_strict har bir rasm uchun (bitta so'rov, service'da bitta recognition batch).
+        version har doim aniq: service javobidagi versiya boshqa bo'lsa -> ValueError."""
+        data = self._post(
+            "/embed/strict",
+            {
+                "photos": photos_b64,
+                "version": version,
+                "min_det_score": min_det_score,
+                "min_face_size": min_face_size,
+                "min_blur": min_blur,
+            },
+            lane,
+        )
+        self._check_version(data, version)
+        return [decode_strict(item) for item in data["results"]]
+
+    def detect(
+        self,
+        image_b64: str,
+        *,
+        version: str,
+        extra_versions: Optional[List[str]] = None,
+        lane: Optional[str] = None,
+        min_det_score: float,
+        min_face_size: int,
+        min_blur: float,
+        max_faces: int,
+    ) -> List[FaceCandidate]:
+        """detect_all_faces_with_quality (qo'shimcha versiyalar embeddinglari bilan), version modeli bilan."""
+        data = self._post(
+            "/embed/detect",
+            {
+                "image": image_b64,
+                "version": version,
+                "extra_versions": extra_versions or [],
+                "min_det_score": min_det_score,
+                "min_face_size": min_face_size,
+                "min_blur": min_blur,
+                "max_faces": max_faces,
+            },
+            lane,
+        )
+        self._check_version(data, version)
+        return [decode_candidate(c) for c in data["faces"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "available": self.available,
+            "calls": self.calls,
+            "failures": self.failures,
+            "idle_connections": self._idle.qsize(),
+        }
@@ -1,10 +1,14 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, List, Tuple, Any
+from typing import Optional, List, Tuple, Any, TYPE_CHECKING
 
-import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
+
+from app.config import QUALITY_MIN_BLUR
+from app.services.face_quality import QUALITY_CHIP_SIZE, aligned_chip, measure
+
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis  # import qimmat: faqat type hint uchun
 
 EMB_SIZE = 512
 
@@ -15,16 +19,13 @@ class FaceMeta:
     face_size: int
     blur: float
     faces_found: int
+    brightness: float = 0.0
 
 @dataclass
 class FaceEmbeddingResult:
     embedding: List[float]
     meta: FaceMeta
 
-def _blur_score(image_bgr: np.ndarray) -> float:
-    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
-    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
-
 def _bbox_area(b: Tuple[int, int, int, int]) -> int:
     x1, y1, x2, y2 = b
     return max(0, x2 - x1) * max(0, y2 - y1)
@@ -60,6 +61,8 @@ def _select_best_face(faces: list[Any], image_shape) -> Optional[tuple[Any, Tupl
 
     return best
 def add_margin(image, margin_ratio=0.05):
+    import cv2
+
     h, w = image.shape[:2]
 
     top = int(h * margin_ratio)
@@ -84,7 +87,7 @@ def get_face_embedding_strict(
     *,
     min_det_score: float = 0.40,
     min_face_size: int = 80,
-    min_blur: float = 60.0,
+    min_blur: float = QUALITY_MIN_BLUR,
 ) -> Optional[FaceEmbeddingResult]:
     """
     Возвращает embedding + meta только если проходит quality gates.
@@ -101,18 +104,17 @@ def get_face_embedding_strict(
 
     face, bbox, det_score, _ = picked
     x1, y1, x2, y2 = bbox
-    face_w, face_h = (x2 - x1), (y2 - y1)
-    face_size = min(face_w, face_h)
-
-    # blur по crop лица (лучше, чем по всему кадру)
-    crop = image_bgr[y1:y2, x1:x2] if face_w > 0 and face_h > 0 else image_bgr
-    bl = _blur_score(crop)
+    face_size = min(x2 - x1, y2 - y1)
 
     # gates
     if det_score < min_det_score:
         return None
     if face_size < min_face_size:
         return None
+
+    # blur / brightness — aligned chip'da (yuz o'lchamiga bog'liq emas)
+    quality = measure([aligned_chip(image_bgr, getattr(face, "kps", None), bbox)], [face_size])[0]
+    bl = quality.blur
     if bl < min_blur:
         return None
 
@@ -126,5 +128,91 @@ def get_face_embedding_strict(
         face_size=face_size,
         blur=bl,
         faces_found=len(faces),
+        brightness=quality.brightness,
     )
     return FaceEmbeddingResult(embedding=emb.tolist(), meta=meta)
+
+
+def get_face_embeddings_strict_batch(
+    images_bgr: List[Optional[np.ndarray]],
+    face_app: FaceAnalysis,
+    *,
+    min_det_score: float = 0.40,
+    min_face_size: int = 80,
+    min_blur: float = QUALITY_MIN_BLUR,
+) -> List[Optional[FaceEmbeddingResult]]:
+    """
+    get_face_embedding_strict'ning batch varianti (bulk ingest uchun):
+      - detection har bir rasm uchun alohida (turli o'lcham)
+      - har bir rasmning eng yaxshi yuzi align qilinadi; sifat barcha chip'lar uchun bitta measure() o'tishida
+      - quality gate'lardan o'tganlar recognition'ga bitta get_feat batch'ida
+      - landmark / genderage modellari ishlatilmaydi (strict natijaga ta'sir qilmaydi)
+    None rasm yoki gate'dan o'tmagan yuz -> None.
+    """
+    import cv2
+    from insightface.utils import face_align
+
+    rec_model = face_app.models["recognition"]
+    rec_size = rec_model.input_size[0]
+    out: List[Optional[FaceEmbeddingResult]] = [None] * len(images_bgr)
+    # (rasm indeksi, bbox, det_score, face_size, faces_found, recognition crop)
+    picked: List[Tuple[int, Tuple[int, int, int, int], float, int, int, np.ndarray]] = []
+
+    for i, image_bgr in enumerate(images_bgr):
+        if image_bgr is None:
+            continue
+        image_bgr = add_margin(image_bgr, margin_ratio=0.05)
+        bboxes, kpss = face_app.det_model.detect(image_bgr, max_num=0, metric="default")
+        if bboxes is None or len(bboxes) == 0:
+            continue
+
+        h, w = image_bgr.shape[:2]
+        best = None
+        best_key = None
+        for j in range(len(bboxes)):
+            score = float(bboxes[j, 4])
+            bbox = _clamp_bbox(tuple(map(int, bboxes[j, :4])), w, h)
+            key = (score, _bbox_area(bbox))
+            if best is None or key > best_key:
+                best = (j, bbox, score)
+                best_key = key
+
+        j, bbox, det_score = best
+        x1, y1, x2, y2 = bbox
+        face_size = min(x2 - x1, y2 - y1)
+        if det_score < min_det_score or face_size < min_face_size or kpss is None:
+            continue
+
+        crop = face_align.norm_crop(image_bgr, landmark=kpss[j], image_size=rec_size)
+        picked.append((i, bbox, det_score, face_size, len(bboxes), crop))
+
+    # recognition crop o'lchami chip bilan bir xil bo'lsa (ArcFace 112) qayta align qilinmaydi
+    chips = [
+        crop if rec_size == QUALITY_CHIP_SIZE else cv2.resize(crop, (QUALITY_CHIP_SIZE, QUALITY_CHIP_SIZE))
+        for *_, crop in picked
+    ]
+    qualities = measure(chips, [face_size for _, _, _, face_size, _, _ in picked])
+
+    crops: List[np.ndarray] = []
+    pending: List[Tuple[int, FaceMeta]] = []
+    for (i, bbox, det_score, face_size, faces_found, crop), quality in zip(picked, qualities):
+        if quality.blur < min_blur:
+            continue
+        crops.append(crop)
+        pending.append((i, FaceMeta(
+            det_score=det_score,
+            bbox=bbox,
+            face_size=face_size,
+            blur=quality.blur,
+            faces_found=faces_found,
+            brightness=quality.brightness,
+        )))
+
+    if crops:
+        feats = np.asarray(rec_model.get_feat(crops), dtype=np.float32).reshape(len(crops), -1)
+        feats = feats / np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-12)
+        for (i, meta), emb in zip(pending, feats):
+            if len(emb) == EMB_SIZE:
+                out[i] = FaceEmbeddingResult(embedding=emb.tolist(), meta=meta)
+
+    return out
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Sifat o'lchanadigan chip: ArcFace input bilan bir xil (5 nuqta bo'yicha align) — yuz o'lchamidan qat'i nazar
+# bir xil piksel soni: katta yuz qimmatroq emas, blur ballari turli rezolyutsiyalar orasida solishtiriladi.
+QUALITY_CHIP_SIZE = 112
+
+# blur shkalasi versiyasi (person_documents_v2/person_embeddings.quality_scale): 0 — eski o'lchov (asl crop),
+# 1 — chip. Turli shkaladagi blur ballari bir-biri bilan solishtirilmaydi.
+QUALITY_SCALE = 1
+
+# BGR -> gray (cv2.COLOR_BGR2GRAY koeffitsientlari)
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+@dataclass
+class FaceQuality:
+    blur: float  # Laplacian variance (chip'da)
+    brightness: float  # o'rtacha gray qiymat, 0..255
+    face_size: int  # bbox'ning kichik tomoni (asl rasmda)
+
+
+def aligned_chip(image_bgr: np.ndarray, kps: Optional[np.ndarray], bbox: Tuple[int, int, int, int]) -> np.ndarray:
+    """
+    QUALITY_CHIP_SIZE x QUALITY_CHIP_SIZE BGR chip: landmark'lar bo'lsa norm_crop (recognition bilan bir xil),
+    aks holda bbox crop -> resize.
+    """
+    if kps is not None:
+        from insightface.utils import face_align
+
+        return face_align.norm_crop(image_bgr, landmark=kps, image_size=QUALITY_CHIP_SIZE)
+
+    import cv2
+
+    x1, y1, x2, y2 = bbox
+    crop = image_bgr[y1:y2, x1:x2] if x2 > x1 and y2 > y1 else image_bgr
+    return cv2.resize(crop, (QUALITY_CHIP_SIZE, QUALITY_CHIP_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def measure(chips: Sequence[np.ndarray], face_sizes: Sequence[int]) -> List[FaceQuality]:
+    """
+    Bitta o'tishda barcha yuzlar uchun (N, S, S, 3) -> gray float32 -> blur + brightness.
+    Laplacian: cv2.Laplacian(ksize=1) yadrosi, BORDER_REFLECT_101 (np.pad "reflect") bilan.
+    """
+    if not len(chips):
+        return []
+    gray = np.stack(chips).astype(np.float32) @ _GRAY_WEIGHTS  # (N, S, S)
+    padded = np.pad(gray, ((0, 0), (1, 1), (1, 1)), mode="reflect")
+    lap = (
+        padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1]
+        + padded[:, 1:-1, :-2] + padded[:, 1:-1, 2:]
+        - 4.0 * gray
+    )
+    blur = lap.var(axis=(1, 2), dtype=np.float32)
+    brightness = gray.mean(axis=(1, 2), dtype=np.float32)
+    return [
+        FaceQuality(blur=float(b), brightness=float(m), face_size=int(s))
+        for b, m, s in zip(blur, brightness, face_sizes)
+    ]
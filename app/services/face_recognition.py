@@ -1,17 +1,103 @@
-import cv2
-import numpy as np
-from insightface.app import FaceAnalysis
-from fastapi import HTTPException
+from __future__ import annotations
+import logging
+import os
+import time
+from dataclasses import replace
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
 from app.utils.response import error
+from app.config import (
+    INFERENCE_MAX_CONCURRENCY,
+    ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS, ORT_EXECUTION_MODE, ORT_GRAPH_OPT_LEVEL,
+    ORT_CPU_MEM_ARENA, ORT_PROVIDERS, ORT_MODEL_CACHE_DIR,
+    SERVER_WORKERS, ORT_PREPACK_SHARED_WEIGHTS, FACE_DET_SIZE, FACE_DET_THRESH,
+)
+from app.services.onnx_runtime import OrtConfig, SharedWeights, load_model_pack, preload_model_pack
+
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis
+
+logger = logging.getLogger(__name__)
+
+# preload_face_models natijasi: model nomi -> (onnx fayl -> og'irliklar). Fork'dan keyin worker'larga meros.
+_PRELOADED: Dict[str, Dict[str, SharedWeights]] = {}
+
+
+def default_ort_config() -> OrtConfig:
+    return OrtConfig(
+        intra_op_threads=ORT_INTRA_OP_THREADS,
+        inter_op_threads=ORT_INTER_OP_THREADS,
+        execution_mode=ORT_EXECUTION_MODE,
+        graph_optimization_level=ORT_GRAPH_OPT_LEVEL,
+        cpu_mem_arena=ORT_CPU_MEM_ARENA,
+        providers=[p.strip() for p in ORT_PROVIDERS.split(",") if p.strip()],
+    )
+
+
+def _cache_dir(name: str) -> Optional[str]:
+    return os.path.join(ORT_MODEL_CACHE_DIR, name) if ORT_MODEL_CACHE_DIR else None
+
+
+def preload_face_models(names: Iterable[str], *, ort_config: Optional[OrtConfig] = None) -> None:
+    """
+    Gunicorn master'da, fork'dan oldin: og'irliklar bir marta o'qiladi (session / thread pool yaratilmaydi).
+    Keyin worker'dagi create_face_app shu og'irliklar ustiga session quradi.
+    """
+    from insightface.utils import ensure_available
+
+    ort_config = ort_config or default_ort_config()
+    for name in dict.fromkeys(names):
+        started = time.perf_counter()
+        model_dir = ensure_available("models", name, root="~/.insightface")
+        _PRELOADED[name] = preload_model_pack(model_dir, ort_config, cache_dir=_cache_dir(name))
+        logger.info("Face model %s weights preloaded in %.2fs", name, time.perf_counter() - started)
+
+
+def create_face_app(
+    name: str = "buffalo_l",
+    *,
+    ort_config: Optional[OrtConfig] = None,
+    concurrency: int = max(1, INFERENCE_MAX_CONCURRENCY) * max(1, SERVER_WORKERS),
+    det_size: int = FACE_DET_SIZE,
+    det_thresh: float = FACE_DET_THRESH,
+    shared_weights: bool = True,
+):
+    """
+    FaceAnalysis, lekin ONNX session'lar OrtConfig bilan (va optimallashtirilgan graph cache'i bilan) yaratiladi.
+    concurrency: host bo'yicha parallel inference soni (intra_op_threads avtomatik bo'lsa core'lar shunga bo'linadi).
+    preload_face_models chaqirilgan bo'lsa session'lar master'dagi umumiy og'irliklardan quriladi
+    (shared_weights=False -> diskdagi fayllardan, masalan hot reload model fayllari o'zgargandan keyin).
+    """
+    # og'ir import'lar (insightface -> onnxruntime, cv2, onnx) faqat model kerak bo'lganda
+    from insightface.app import FaceAnalysis
+    from insightface.utils import ensure_available
 
+    started = time.perf_counter()
+    ort_config = ort_config or default_ort_config()
+    model_dir = ensure_available("models", name, root="~/.insightface")
+    shared = _PRELOADED.get(name) if shared_weights else None
+    if shared:
+        ort_config = replace(ort_config, disable_prepacking=not ORT_PREPACK_SHARED_WEIGHTS)
 
-def create_face_app():
-    app = FaceAnalysis(name="buffalo_l")
-    app.prepare(ctx_id=0)  # ctx_id=0 -> GPU if exists, CPU fallback automatically
+    # FaceAnalysis.__init__ o'z session'larini yaratadi — uning o'rniga bizning session'lar (prepare / get o'zgarmagan)
+    app = FaceAnalysis.__new__(FaceAnalysis)
+    app.model_dir = model_dir
+    app.ort_config = ort_config
+    app.models = load_model_pack(
+        model_dir,
+        ort_config,
+        concurrency=concurrency,
+        cache_dir=_cache_dir(name),
+        shared=shared,
+    )
+    assert "detection" in app.models
+    app.det_model = app.models["detection"]
+    app.prepare(ctx_id=0, det_thresh=det_thresh, det_size=(det_size, det_size))  # ctx_id=0 -> GPU if exists, CPU fallback
+    logger.info("Face model %s ready in %.2fs (shared weights: %s)", name, time.perf_counter() - started, bool(shared))
     return app
 
 
-def get_face_embedding(image, face_app: FaceAnalysis):
+def get_face_embedding(image, face_app: "FaceAnalysis"):
     faces = face_app.get(image)
     if not faces:
         return None, error(message="Rasmda yuz topilmadi!", person_id=None)
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
-import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
+
+from app.config import QUALITY_MIN_BLUR
+from app.services.face_quality import aligned_chip, measure
+
+if TYPE_CHECKING:
+    from insightface.app import FaceAnalysis  # import qimmat: faqat type hint uchun
 
 EMB_SIZE = 512
 
@@ -23,10 +27,9 @@ class FaceCandidate:
     quality_ok: bool
     quality_issues: List[str]
 
-
-def _blur_score(image_bgr: np.ndarray) -> float:
-    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
-    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    # qo'shimcha model versiyalari (mixed-version search): version -> normallashtirilgan embedding
+    extra_embeddings: Dict[str, List[float]] = field(default_factory=dict)
+    brightness: float = 0.0
 
 
 def _clamp_bbox(b, w, h):
@@ -41,6 +44,7 @@ def _clamp_bbox(b, w, h):
 
 def _crop_to_base64_jpeg(image_bgr, bbox, quality=85) -> str:
     import base64
+    import cv2
     x1, y1, x2, y2 = bbox
     crop = image_bgr[y1:y2, x1:x2]
     if crop.size == 0:
@@ -56,6 +60,8 @@ def _crop_to_base64_jpeg(image_bgr, bbox, quality=85) -> str:
 
 
 def add_margin(image, ratio=0.05):
+    import cv2
+
     h, w = image.shape[:2]
     m = int(min(h, w) * ratio)
     return cv2.copyMakeBorder(
@@ -65,14 +71,45 @@ def add_margin(image, ratio=0.05):
     )
 
 
+def _extra_embeddings(image_bgr: np.ndarray, faces: list, extra_models: Dict[str, Any]) -> List[Dict[str, List[float]]]:
+    """
+    Primary detektor topgan landmark'lar bo'yicha align -> har bir qo'shimcha model uchun bitta get_feat batch.
+    Detektor qayta ishlamaydi: yuzlar / face_index barcha versiyalar uchun bir xil.
+    """
+    from insightface.utils import face_align
+
+    out: List[Dict[str, List[float]]] = [{} for _ in faces]
+    idx = [i for i, f in enumerate(faces) if getattr(f, "kps", None) is not None]
+    if not idx:
+        return out
+
+    for version, app in extra_models.items():
+        try:
+            rec_model = app.models["recognition"]
+            crops = [
+                face_align.norm_crop(image_bgr, landmark=faces[i].kps, image_size=rec_model.input_size[0])
+                for i in idx
+            ]
+            feats = np.asarray(rec_model.get_feat(crops), dtype=np.float32).reshape(len(crops), -1)
+        except Exception:
+            continue
+        if feats.shape[1] != EMB_SIZE:
+            continue
+        feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-12)
+        for i, feat in zip(idx, feats):
+            out[i][version] = feat.tolist()
+    return out
+
+
 def detect_all_faces_with_quality(
     image_bgr: np.ndarray,
     face_app: FaceAnalysis,
     *,
     min_det_score: float = 0.60,
     min_face_size: int = 80,
-    min_blur: float = 60.0,
+    min_blur: float = QUALITY_MIN_BLUR,
     max_faces: int = 10,
+    extra_models: Optional[Dict[str, Any]] = None,
 ) -> List[FaceCandidate]:
 
     image_bgr = add_margin(image_bgr)
@@ -80,24 +117,24 @@ def detect_all_faces_with_quality(
     if not faces:
         return []
 
+    extra = _extra_embeddings(image_bgr, faces, extra_models) if extra_models else [{} for _ in faces]
+
     h, w = image_bgr.shape[:2]
+    bboxes = [_clamp_bbox(getattr(f, "bbox", (0, 0, 0, 0)), w, h) for f in faces]
+    face_sizes = [min(x2 - x1, y2 - y1) for x1, y1, x2, y2 in bboxes]
+    # kadrdagi barcha yuzlar uchun sifat bitta o'tishda (aligned chip'larda)
+    qualities = measure(
+        [aligned_chip(image_bgr, getattr(f, "kps", None), bbox) for f, bbox in zip(faces, bboxes)],
+        face_sizes,
+    )
     results: List[FaceCandidate] = []
 
-    for f in faces:
+    for f, f_extra, bbox, quality in zip(faces, extra, bboxes, qualities):
         issues: List[str] = []
 
         det_score = float(getattr(f, "det_score", 0.0))
-        bbox = _clamp_bbox(
-            getattr(f, "bbox", (0, 0, 0, 0)),
-            w,
-            h,
-        )
-
-        x1, y1, x2, y2 = bbox
-        face_size = min(x2 - x1, y2 - y1)
-
-        crop = image_bgr[y1:y2, x1:x2] if face_size > 0 else image_bgr
-        blur = _blur_score(crop)
+        face_size = quality.face_size
+        blur = quality.blur
 
         # -------- QUALITY CHECK (SOFT) --------
         if det_score < min_det_score:
@@ -124,6 +161,8 @@ def detect_all_faces_with_quality(
                 face_b64=_crop_to_base64_jpeg(image_bgr, bbox),
                 quality_ok=(len(issues) == 0),
                 quality_issues=issues,
+                extra_embeddings=f_extra,
+                brightness=quality.brightness,
             )
         )
     results.sort(
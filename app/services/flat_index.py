@@ -0,0 +1,586 @@
+from __future__ import annotations
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.services.attribute_index import AttributeIndex, dtb_to_days, match_attributes
+
+EMB_SIZE = 512
+ID_BYTES = 16
+ATTR_COLS = 2  # (citizen, dtb_days) int32
+# fayl tuzilishi o'zgarsa oshiriladi (2: .attr sidecar + model_version); mos kelmasa index ochilmaydi
+FORMAT_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _flock(path: str, *, blocking: bool = True, shared: bool = False):
+    with open(path, "a+") as fh:
+        try:
+            fcntl.flock(fh, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _uuid_bytes(person_ids: Sequence[Any]) -> np.ndarray:
+    raw = b"".join(UUID(str(pid)).bytes for pid in person_ids)
+    return np.frombuffer(raw, dtype=np.uint8).reshape(len(person_ids), ID_BYTES)
+
+
+def _normalized(vectors: Sequence[Sequence[float]], dtype: np.dtype) -> np.ndarray:
+    # score = dot(q, row) == cosine similarity bo'lishi uchun qatorlar normallashtirib yoziladi
+    emb = np.asarray(vectors, dtype=np.float32).reshape(-1, EMB_SIZE)
+    emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+    return emb.astype(dtype)
+
+
+def _attr_rows(attrs: Sequence[Tuple[Optional[int], Any]]) -> np.ndarray:
+    return np.asarray(
+        [(int(c or 0), dtb_to_days(d)) for c, d in attrs],
+        dtype=np.int32,
+    ).reshape(len(attrs), ATTR_COLS)
+
+
+def _empty_attrs() -> np.ndarray:
+    return np.empty((0, ATTR_COLS), dtype=np.int32)
+
+
+def _keys(ids: np.ndarray) -> np.ndarray:
+    """(n, 16) uint8 -> (n,) V16: UUID'larni numpy'da solishtirish / saralash uchun."""
+    return np.ascontiguousarray(ids).view(f"V{ID_BYTES}").ravel()
+
+
+class FlatEmbeddingStore:
+    """
+    Exact qidiruv uchun memory-mapped embedding matritsasi (person_id bo'yicha bitta qator).
+
+    Fayllar (<path>/):
+      MANIFEST.json               -> {"format": 2, "generation": g, "rows": n, "dtype": "float16", "model_version": ...}
+      base-<g>.emb / .ids / .attr -> read-only memmap; OS page cache orqali barcha worker'lar uchun bitta nusxa
+      tail.emb / .ids / .attr     -> ingest append qiladigan kichik segment
+    .attr = (citizen, dtb) int32 — SearchFilters uchun AttributeIndex shu ustunlardan quriladi.
+    Person tail'da bo'lsa uning base qatori (va tail'dagi oldingi qatorlari) qidiruvda yashiriladi — tail ustun.
+    compact() tail'ni base'ga qo'shib, person_id bo'yicha oxirgi qatorni qoldiradi.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        dtype: str = "float16",
+        threads: int = 4,
+        block_rows: int = 16384,
+        exact_candidates_max: int = 200_000,
+    ):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.block_rows = max(int(block_rows), 1024)
+        self.exact_candidates_max = int(exact_candidates_max)
+        os.makedirs(path, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=max(int(threads), 1), thread_name_prefix="flat-scan")
+        self._lock = threading.Lock()
+        self._manifest_mtime: Optional[int] = None
+        self._generation = -1
+        self._model_version: Optional[str] = None
+        self._base_emb = np.empty((0, EMB_SIZE), dtype=self.dtype)
+        self._base_ids = np.empty((0, ID_BYTES), dtype=np.uint8)
+        self._base_attrs = _empty_attrs()
+        self._attr_index: Optional[AttributeIndex] = None
+        self._tail_sizes: Tuple[int, ...] = ()
+        self._tail_emb = np.empty((0, EMB_SIZE), dtype=self.dtype)
+        self._tail_ids = np.empty((0, ID_BYTES), dtype=np.uint8)
+        self._tail_attrs = _empty_attrs()
+        # tail ustunligi: base id'larining saralangan indeksi (generation bo'yicha, kerak bo'lganda) + mask'lar
+        self._base_sorted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._base_valid: Optional[np.ndarray] = None
+        self._tail_valid: Optional[np.ndarray] = None
+
+    # ------------------------------------------------------
+    # paths / manifest
+    # ------------------------------------------------------
+    def _p(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _base_paths(self, generation: int) -> Tuple[str, str, str]:
+        return (
+            self._p(f"base-{generation}.emb"),
+            self._p(f"base-{generation}.ids"),
+            self._p(f"base-{generation}.attr"),
+        )
+
+    def _tail_paths(self) -> Tuple[str, str, str]:
+        return self._p("tail.emb"), self._p("tail.ids"), self._p("tail.attr")
+
+    def _read_manifest(self, *, strict: bool = True) -> Dict[str, Any]:
+        """strict=False faqat write_base uchun: to'liq qayta qurish eski formatdagi index'ni almashtiradi."""
+        try:
+            with open(self._p("MANIFEST.json")) as fh:
+                manifest = json.load(fh)
+        except FileNotFoundError:
+            return {"format": FORMAT_VERSION, "generation": 0, "rows": 0, "dtype": self.dtype.name, "model_version": None}
+        if not strict:
+            return manifest
+        if manifest.get("format") != FORMAT_VERSION:
+            raise RuntimeError(
+                f"Flat index format {manifest.get('format')} != {FORMAT_VERSION}, "
+                "rebuild it with scripts.build_flat_index"
+            )
+        if manifest.get("dtype", self.dtype.name) != self.dtype.name:
+            raise RuntimeError(f"Flat index dtype mismatch: {manifest.get('dtype')} != {self.dtype.name}")
+        return manifest
+
+    def _write_manifest(self, generation: int, rows: int, model_version: Optional[str]) -> None:
+        tmp = self._p("MANIFEST.json.tmp")
+        with open(tmp, "w") as fh:
+            json.dump(
+                {
+                    "format": FORMAT_VERSION,
+                    "generation": generation,
+                    "rows": rows,
+                    "dtype": self.dtype.name,
+                    "model_version": model_version,
+                },
+                fh,
+            )
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self._p("MANIFEST.json"))
+
+    def _open_base(self, manifest: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = int(manifest["rows"])
+        if rows == 0:
+            return np.empty((0, EMB_SIZE), dtype=self.dtype), np.empty((0, ID_BYTES), dtype=np.uint8), _empty_attrs()
+        emb_path, ids_path, attr_path = self._base_paths(int(manifest["generation"]))
+        emb = np.memmap(emb_path, dtype=self.dtype, mode="r", shape=(rows, EMB_SIZE))
+        ids = np.memmap(ids_path, dtype=np.uint8, mode="r", shape=(rows, ID_BYTES))
+        attrs = np.memmap(attr_path, dtype=np.int32, mode="r", shape=(rows, ATTR_COLS))
+        return emb, ids, attrs
+
+    def _read_tail(self) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        shared lock: write_base / compact tail'ni qayta yozayotganda qatorlar aralashmaydi.
+        Lock band bo'lsa None — qidiruv kutmaydi, oldingi tail ko'rinishi bilan davom etadi.
+        """
+        with _flock(self._p("tail.lock"), blocking=False, shared=True) as acquired:
+            if not acquired:
+                return None
+            return self._read_tail_unlocked()
+
+    def _read_tail_unlocked(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        emb_path, ids_path, attr_path = self._tail_paths()
+        if not all(os.path.exists(p) for p in (emb_path, ids_path, attr_path)):
+            return np.empty((0, EMB_SIZE), dtype=self.dtype), np.empty((0, ID_BYTES), dtype=np.uint8), _empty_attrs()
+        emb = np.fromfile(emb_path, dtype=self.dtype)
+        ids = np.fromfile(ids_path, dtype=np.uint8)
+        attrs = np.fromfile(attr_path, dtype=np.int32)
+        # ids oxirida yoziladi -> to'liq yozilgan qatorlar soni
+        rows = min(emb.size // EMB_SIZE, ids.size // ID_BYTES, attrs.size // ATTR_COLS)
+        return (
+            emb[: rows * EMB_SIZE].reshape(rows, EMB_SIZE),
+            ids[: rows * ID_BYTES].reshape(rows, ID_BYTES),
+            attrs[: rows * ATTR_COLS].reshape(rows, ATTR_COLS),
+        )
+
+    def _sync(self) -> None:
+        """Boshqa worker'lar yozgan o'zgarishlarni (compact / tail append) ko'radi."""
+        try:
+            mtime = os.stat(self._p("MANIFEST.json")).st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        sizes = tuple(os.stat(p).st_size if os.path.exists(p) else 0 for p in self._tail_paths())
+
+        with self._lock:
+            changed = mtime != self._manifest_mtime
+            if changed:
+                manifest = self._read_manifest()
+                self._base_emb, self._base_ids, self._base_attrs = self._open_base(manifest)
+                self._attr_index = None  # yangi generation uchun birinchi filtrli so'rovda quriladi
+                self._base_sorted = None
+                self._generation = int(manifest["generation"])
+                self._model_version = manifest.get("model_version")
+                self._manifest_mtime = mtime
+                self._tail_sizes = ()
+            if sizes != self._tail_sizes:
+                tail = self._read_tail()
+                if tail is not None:
+                    self._tail_emb, self._tail_ids, self._tail_attrs = tail
+                    self._tail_sizes = sizes
+                    changed = True
+            if changed:
+                self._update_overrides()
+
+    def _update_overrides(self) -> None:
+        """
+        self._lock ostida: tail'dagi person'larning base qatori va tail ichidagi oldingi qatorlari yashiriladi
+        (_base_valid / _tail_valid; hammasi ko'rinadigan bo'lsa None).
+        """
+        self._base_valid = self._tail_valid = None
+        nt = len(self._tail_ids)
+        if nt == 0:
+            return
+        tail_keys = _keys(self._tail_ids)
+        _, first_in_rev = np.unique(tail_keys[::-1], return_index=True)
+        if len(first_in_rev) < nt:
+            self._tail_valid = np.zeros(nt, dtype=bool)
+            self._tail_valid[nt - 1 - first_in_rev] = True
+
+        nb = len(self._base_ids)
+        if nb == 0:
+            return
+        if self._base_sorted is None:
+            keys = _keys(np.asarray(self._base_ids))
+            order = np.argsort(keys, kind="stable")
+            self._base_sorted = (keys[order], order)
+        sorted_keys, order = self._base_sorted
+        pos = np.minimum(np.searchsorted(sorted_keys, tail_keys), nb - 1)
+        hit = sorted_keys[pos] == tail_keys
+        if hit.any():
+            self._base_valid = np.ones(nb, dtype=bool)
+            self._base_valid[order[pos[hit]]] = False
+
+    def _segments(self) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        return self._snapshot()[0]
+
+    def _snapshot(self):
+        """(segments, base_valid, tail_valid) — bitta lock ostida, bir-biriga mos."""
+        self._sync()
+        with self._lock:
+            segments = [
+                (self._base_emb, self._base_ids, self._base_attrs),
+                (self._tail_emb, self._tail_ids, self._tail_attrs),
+            ]
+            return segments, self._base_valid, self._tail_valid
+
+    @property
+    def model_version(self) -> Optional[str]:
+        """Base qaysi embedding modeli bilan qurilgan (MANIFEST); eski / bo'sh index'da None."""
+        self._sync()
+        return self._model_version
+
+    def _get_attr_index(self) -> AttributeIndex:
+        with self._lock:
+            if self._attr_index is None:
+                attrs = np.asarray(self._base_attrs)
+                self._attr_index = AttributeIndex(attrs[:, 0], attrs[:, 1])
+            return self._attr_index
+
+    def __len__(self) -> int:
+        return sum(len(ids) for _, ids, _ in self._segments())
+
+    # ------------------------------------------------------
+    # write
+    # ------------------------------------------------------
+    def append(
+        self,
+        person_ids: Sequence[Any],
+        vectors: Sequence[Sequence[float]],
+        attrs: Sequence[Tuple[Optional[int], Any]],
+    ) -> None:
+        """attrs: har bir qator uchun (citizen, dtb)."""
+        if not person_ids:
+            return
+        emb = _normalized(vectors, self.dtype)
+        ids = _uuid_bytes(person_ids)
+        attr = _attr_rows(attrs)
+        emb_path, ids_path, attr_path = self._tail_paths()
+
+        with _flock(self._p("tail.lock")):
+            with open(emb_path, "ab") as fh:
+                fh.write(emb.tobytes())
+            with open(attr_path, "ab") as fh:
+                fh.write(attr.tobytes())
+            with open(ids_path, "ab") as fh:
+                fh.write(ids.tobytes())
+
+    def write_base(
+        self,
+        rows: Iterable[Tuple[Any, Sequence[float], Optional[int], Any]],
+        *,
+        model_version: str,
+        chunk: int = 10000,
+    ) -> int:
+        """
+        To'liq qayta qurish (scripts/build_flat_index.py): yangi generation base yoziladi.
+        rows: (person_id, polygons, citizen, dtb) — model_version embeddinglari.
+        Qurish boshlanguncha tail'ga yozilgan qatorlar ClickHouse'da bor (ingest avval insert qiladi) -> yangi
+        base'da; ular manifest bilan birga tail.lock ostida tashlanadi, keyingi append'lar tail'da qoladi.
+        """
+        with _flock(self._p("compact.lock")):
+            manifest = self._read_manifest(strict=False)
+            with _flock(self._p("tail.lock")):
+                # eski formatdagi tail yangi base bilan mos emas — butunlay tashlanadi
+                same_format = manifest.get("format") == FORMAT_VERSION
+                tail_start = len(self._read_tail_unlocked()[1]) if same_format else None
+            generation = int(manifest["generation"]) + 1
+            emb_path, ids_path, attr_path = self._base_paths(generation)
+
+            total = 0
+            with open(emb_path, "wb") as emb_fh, open(ids_path, "wb") as ids_fh, open(attr_path, "wb") as attr_fh:
+                buf: List[Tuple[Any, Sequence[float], Optional[int], Any]] = []
+
+                def flush() -> int:
+                    emb_fh.write(_normalized([r[1] for r in buf], self.dtype).tobytes())
+                    ids_fh.write(_uuid_bytes([r[0] for r in buf]).tobytes())
+                    attr_fh.write(_attr_rows([(r[2], r[3]) for r in buf]).tobytes())
+                    return len(buf)
+
+                for row in rows:
+                    if len(row[1]) != EMB_SIZE:
+                        continue
+                    buf.append(row)
+                    if len(buf) >= chunk:
+                        total += flush()
+                        buf = []
+                if buf:
+                    total += flush()
+
+            with _flock(self._p("tail.lock")):
+                # avval manifest: o'quvchi oraliqda yangi base + eski tail'ni ko'radi (tail ustun, dublikat yashiriladi)
+                self._write_manifest(generation, total, model_version)
+                self._drop_tail_head(tail_start)
+            self._remove_base(int(manifest["generation"]))
+        return total
+
+    def _drop_tail_head(self, rows: Optional[int]) -> None:
+        """tail.lock ostida: tail'ning birinchi `rows` qatorini tashlaydi (None -> hammasini)."""
+        if rows is None:
+            for p in self._tail_paths():
+                open(p, "wb").close()
+            return
+        if rows <= 0:
+            return
+        tail = self._read_tail_unlocked()
+        for p, arr in zip(self._tail_paths(), tail):
+            with open(p, "wb") as fh:
+                fh.write(np.ascontiguousarray(arr[rows:]).tobytes())
+
+    def _remove_base(self, generation: int) -> None:
+        # boshqa worker'larning mmap'i unlink'dan keyin ham ishlayveradi
+        for p in self._base_paths(generation):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def compact(self, *, min_tail_rows: int = 0) -> bool:
+        """tail -> yangi base; bir vaqtda faqat bitta jarayon bajaradi."""
+        with _flock(self._p("compact.lock"), blocking=False) as acquired:
+            if not acquired:
+                return False
+            with _flock(self._p("tail.lock")):
+                manifest = self._read_manifest()
+                base_emb, base_ids, base_attrs = self._open_base(manifest)
+                tail_emb, tail_ids, tail_attrs = self._read_tail_unlocked()
+                if len(tail_ids) == 0 or len(tail_ids) < min_tail_rows:
+                    return False
+
+                started = time.perf_counter()
+                ids = np.concatenate([np.asarray(base_ids), tail_ids])
+                n = len(ids)
+                # person_id bo'yicha oxirgi qator qoladi
+                _, first_in_rev = np.unique(ids.view(f"V{ID_BYTES}").ravel()[::-1], return_index=True)
+                keep = np.sort(n - 1 - first_in_rev)
+
+                generation = int(manifest["generation"]) + 1
+                emb_path, ids_path, attr_path = self._base_paths(generation)
+                nb = len(base_ids)
+                out = np.memmap(emb_path, dtype=self.dtype, mode="w+", shape=(len(keep), EMB_SIZE))
+                for start in range(0, len(keep), self.block_rows):
+                    rows = keep[start:start + self.block_rows]
+                    from_base = rows[rows < nb]
+                    from_tail = rows[rows >= nb] - nb
+                    out[start:start + len(from_base)] = base_emb[from_base]
+                    out[start + len(from_base):start + len(rows)] = tail_emb[from_tail]
+                out.flush()
+                del out
+                ids[keep].tofile(ids_path)
+                np.concatenate([np.asarray(base_attrs), tail_attrs])[keep].tofile(attr_path)
+
+                self._write_manifest(generation, len(keep), manifest.get("model_version"))
+                for p in self._tail_paths():
+                    open(p, "wb").close()
+                self._remove_base(int(manifest["generation"]))
+
+        logger.info(
+            "Flat index compacted: %d + %d -> %d rows in %.1fs",
+            nb, n - nb, len(keep), time.perf_counter() - started,
+        )
+        return True
+
+    # ------------------------------------------------------
+    # read: block scan + streaming top-k merge
+    # ------------------------------------------------------
+    @staticmethod
+    def _scan_block(
+        block: np.ndarray,
+        queries: np.ndarray,
+        k: int,
+        offset: int,
+        mask: Optional[np.ndarray] = None,
+        row_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.asarray(block, dtype=np.float32) @ queries.T  # (rows, nq) — BLAS gemm
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(k, scores.shape[0])
+        idx = np.argpartition(-scores, k - 1, axis=0)[:k]          # (k, nq)
+        top = np.take_along_axis(scores, idx, axis=0)
+        rows = row_ids[idx] if row_ids is not None else idx + offset
+        return rows.T.astype(np.int64), top.T                      # (nq, k)
+
+    def _filter_plan(self, segments, filters: Dict[str, Any]):
+        """
+        SearchFilters -> (base row ids, tail mask). Filtr yo'q bo'lsa (None, None).
+        """
+        if all(v is None for v in filters.values()):
+            return None, None
+        base_rows = self._get_attr_index().candidates(**filters)
+        tail_attrs = segments[1][2]
+        tail_mask = match_attributes(tail_attrs[:, 0], tail_attrs[:, 1], **filters)
+        return base_rows, tail_mask
+
+    def search_many(
+        self,
+        queries: Sequence[Sequence[float]],
+        *,
+        top_k: int = 10,
+        max_distance: float = 0.75,
+        citizen: Optional[int] = None,
+        dtb_from: Optional[str] = None,
+        dtb_to: Optional[str] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        q = np.asarray(queries, dtype=np.float32).reshape(-1, EMB_SIZE)
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        nq = q.shape[0]
+
+        segments, base_valid, tail_valid = self._snapshot()
+        (base_emb, base_ids, _), (tail_emb, tail_ids, _) = segments
+        nb = len(base_ids)
+        k_cand = int(top_k) * 2 + 8
+
+        base_rows, tail_mask = self._filter_plan(
+            segments, {"citizen": citizen, "dtb_from": dtb_from, "dtb_to": dtb_to},
+        )
+        # tail ustun: tail'dagi person'larning base / eski tail qatorlari baholanmaydi
+        if base_rows is not None and base_valid is not None:
+            base_rows = base_rows[base_valid[base_rows]]
+        if tail_valid is not None:
+            tail_mask = tail_valid if tail_mask is None else tail_mask & tail_valid
+
+        futures = []
+        if base_rows is not None and len(base_rows) + int(tail_mask.sum()) <= self.exact_candidates_max:
+            # kichik kandidatlar to'plami: faqat shu qatorlar exact baholanadi
+            tail_rows = np.flatnonzero(tail_mask)
+            if len(base_rows) + len(tail_rows) == 0:
+                return [[] for _ in range(nq)]
+            row_ids = np.concatenate([base_rows.astype(np.int64), tail_rows.astype(np.int64) + nb])
+            for start in range(0, len(row_ids), self.block_rows):
+                chunk = row_ids[start:start + self.block_rows]
+                block = np.concatenate([
+                    np.asarray(base_emb[chunk[chunk < nb]], dtype=np.float32),
+                    np.asarray(tail_emb[chunk[chunk >= nb] - nb], dtype=np.float32),
+                ])
+                futures.append(self._pool.submit(self._scan_block, block, q, k_cand, 0, None, chunk))
+        else:
+            # katta to'plam yoki filtrsiz: to'liq block scan (+ mask)
+            base_mask = base_valid
+            if base_rows is not None:
+                base_mask = np.zeros(nb, dtype=bool)
+                base_mask[base_rows] = True
+            for emb, mask, offset in ((base_emb, base_mask, 0), (tail_emb, tail_mask, nb)):
+                for start in range(0, len(emb), self.block_rows):
+                    block = emb[start:start + self.block_rows]
+                    block_mask = mask[start:start + self.block_rows] if mask is not None else None
+                    futures.append(
+                        self._pool.submit(self._scan_block, block, q, k_cand, offset + start, block_mask)
+                    )
+
+        best_rows = np.empty((nq, 0), dtype=np.int64)
+        best_scores = np.empty((nq, 0), dtype=np.float32)
+        for fut in as_completed(futures):
+            rows, scores = fut.result()
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > k_cand:
+                idx = np.argpartition(-best_scores, k_cand - 1, axis=1)[:, :k_cand]
+                best_rows = np.take_along_axis(best_rows, idx, axis=1)
+                best_scores = np.take_along_axis(best_scores, idx, axis=1)
+
+        results: List[List[Dict[str, Any]]] = []
+        for j in range(nq):
+            order = np.argsort(-best_scores[j])
+            seen = set()
+            out: List[Dict[str, Any]] = []
+            for i in order:
+                distance = float(1.0 - best_scores[j, i])
+                if distance > max_distance:
+                    break
+                row = int(best_rows[j, i])
+                raw = base_ids[row] if row < nb else tail_ids[row - nb]
+                pid = UUID(bytes=raw.tobytes())
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                out.append({"person_id": pid, "distance": distance})
+                if len(out) >= top_k:
+                    break
+            results.append(out)
+        return results
+
+    def search(
+        self,
+        ref_vec: Sequence[float],
+        *,
+        top_k: int = 10,
+        max_distance: float = 0.75,
+        citizen: Optional[int] = None,
+        dtb_from: Optional[str] = None,
+        dtb_to: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.search_many(
+            [ref_vec],
+            top_k=top_k,
+            max_distance=max_distance,
+            citizen=citizen,
+            dtb_from=dtb_from,
+            dtb_to=dtb_to,
+        )[0]
+
+    def stats(self) -> Dict[str, Any]:
+        segments = self._segments()
+        with self._lock:
+            attr_index = self._attr_index
+        return {
+            "generation": self._generation,
+            "dtype": self.dtype.name,
+            "model_version": self._model_version,
+            "base_rows": len(segments[0][1]),
+            "tail_rows": len(segments[1][1]),
+            "attr_index_bytes": attr_index.nbytes() if attr_index is not None else None,
+        }
+
+
+async def run_compaction_loop(store: FlatEmbeddingStore, *, interval_sec: float, min_tail_rows: int) -> None:
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            await asyncio.to_thread(store.compact, min_tail_rows=min_tail_rows)
+        except Exception as e:
+            logger.warning("Flat index compaction failed: %s", e)
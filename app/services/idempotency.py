@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.services.lru import LruCache
+
+IdempotencyKey = Tuple[int, int, str, int]
+
+
+def idempotency_key(payload) -> IdempotencyKey:
+    """Provider chegaradagi hodisasi: (border_id, sgb_person_id, reg_date, action)."""
+    reg_date = payload.reg_date
+    reg_date = reg_date.isoformat() if hasattr(reg_date, "isoformat") else str(reg_date)
+    return (int(payload.border_id), int(payload.sgb_person_id), reg_date, int(payload.action))
+
+
+class IdempotencyGuard:
+    """
+    Provider retry'lari uchun: bir xil kalit -> birinchi ingest'ning person_id'si.
+
+    - yaqinda ko'rilgan kalitlar: chegaralangan LRU (+TTL), hit -> model va ClickHouse'ga tegmaydi
+    - miss -> lookup (ClickHouse'dagi border event; sync yoki coroutine), topilsa replay
+    - bir vaqtda kelgan bir xil so'rovlar: bittasi ishlaydi, qolganlari uning natijasini kutadi
+    """
+
+    def __init__(self, capacity: int, *, ttl_sec: Optional[float] = None):
+        self.recent = LruCache(capacity, ttl_sec=ttl_sec)
+        self._inflight: Dict[IdempotencyKey, asyncio.Future] = {}
+        self.replays = 0
+
+    def remember(self, key: IdempotencyKey, person_id: Any) -> None:
+        self.recent.put(key, person_id)
+
+    def peek(self, key: IdempotencyKey) -> Optional[Any]:
+        """Yaqinda ko'rilgan kalit -> person_id (replay), aks holda None."""
+        person_id = self.recent.get(key)
+        if person_id is not None:
+            self.replays += 1
+        return person_id
+
+    def claim(self, key: IdempotencyKey) -> Optional[asyncio.Future]:
+        """
+        Kalit boshqa ingest'da bo'lsa — o'sha ingest natijasi (future, kutish kerak; replay hisoblanadi).
+        Aks holda kalit chaqiruvchiga band qilinadi (None) — resolve() bilan albatta bo'shatilishi kerak.
+        """
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.replays += 1
+            return flight
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def resolve(
+        self,
+        key: IdempotencyKey,
+        person_id: Any = None,
+        *,
+        error: Optional[BaseException] = None,
+        replay: bool = False,
+    ) -> None:
+        """claim() qilingan kalit natijasi: kutayotganlarga uzatiladi; muvaffaqiyatli bo'lsa eslab qolinadi."""
+        flight = self._inflight.pop(key, None)
+        if error is None:
+            if replay:
+                self.replays += 1
+            if person_id is not None:
+                self.remember(key, person_id)
+        if flight is None or flight.done():
+            return
+        if error is None:
+            flight.set_result(person_id)
+        else:
+            flight.set_exception(error)
+            flight.exception()  # kutuvchi bo'lmasa ham "never retrieved" ogohlantirishi chiqmasin
+
+    async def run(
+        self,
+        key: IdempotencyKey,
+        lookup: Optional[Callable[[], Any]],
+        ingest: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        person_id = self.peek(key)
+        if person_id is not None:
+            return person_id
+
+        flight = self.claim(key)
+        if flight is not None:
+            return await asyncio.shield(flight)
+
+        try:
+            person_id = lookup() if lookup is not None else None
+            if inspect.isawaitable(person_id):
+                person_id = await person_id
+            replay = person_id is not None
+            if person_id is None:
+                person_id = await ingest()
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, person_id, replay=replay)
+        return person_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.recent.stats(),
+            "replays": self.replays,
+            "inflight": len(self._inflight),
+        }
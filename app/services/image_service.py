@@ -1,6 +1,5 @@
 from __future__ import annotations
 import base64, binascii, os, asyncio
-import cv2
 import numpy as np
 
 EMB_SIZE = 512
@@ -17,15 +16,21 @@ def decode_base64(photo_b64: str) -> bytes:
         raise ImageError("Invalid base64 image") from e
 
 def decode_cv2(img_bytes: bytes) -> np.ndarray:
+    import cv2  # import qimmat: base64 / fayl yordamchilari uni talab qilmaydi
+
     arr = np.frombuffer(img_bytes, np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if img is None:
         raise ImageError("Invalid image data")
     return img
 
-async def save_bytes(path: str, data: bytes) -> None:
+def write_bytes(path: str, data: bytes) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    await asyncio.to_thread(lambda: open(path, "wb").write(data))
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+async def save_bytes(path: str, data: bytes) -> None:
+    await asyncio.to_thread(write_bytes, path, data)
 
 def zero_embedding() -> list[float]:
     return [0.0] * EMB_SIZE
@@ -0,0 +1,212 @@
+from __future__ import annotations
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lane'lar ustuvorlik tartibida: interaktiv search -> provider ingest (single / bulk / async queue)
+LANE_SEARCH = "search"
+LANE_INGEST = "ingest"
+LANES = (LANE_SEARCH, LANE_INGEST)
+
+_WAIT_SAMPLES = 2048  # har bir lane uchun oxirgi kutish vaqtlari (p50 / p99)
+
+
+class BusyError(Exception):
+    """Inference navbati to'la — so'rov boshlanmasdan rad etiladi (retry_after soniyadan keyin qayta urinish)."""
+
+    def __init__(self, retry_after: float, message: str = "Server is busy, retry later"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def lane_hint(value: Optional[str], default: str) -> str:
+    """
+    So'rovdagi lane hint (X-Inference-Lane). Faqat pasaytirish mumkin:
+    search endpoint'i o'zini ingest lane'ga qo'ya oladi (masalan, offline tekshiruvlar), aksincha emas.
+    """
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in LANES and LANES.index(value) >= LANES.index(default):
+        return value
+    return default
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class _Lane:
+    def __init__(self):
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.waiting = 0  # submit qilingan, hali slot olmagan (task boshlanmagan bo'lishi ham mumkin)
+        self.in_flight = 0
+        self.served = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.waits_ms: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits_ms)
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": round(_percentile(waits, 0.50), 2),
+            "wait_ms_p99": round(_percentile(waits, 0.99), 2),
+            "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+        }
+
+
+class InferenceGate:
+    """
+    Inference uchun admission control + ikki lane'li scheduler:
+      - bir vaqtda max_concurrency ta ish (o'z executor'ida — default executor / DB chaqiruvlari band bo'lmaydi)
+      - har bir lane'da max_queue ta kutayotgan ish; undan ortig'i darhol BusyError (load shedding)
+      - navbatda queue_timeout_sec dan ko'p kutgan ish ham BusyError
+      - bo'shagan slot avval search'ga; ingest kutayotgan bo'lsa, har 1/ingest_min_share'inchi slot ingest'ga
+    submit() sync: rad etish DB lookup'lardan oldin, so'rov boshida bo'ladi.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        *,
+        max_queue: int,
+        queue_timeout_sec: float,
+        retry_after_sec: float,
+        ingest_min_share: float = 0.2,
+        thread_initializer: Optional[Callable[[], None]] = None,
+    ):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_sec = queue_timeout_sec
+        self.retry_after_sec = retry_after_sec
+        self.ingest_min_share = min(max(float(ingest_min_share), 0.0), 0.5)
+        # ingest kutayotganda search ketma-ket shuncha slot olgach, navbatdagisi ingest'niki
+        self._search_burst = round(1.0 / self.ingest_min_share) - 1 if self.ingest_min_share > 0 else None
+        self._search_streak = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="inference",
+            initializer=thread_initializer,  # masalan CPU pinning (onnx_runtime.pinning_initializer)
+        )
+
+        self.in_flight = 0
+        self._lanes: Dict[str, _Lane] = {lane: _Lane() for lane in LANES}
+
+    # ------------------------------------------------------
+    # admission
+    # ------------------------------------------------------
+    def submit(self, fn: Callable[..., Any], *args: Any, lane: str = LANE_SEARCH, **kwargs: Any) -> asyncio.Future:
+        state = self._lanes[lane]
+        # bo'sh slotlarni oladigan (hali boshlanmagan) ishlar navbat hisobiga kirmaydi
+        queued = state.waiting - max(0, self.max_concurrency - self.in_flight)
+        if queued >= self.max_queue:
+            state.shed += 1
+            raise BusyError(self.retry_after_sec)
+        state.waiting += 1
+        queued = [True]
+        task = asyncio.ensure_future(self._run(functools.partial(fn, *args, **kwargs), lane, queued))
+        # boshlanmasdan cancel qilingan task _run'ga kirmaydi — navbat hisobi shu yerda tuzatiladi
+        task.add_done_callback(lambda _: self._dequeue(state, queued))
+        return task
+
+    @staticmethod
+    def _dequeue(state: _Lane, queued: list) -> None:
+        if queued[0]:
+            queued[0] = False
+            state.waiting -= 1
+
+    def _has_free_slot(self) -> bool:
+        return self.in_flight < self.max_concurrency and not any(s.waiters for s in self._lanes.values())
+
+    # ------------------------------------------------------
+    # scheduling
+    # ------------------------------------------------------
+    async def _acquire(self, lane: str) -> None:
+        if self._has_free_slot():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters = self._lanes[lane].waiters
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_sec)
+        except BaseException:
+            if waiter in waiters:
+                waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self._release()  # slot berilgan edi, lekin kutuvchi ketdi
+            raise
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        search = self._lanes[LANE_SEARCH].waiters
+        ingest = self._lanes[LANE_INGEST].waiters
+        for waiters in (search, ingest):
+            while waiters and waiters[0].done():
+                waiters.popleft()
+
+        if ingest and (not search or (self._search_burst is not None and self._search_streak >= self._search_burst)):
+            self._search_streak = 0
+            return ingest.popleft()
+        if search:
+            if ingest:
+                self._search_streak += 1
+            return search.popleft()
+        return None
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self.in_flight < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def _run(self, call: Callable[[], Any], lane: str, queued: list) -> Any:
+        state = self._lanes[lane]
+        started = time.monotonic()
+        try:
+            await self._acquire(lane)
+        except asyncio.TimeoutError:
+            state.shed += 1
+            state.timed_out += 1
+            raise BusyError(self.retry_after_sec)
+        finally:
+            self._dequeue(state, queued)
+
+        state.waits_ms.append((time.monotonic() - started) * 1000)
+        state.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        finally:
+            state.in_flight -= 1
+            state.served += 1
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        lanes = {lane: state.stats() for lane, state in self._lanes.items()}
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "ingest_min_share": self.ingest_min_share,
+            "in_flight": self.in_flight,
+            "queue_depth": sum(s["queue_depth"] for s in lanes.values()),
+            "served": sum(s["served"] for s in lanes.values()),
+            "shed": sum(s["shed"] for s in lanes.values()),
+            "timed_out": sum(s["timed_out"] for s in lanes.values()),
+            "lanes": lanes,
+        }
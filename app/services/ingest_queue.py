@@ -0,0 +1,266 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.inference_gate import BusyError
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt_id  TEXT NOT NULL UNIQUE,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    person_id   TEXT,
+    message     TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_seq ON jobs (status, seq);
+"""
+
+
+class IngestQueue:
+    """
+    Lokal durable ingest navbati (SQLite, WAL). Tashqi servis kerak emas.
+
+    enqueue -> receipt_id (darhol); worker'lar claim() bilan partiya oladi, natija complete()/fail().
+    Bir nechta gunicorn worker bitta faylni bo'lishadi: claim BEGIN IMMEDIATE ichida.
+    processing holatida qolib ketgan (crash) job'lar visibility_sec dan keyin qayta navbatga qaytadi
+    (max_attempts urinishdan keyin — error).
+    """
+
+    def __init__(self, path: str, *, visibility_sec: float = 300.0, max_attempts: int = 3):
+        self.path = path
+        self.visibility_sec = visibility_sec
+        self.max_attempts = max_attempts
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ------------------------------------------------------
+    # producer
+    # ------------------------------------------------------
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        receipt_id = str(uuid.uuid4())
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (receipt_id, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (receipt_id, json.dumps(payload, default=str), STATUS_QUEUED, now, now),
+            )
+        finally:
+            conn.close()
+        return receipt_id
+
+    # ------------------------------------------------------
+    # consumer
+    # ------------------------------------------------------
+    def claim(self, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # crash bo'lgan worker'lar qoldirgan job'lar: max_attempts tugagan bo'lsa -> error (worker'ni qayta
+            # yiqitadigan "zaharli" job cheksiz aylanmaydi)
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    message = CASE WHEN attempts >= ? THEN ? ELSE message END,
+                    worker = NULL, updated_at = ?
+                WHERE status = ? AND updated_at < ?
+                """,
+                (
+                    self.max_attempts, STATUS_ERROR, STATUS_QUEUED,
+                    self.max_attempts, "Worker did not finish the job (visibility timeout)",
+                    now, STATUS_PROCESSING, now - self.visibility_sec,
+                ),
+            )
+            rows = conn.execute(
+                "SELECT seq, receipt_id, payload FROM jobs WHERE status = ? ORDER BY seq LIMIT ?",
+                (STATUS_QUEUED, int(limit)),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, updated_at = ? WHERE seq = ?",
+                    [(STATUS_PROCESSING, self.worker_id, now, seq) for seq, _, _ in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [(receipt_id, json.loads(payload)) for _, receipt_id, payload in rows]
+
+    def finish(self, results: List[Tuple[str, Optional[str], Optional[str]]]) -> None:
+        """results: (receipt_id, person_id | None, xato matni | None)."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "UPDATE jobs SET status = ?, person_id = ?, message = ?, worker = NULL, updated_at = ? WHERE receipt_id = ?",
+                [
+                    (STATUS_DONE if message is None else STATUS_ERROR, person_id, message, now, receipt_id)
+                    for receipt_id, person_id, message in results
+                ],
+            )
+        finally:
+            conn.close()
+
+    def release(self, receipt_ids: List[str], message: str, *, count_attempt: bool = True) -> None:
+        """
+        Vaqtinchalik xato: max_attempts gacha qayta navbatga, keyin error.
+        count_attempt=False (inference band — load shedding): urinish hisoblanmaydi.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            if not count_attempt:
+                conn.executemany(
+                    "UPDATE jobs SET status = ?, attempts = max(attempts - 1, 0), message = ?, worker = NULL, "
+                    "updated_at = ? WHERE receipt_id = ?",
+                    [(STATUS_QUEUED, message, now, r) for r in receipt_ids],
+                )
+                return
+            conn.executemany(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    message = ?, worker = NULL, updated_at = ?
+                WHERE receipt_id = ?
+                """,
+                [(self.max_attempts, STATUS_ERROR, STATUS_QUEUED, message, now, r) for r in receipt_ids],
+            )
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------
+    # status
+    # ------------------------------------------------------
+    def status(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT status, person_id, message, attempts, created_at, updated_at FROM jobs WHERE receipt_id = ?",
+                (receipt_id,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            "receipt_id": receipt_id,
+            "status": row[0],
+            "person_id": row[1],
+            "message": row[2],
+            "attempts": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        return {status: count for status, count in rows}
+
+    def purge(self, older_than_sec: float) -> int:
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (STATUS_DONE, STATUS_ERROR, time.time() - older_than_sec),
+            )
+            return cur.rowcount
+        finally:
+            conn.close()
+
+
+# ----------------------------------------------------------
+# Background drain: navbat -> ProviderIngestService.ingest_many
+# ----------------------------------------------------------
+async def run_queue_worker(
+    queue: IngestQueue,
+    build_service: Callable[[], Any],
+    parse_payload: Callable[[Dict[str, Any]], Any],
+    *,
+    batch_size: int,
+    poll_sec: float,
+    retention_sec: float,
+    ready: Callable[[], bool] = lambda: True,
+) -> None:
+    last_purge = time.monotonic()
+    while True:
+        if not ready():
+            # model yuklanmagan / warm-up tugamagan — navbat kutadi
+            await asyncio.sleep(poll_sec)
+            continue
+
+        try:
+            jobs = await asyncio.to_thread(queue.claim, batch_size)
+        except Exception as e:
+            logger.warning("Ingest queue claim failed: %s", e)
+            jobs = []
+
+        if not jobs:
+            if time.monotonic() - last_purge >= 3600:
+                try:
+                    await asyncio.to_thread(queue.purge, retention_sec)
+                except Exception as e:
+                    logger.warning("Ingest queue purge failed: %s", e)
+                last_purge = time.monotonic()
+            await asyncio.sleep(poll_sec)
+            continue
+
+        receipt_ids = [receipt_id for receipt_id, _ in jobs]
+        try:
+            service = build_service()
+            payloads = [parse_payload(payload) for _, payload in jobs]
+            results = await service.ingest_many(payloads)
+        except BusyError as e:
+            # interaktiv trafik ustun — navbat ishlari kutadi, urinishlar sarflanmaydi
+            await asyncio.to_thread(queue.release, receipt_ids, str(e), count_attempt=False)
+            await asyncio.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            logger.error("Ingest queue batch failed: %s", e)
+            await asyncio.to_thread(queue.release, receipt_ids, str(e))
+            continue
+
+        # inference band bo'lib qolgan yozuvlar (oldingi guruhlar yozilgan) — navbatga qaytadi
+        busy = [(receipt_id, message) for receipt_id, (_, message) in zip(receipt_ids, results)
+                if isinstance(message, BusyError)]
+        await asyncio.to_thread(
+            queue.finish,
+            [(receipt_id, str(pid) if pid is not None else None, message)
+             for receipt_id, (pid, message) in zip(receipt_ids, results) if not isinstance(message, BusyError)],
+        )
+        if busy:
+            await asyncio.to_thread(queue.release, [r for r, _ in busy], str(busy[0][1]), count_attempt=False)
+            await asyncio.sleep(busy[0][1].retry_after)
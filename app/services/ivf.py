@@ -0,0 +1,182 @@
+from __future__ import annotations
+import asyncio
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMB_SIZE = 512
+UNASSIGNED_CLUSTER = 0
+# yangi versiyalarda cluster_id = version * CLUSTER_ID_STRIDE + index + 1 — versiyalar orasida kesishmaydi
+CLUSTER_ID_STRIDE = 1 << 16
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def train_kmeans(
+    samples: np.ndarray,
+    nlist: int,
+    *,
+    iters: int = 20,
+    seed: int = 0,
+    batch: int = 65536,
+) -> np.ndarray:
+    """
+    Spherical k-means (cosine): normallashtirilgan embeddinglar ustida, centroidlar ham normallashtiriladi.
+    Qaytaradi: (nlist, 512) float32.
+    """
+    x = _normalize(np.asarray(samples, dtype=np.float32))
+    if len(x) < nlist:
+        raise ValueError(f"Not enough samples for {nlist} clusters: {len(x)}")
+
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=nlist, replace=False)].copy()
+
+    for it in range(iters):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(nlist, dtype=np.int64)
+        for start in range(0, len(x), batch):
+            chunk = x[start:start + batch]
+            assign = np.argmax(chunk @ centroids.T, axis=1)
+            np.add.at(sums, assign, chunk)
+            counts += np.bincount(assign, minlength=nlist)
+
+        empty = counts == 0
+        if empty.any():
+            # bo'sh klasterlar tasodifiy nuqtalar bilan qayta boshlanadi
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+        logger.info("kmeans iter %d/%d, empty clusters: %d", it + 1, iters, int(empty.sum()))
+
+    return centroids.astype(np.float32)
+
+
+def cluster_ids_for(version: int, nlist: int) -> np.ndarray:
+    if nlist >= CLUSTER_ID_STRIDE:
+        raise ValueError(f"nlist must be below {CLUSTER_ID_STRIDE}: {nlist}")
+    return int(version) * CLUSTER_ID_STRIDE + np.arange(1, nlist + 1, dtype=np.int64)
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """(n, 512) -> (n,) cluster_id (1..nlist)."""
+    x = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, EMB_SIZE))
+    return np.argmax(x @ np.asarray(centroids, dtype=np.float32).T, axis=1) + 1
+
+
+class _CentroidSet:
+    def __init__(self, version: int, cluster_ids: Sequence[int], centroids: Sequence[Sequence[float]]):
+        self.version = int(version)
+        self.cluster_ids = np.asarray(cluster_ids, dtype=np.int64)
+        self.centroids = _normalize(np.asarray(centroids, dtype=np.float32).reshape(-1, EMB_SIZE))
+
+    def scores(self, vec: np.ndarray) -> np.ndarray:
+        return self.centroids @ vec
+
+    def top(self, vec: np.ndarray, nprobe: int) -> List[int]:
+        scores = self.scores(vec)
+        nprobe = max(1, min(int(nprobe), len(scores)))
+        return [int(self.cluster_ids[i]) for i in np.argpartition(-scores, nprobe - 1)[:nprobe]]
+
+
+class IvfCentroids:
+    """
+    Faol IVF centroidlar + (train_ivf backfill davomida) yangi "pending" versiya.
+    cluster_id'lar ivf_centroids'dan o'qiladi (cluster_ids_for) — versiyalar kesishmaydi.
+    Ingest: assign() -> pending bo'lsa shu versiya bo'yicha (backfill ham qatorlarni shu versiyaga o'tkazadi).
+    Search: probe() -> UNASSIGNED_CLUSTER + har bir yuklangan versiyadan nprobe ta eng yaqin klaster:
+    qayta tayinlash davomida eski va yangi id'li qatorlar ham, hali tayinlanmaganlar ham topiladi.
+    Eski versiya faqat train_ivf uni faollashtirgandan (mutation'lar tugagandan) keyin tushadi.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Optional[_CentroidSet] = None
+        self._pending: Optional[_CentroidSet] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._active is not None or self._pending is not None
+
+    @property
+    def version(self) -> Optional[int]:
+        active = self._active
+        return active.version if active is not None else None
+
+    @property
+    def pending_version(self) -> Optional[int]:
+        pending = self._pending
+        return pending.version if pending is not None else None
+
+    def set(
+        self,
+        version: Optional[int],
+        cluster_ids: Sequence[int] = (),
+        centroids: Sequence[Sequence[float]] = (),
+        *,
+        pending: Optional[Tuple[int, Sequence[int], Sequence[Sequence[float]]]] = None,
+    ) -> None:
+        active = _CentroidSet(version, cluster_ids, centroids) if version is not None else None
+        pending_set = _CentroidSet(*pending) if pending is not None else None
+        with self._lock:
+            self._active = active
+            self._pending = pending_set
+
+    def refresh(self, ivf_repo) -> bool:
+        active, pending = ivf_repo.centroid_versions()
+        if (active, pending) == (self.version, self.pending_version):
+            return self.ready
+
+        loaded = {}
+        for version in (active, pending):
+            if version is None:
+                continue
+            data = ivf_repo.load_centroids(version)
+            if data is None:
+                raise RuntimeError(f"IVF centroids version {version} has no rows")
+            loaded[version] = data
+        self.set(
+            active,
+            *(loaded[active] if active is not None else ((), ())),
+            pending=(pending, *loaded[pending]) if pending is not None else None,
+        )
+        logger.info(
+            "IVF centroids loaded: active=%s pending=%s nlist=%s",
+            active, pending, {v: len(c) for v, (_, c) in loaded.items()},
+        )
+        return self.ready
+
+    def _sets(self) -> List[_CentroidSet]:
+        with self._lock:
+            return [s for s in (self._active, self._pending) if s is not None]
+
+    def assign(self, vec: Sequence[float]) -> int:
+        with self._lock:
+            target = self._pending or self._active
+        if target is None:
+            return UNASSIGNED_CLUSTER
+        scores = target.scores(_normalize(np.asarray(vec, dtype=np.float32).reshape(EMB_SIZE)))
+        return int(target.cluster_ids[int(np.argmax(scores))])
+
+    def probe(self, vec: Sequence[float], nprobe: int) -> Optional[List[int]]:
+        sets = self._sets()
+        if not sets:
+            return None
+        q = _normalize(np.asarray(vec, dtype=np.float32).reshape(EMB_SIZE))
+        clusters = [UNASSIGNED_CLUSTER]
+        for centroid_set in sets:
+            clusters.extend(centroid_set.top(q, nprobe))
+        return clusters
+
+
+async def run_centroid_refresh_loop(centroids: IvfCentroids, ivf_repo, *, interval_sec: float) -> None:
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            await asyncio.to_thread(centroids.refresh, ivf_repo)
+        except Exception as e:
+            logger.warning("IVF centroid refresh failed: %s", e)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_MISSING = object()
+
+
+def approx_size(value: Any) -> int:
+    """Qiymatning taxminiy xotira hajmi (bayt): konteynerlar ichigacha."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v) for v in value)
+    return size
+
+
+class LruCache:
+    """
+    Thread-safe LRU (+ ixtiyoriy TTL va bayt limiti). Qiymat sifatida None ham saqlanadi —
+    get() topilmaganda `default` qaytaradi.
+
+    Versiyalash: invalidate() har safar epoch'ni oshiradi. Loader so'rovdan oldin epoch'ni oladi
+    va put_many(..., since_epoch=...) bilan yozadi — oraliqda invalidatsiya qilingan kalitlar
+    eski qiymat bilan qayta to'ldirilmaydi.
+    """
+
+    def __init__(self, capacity: int, *, ttl_sec: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.capacity = int(capacity)
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self.epoch = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # self._lock ostida chaqiriladi
+    def _lookup(self, key: Hashable, now: float) -> Any:
+        item = self._items.get(key, _MISSING)
+        if item is _MISSING:
+            return _MISSING
+        stored_at, size, value = item
+        if self.ttl_sec is not None and now - stored_at >= self.ttl_sec:
+            del self._items[key]
+            self.bytes -= size
+            return _MISSING
+        self._items.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        size = approx_size(value)
+        self._items[key] = (now, size, value)
+        self.bytes += size
+        while self._items and (
+            len(self._items) > self.capacity
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            _, (_, evicted_size, _) = self._items.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key, time.monotonic())
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """(topilganlar, topilmagan kalitlar)."""
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._lookup(key, now)
+                if value is _MISSING:
+                    missing.append(key)
+                else:
+                    found[key] = value
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def put_many(self, values: Dict[Hashable, Any], *, since_epoch: Optional[int] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for key, value in values.items():
+                if since_epoch is not None and self._invalidated.get(key, -1) > since_epoch:
+                    continue
+                self._store(key, value, now)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self.epoch += 1
+            self.invalidations += 1
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._invalidated[key] = self.epoch
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.capacity:
+                self._invalidated.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "capacity": self.capacity,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
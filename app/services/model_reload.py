@@ -0,0 +1,237 @@
+from __future__ import annotations
+import asyncio
+import fcntl
+import gc
+import json
+import logging
+import os
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.process_stats import memory_usage, peak_rss_mb, reset_peak_rss
+
+logger = logging.getLogger(__name__)
+
+
+class ModelReloader:
+    """
+    Restart'siz model almashtirish:
+      1) load(version, **prepare) — yangi face_app fonda (thread'da) quriladi
+      2) warm(face_app) — warm-up, eski instance so'rovlarga xizmat qilishda davom etadi
+      3) swap(version, face_app) -> eski instance — event loop'da, await'siz (so'rovlar uchun atomar)
+      4) eski instance'ga tegishli so'rovlar (service obyektlari) tugaguncha kutiladi, keyin bo'shatiladi
+    Bir vaqtda bitta reload.
+    """
+
+    def __init__(
+        self,
+        *,
+        load: Callable[..., Any],
+        warm: Callable[[Any], Dict[str, Any]],
+        swap: Callable[[str, Any], Any],
+        release_timeout_sec: float,
+    ):
+        self._load = load
+        self._warm = warm
+        self._swap = swap
+        self.release_timeout_sec = release_timeout_sec
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[Dict[str, Any]] = None
+        self.last: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, version: str, **prepare: Any) -> bool:
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run(version, prepare))
+        return True
+
+    async def _run(self, version: str, prepare: Dict[str, Any]) -> None:
+        report: Dict[str, Any] = {
+            "version": version,
+            "prepare": prepare,
+            "status": "loading",
+            "started_at": time.time(),
+            "memory_before": memory_usage(),
+        }
+        self.current = report
+        started = time.perf_counter()
+        reset_peak_rss()
+        try:
+            t0 = time.perf_counter()
+            new_app = await asyncio.to_thread(self._load, version, **prepare)
+            report["load_sec"] = round(time.perf_counter() - t0, 2)
+
+            report["status"] = "warming"
+            t0 = time.perf_counter()
+            report["warmup"] = await asyncio.to_thread(self._warm, new_app)
+            report["warmup_sec"] = round(time.perf_counter() - t0, 2)
+
+            old = self._swap(version, new_app)
+            old_ref = weakref.ref(old) if old is not None else None
+            del new_app, old
+            report["status"] = "draining"
+            report["swapped_sec"] = round(time.perf_counter() - started, 2)
+            logger.info("Model %s swapped after %.2fs, draining the old instance", version, report["swapped_sec"])
+
+            report["old_released"], report["release_wait_sec"] = await self._wait_released(old_ref)
+            report["status"] = "done"
+        except Exception as e:
+            logger.error("Model %s reload failed, keeping the current instance: %s", version, e)
+            report["status"] = "failed"
+            report["error"] = str(e)
+        finally:
+            report["total_sec"] = round(time.perf_counter() - started, 2)
+            report["peak_rss_mb"] = peak_rss_mb()
+            report["memory_after"] = memory_usage()
+            self.current = None
+            self.last = report
+            logger.info(f"Model reload finished: {report}")
+
+    async def _wait_released(self, old_ref: Optional[weakref.ref]):
+        """Eski face_app'ga oxirgi havola (so'rov service'i / gate ishi) yo'qolguncha."""
+        started = time.perf_counter()
+        while old_ref is not None and old_ref() is not None:
+            if time.perf_counter() - started > self.release_timeout_sec:
+                logger.warning("Old model instance still referenced after %.0fs", self.release_timeout_sec)
+                return False, round(time.perf_counter() - started, 2)
+            await asyncio.sleep(0.5)
+            gc.collect()
+        return True, round(time.perf_counter() - started, 2)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "current": self.current, "last": self.last}
+
+
+class ReloadBroadcast:
+    """
+    Ko'p worker'li rejim: /admin/model/reload faqat bitta worker'ga tushadi, shuning uchun so'rov
+    <path>/request.json ga yangi generation sifatida yoziladi va har bir worker uni poll qilib o'z
+    ModelReloader'ini ishga tushiradi. reload.lock: bir vaqtda bitta worker reload qiladi (xotira cho'qqisi
+    bitta model, qolgan worker'lar eski instance bilan xizmat qiladi).
+    Har bir worker holati <path>/workers/<pid>.json da (GET /admin/model hammasini ko'rsatadi).
+    request.json "versions": har bir versiyaning oxirgi reload'i — gunicorn qayta tug'dirgan worker startup'da
+    shularni o'zi qo'llaydi (reloaded_versions), master'dagi reload'dan oldingi og'irliklar bilan qolmaydi.
+    """
+
+    def __init__(self, path: str, reloader: ModelReloader, *, poll_sec: float):
+        self.path = path
+        self.reloader = reloader
+        self.poll_sec = poll_sec
+        self.pid = os.getpid()
+        os.makedirs(os.path.join(path, "workers"), exist_ok=True)
+        # startup'dagi worker joriy modelni allaqachon yuklagan — oldingi so'rovlar qayta bajarilmaydi
+        self.seen = int(self._read_json(self._p("request.json")).get("generation", 0))
+        self._reload_lock: Optional[Any] = None
+
+    def _p(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _read_json(path: str) -> Dict[str, Any]:
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_json(path: str, data: Dict[str, Any]) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(data, fh, default=str)
+        os.replace(tmp, path)
+
+    def request(self, version: str, **prepare: Any) -> int:
+        with open(self._p("request.lock"), "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            current = self._read_json(self._p("request.json"))
+            generation = int(current.get("generation", 0)) + 1
+            versions = dict(current.get("versions") or {})
+            versions[version] = {"generation": generation, "prepare": prepare}
+            self._write_json(self._p("request.json"), {
+                "generation": generation,
+                "versions": versions,
+                "version": version,
+                "prepare": prepare,
+                "requested_at": time.time(),
+                "requested_by": self.pid,
+            })
+        return generation
+
+    @classmethod
+    def reloaded_versions(cls, path: str) -> Dict[str, Dict[str, Any]]:
+        """{version: {"generation", "prepare"}} — startup'da (ReloadBroadcast yaratilishidan oldin) o'qiladi."""
+        return cls._read_json(os.path.join(path, "request.json")).get("versions") or {}
+
+    def requested(self) -> Dict[str, Any]:
+        return self._read_json(self._p("request.json"))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self._poll()
+                self._write_status()
+            except Exception as e:
+                logger.warning("Model reload broadcast poll failed: %s", e)
+            await asyncio.sleep(self.poll_sec)
+
+    def _poll(self) -> None:
+        if self._reload_lock is not None and not self.reloader.running:
+            self._reload_lock.close()  # flock bo'shaydi -> navbatdagi worker
+            self._reload_lock = None
+
+        req = self.requested()
+        generation = int(req.get("generation", 0))
+        if generation <= self.seen or self.reloader.running:
+            return
+
+        fh = open(self._p("reload.lock"), "a+")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fh.close()  # boshqa worker reload qilyapti — keyingi poll'da
+            return
+        if not self.reloader.start(req["version"], **(req.get("prepare") or {})):
+            fh.close()
+            return
+        self._reload_lock = fh
+        self.seen = generation
+        logger.info("Worker %d started model reload generation %d", self.pid, generation)
+
+    def _write_status(self) -> None:
+        self._write_json(self._p(os.path.join("workers", f"{self.pid}.json")), {
+            "pid": self.pid,
+            "generation": self.seen,
+            "updated_at": time.time(),
+            **self.reloader.stats(),
+        })
+
+    def workers(self) -> List[Dict[str, Any]]:
+        """Tirik worker'lar holati; o'lgan pid fayllari o'chiriladi."""
+        out = []
+        workers_dir = self._p("workers")
+        for name in sorted(os.listdir(workers_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(workers_dir, name)
+            status = self._read_json(path)
+            pid = int(status.get("pid") or 0)
+            if not pid:
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            except PermissionError:
+                pass
+            out.append(status)
+        return out
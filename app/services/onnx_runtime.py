@@ -0,0 +1,312 @@
+from __future__ import annotations
+import glob
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence
+
+# onnxruntime / insightface shu yerda import qilinmaydi: faqat model yuklanganda (cold start, script'lar)
+
+logger = logging.getLogger(__name__)
+
+_EXECUTION_MODES = {
+    "sequential": "ORT_SEQUENTIAL",
+    "parallel": "ORT_PARALLEL",
+}
+_GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+@dataclass
+class OrtConfig:
+    """
+    ONNX Runtime session sozlamalari (barcha insightface modellari uchun bir xil).
+    intra_op_threads = 0 -> cpu_count / parallel inference soni (oversubscription bo'lmasin).
+    """
+
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    execution_mode: str = "sequential"
+    graph_optimization_level: str = "all"
+    cpu_mem_arena: bool = True
+    providers: Sequence[str] = ("CUDAExecutionProvider", "CPUExecutionProvider")
+    # shared (preload) og'irliklar bilan: MatMul/Gemm prepack har bir process'da xususiy nusxa yaratadi
+    disable_prepacking: bool = False
+
+    def resolved_intra_threads(self, concurrency: int) -> int:
+        if self.intra_op_threads > 0:
+            return self.intra_op_threads
+        return max(1, (os.cpu_count() or 1) // max(1, concurrency))
+
+
+def session_options(config: OrtConfig, *, concurrency: int = 1, graph_optimization_level: Optional[str] = None):
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = config.resolved_intra_threads(concurrency)
+    if config.inter_op_threads > 0:
+        opts.inter_op_num_threads = config.inter_op_threads
+    opts.execution_mode = getattr(ort.ExecutionMode, _EXECUTION_MODES[config.execution_mode])
+    opts.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel,
+        _GRAPH_OPT_LEVELS[graph_optimization_level or config.graph_optimization_level],
+    )
+    opts.enable_cpu_mem_arena = config.cpu_mem_arena
+    opts.log_severity_level = 3
+    if config.disable_prepacking:
+        opts.add_session_config_entry("session.disable_prepacking", "1")
+    return opts
+
+
+def available_providers(requested: Sequence[str]) -> List[str]:
+    import onnxruntime as ort
+
+    available = set(ort.get_available_providers())
+    providers = [p for p in requested if p in available]
+    return providers or ["CPUExecutionProvider"]
+
+
+# ----------------------------------------------------------
+# insightface model pack -> o'zimizning session'lar bilan
+# ----------------------------------------------------------
+def route_model(onnx_file: str, session) -> Any:
+    """insightface ModelRouter bilan bir xil tanlov, lekin tayyor session bilan (SessionOptions bizniki)."""
+    from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+    from insightface.model_zoo.attribute import Attribute
+    from insightface.model_zoo.landmark import Landmark
+    from insightface.model_zoo.retinaface import RetinaFace
+
+    inputs = session.get_inputs()
+    input_shape = inputs[0].shape
+    outputs = session.get_outputs()
+
+    if len(outputs) >= 5:
+        return RetinaFace(model_file=onnx_file, session=session)
+    if input_shape[2] == 192 and input_shape[3] == 192:
+        return Landmark(model_file=onnx_file, session=session)
+    if input_shape[2] == 96 and input_shape[3] == 96:
+        return Attribute(model_file=onnx_file, session=session)
+    if input_shape[2] == input_shape[3] and input_shape[2] >= 112 and input_shape[2] % 16 == 0:
+        return ArcFaceONNX(model_file=onnx_file, session=session)
+    return None
+
+
+def optimized_model_path(cache_dir: str, onnx_file: str, config: OrtConfig, providers: Sequence[str]) -> str:
+    """
+    Kalit: manba fayl (yo'l, hajm, mtime) + optimizatsiya darajasi + provider'lar + onnxruntime versiyasi.
+    Optimallashtirilgan graph shu muhitga xos (masalan CPU layout node'lari) — boshqa muhitda qayta quriladi.
+    """
+    import onnxruntime as ort
+
+    st = os.stat(onnx_file)
+    key = "|".join([
+        os.path.abspath(onnx_file), str(st.st_size), str(int(st.st_mtime)),
+        config.graph_optimization_level, ",".join(providers), ort.__version__,
+    ])
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(onnx_file))[0]
+    return os.path.join(cache_dir, f"{name}.{digest}.onnx")
+
+
+def create_session(
+    onnx_file: str,
+    config: OrtConfig,
+    providers: Sequence[str],
+    *,
+    concurrency: int,
+    cache_dir: Optional[str] = None,
+):
+    """
+    cache_dir berilsa: birinchi yuklashda optimallashtirilgan graph diskka yoziladi (optimized_model_filepath),
+    keyingi start'larda shu fayl optimizatsiyasiz yuklanadi.
+    """
+    import onnxruntime as ort
+
+    if not cache_dir or config.graph_optimization_level == "disable":
+        opts = session_options(config, concurrency=concurrency)
+        return ort.InferenceSession(onnx_file, sess_options=opts, providers=list(providers))
+
+    cached = optimized_model_path(cache_dir, onnx_file, config, providers)
+    if os.path.exists(cached):
+        try:
+            opts = session_options(config, concurrency=concurrency, graph_optimization_level="disable")
+            return ort.InferenceSession(cached, sess_options=opts, providers=list(providers))
+        except Exception as e:
+            logger.warning("Cached optimized model %s is unusable, rebuilding: %s", cached, e)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    opts = session_options(config, concurrency=concurrency)
+    opts.optimized_model_filepath = tmp
+    session = ort.InferenceSession(onnx_file, sess_options=opts, providers=list(providers))
+    try:
+        os.replace(tmp, cached)  # bir nechta worker bir vaqtda yozsa ham fayl butun bo'ladi
+    except OSError as e:
+        logger.warning("Could not store optimized model %s: %s", cached, e)
+    return session
+
+
+# ----------------------------------------------------------
+# preload-and-fork: og'irliklar master'da, session'lar worker'da
+# ----------------------------------------------------------
+@dataclass
+class SharedWeights:
+    """
+    Fork'dan oldin (gunicorn master) o'qilgan og'irliklar. Worker'lar ularni copy-on-write orqali bitta
+    nusxada o'qiydi: session add_initializer bilan shu numpy buferlarini ko'chirmasdan ishlatadi.
+    Refcount yozuvlari faqat ndarray obyekt sarlavhasiga tegadi, data sahifalari umumiy qoladi.
+    """
+
+    model_path: str  # graph (optimallashtirilgan cache yoki asl fayl)
+    initializers: Dict[str, Any]  # name -> numpy array (C-contiguous)
+    optimized: bool = False  # model_path allaqachon optimallashtirilgan — worker'da qayta optimizatsiya yo'q
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(a.nbytes) for a in self.initializers.values())
+
+
+def preload_weights(onnx_file: str, config: OrtConfig, providers: Sequence[str], *, cache_dir: Optional[str]) -> SharedWeights:
+    """
+    Master process'da chaqiriladi — thread pool yaratmaydi: optimallashtirilgan graph kerak bo'lsa
+    bir thread'li session bilan quriladi va darhol tashlanadi (thread'lar fork'dan o'tmaydi).
+    """
+    import numpy as np
+    import onnx
+    from onnx import numpy_helper
+
+    model_path = onnx_file
+    if cache_dir and config.graph_optimization_level != "disable":
+        cached = optimized_model_path(cache_dir, onnx_file, config, providers)
+        if not os.path.exists(cached):
+            single = replace(config, intra_op_threads=1, inter_op_threads=1, execution_mode="sequential")
+            create_session(onnx_file, single, providers, concurrency=1, cache_dir=cache_dir)
+        if os.path.exists(cached):
+            model_path = cached
+        # aks holda cache yozilmadi — worker'lar asl graph'ni optimallashtiradi
+
+    graph = onnx.load(model_path).graph
+    initializers = {
+        init.name: np.ascontiguousarray(numpy_helper.to_array(init))
+        for init in graph.initializer
+    }
+    return SharedWeights(model_path=model_path, initializers=initializers, optimized=model_path != onnx_file)
+
+
+def create_shared_session(shared: SharedWeights, config: OrtConfig, providers: Sequence[str], *, concurrency: int):
+    """Worker'da (fork'dan keyin): thread pool'lar shu process'da, og'irliklar master'niki."""
+    import onnxruntime as ort
+
+    level = "disable" if shared.optimized else None
+    opts = session_options(config, concurrency=concurrency, graph_optimization_level=level)
+    # OrtValue numpy xotirasiga ishora qiladi (nusxa yo'q); session'dan uzoq yashashi kerak
+    values = []
+    for name, array in shared.initializers.items():
+        value = ort.OrtValue.ortvalue_from_numpy(array)
+        opts.add_initializer(name, value)
+        values.append(value)
+    session = ort.InferenceSession(shared.model_path, sess_options=opts, providers=list(providers))
+    session._shared_initializers = values
+    return session
+
+
+def load_model_pack(
+    model_dir: str,
+    config: OrtConfig,
+    *,
+    concurrency: int,
+    cache_dir: Optional[str] = None,
+    allowed_modules: Optional[Sequence[str]] = None,
+    shared: Optional[Dict[str, SharedWeights]] = None,
+) -> Dict[str, Any]:
+    """shared: preload_model_pack natijasi (onnx fayl -> SharedWeights); yo'q bo'lsa oddiy session'lar."""
+    providers = available_providers(config.providers)
+    models: Dict[str, Any] = {}
+    for onnx_file in sorted(glob.glob(os.path.join(model_dir, "*.onnx"))):
+        started = time.perf_counter()
+        if shared and onnx_file in shared:
+            session = create_shared_session(shared[onnx_file], config, providers, concurrency=concurrency)
+        else:
+            session = create_session(onnx_file, config, providers, concurrency=concurrency, cache_dir=cache_dir)
+        # model_file — asl fayl: ArcFaceONNX input_mean/std'ni asl graph node'laridan aniqlaydi
+        model = route_model(onnx_file, session)
+        logger.info("ONNX model %s loaded in %.2fs", os.path.basename(onnx_file), time.perf_counter() - started)
+        if model is None:
+            logger.warning("ONNX model not recognized: %s", onnx_file)
+            continue
+        if allowed_modules is not None and model.taskname not in allowed_modules:
+            continue
+        if model.taskname in models:
+            logger.warning("Duplicated model task %s, ignoring %s", model.taskname, onnx_file)
+            continue
+        models[model.taskname] = model
+    return models
+
+
+def preload_model_pack(model_dir: str, config: OrtConfig, *, cache_dir: Optional[str] = None) -> Dict[str, SharedWeights]:
+    """
+    add_initializer faqat CPU provider uchun: GPU bo'lsa og'irliklar baribir device'ga ko'chadi —
+    bo'sh dict (worker'lar oddiy session yaratadi).
+    """
+    providers = available_providers(config.providers)
+    if providers[0] != "CPUExecutionProvider":
+        logger.warning("Weight preload skipped: provider %s is not CPU", providers[0])
+        return {}
+
+    shared: Dict[str, SharedWeights] = {}
+    for onnx_file in sorted(glob.glob(os.path.join(model_dir, "*.onnx"))):
+        shared[onnx_file] = preload_weights(onnx_file, config, providers, cache_dir=cache_dir)
+        logger.info(
+            "ONNX weights %s preloaded: %.1f MB",
+            os.path.basename(onnx_file), shared[onnx_file].nbytes / 2**20,
+        )
+    return shared
+
+
+# ----------------------------------------------------------
+# inference executor: ixtiyoriy CPU pinning
+# ----------------------------------------------------------
+def parse_cpu_list(raw: str) -> List[int]:
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cores: List[int] = []
+    for part in (raw or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cores.extend(range(int(lo), int(hi or lo) + 1))
+    return cores
+
+
+def pinning_initializer(cores: Sequence[int], cores_per_thread: int):
+    """
+    ThreadPoolExecutor(initializer=...) uchun: har bir worker thread o'z core'lar bo'lagiga bog'lanadi.
+    Linux'da sched_setaffinity(0) faqat chaqirgan thread'ga ta'sir qiladi; intra_op_threads=1 bo'lsa
+    hisob ham shu thread'da bajariladi.
+    """
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return None
+
+    step = max(1, int(cores_per_thread))
+    slices = [list(cores[i:i + step]) for i in range(0, len(cores), step)]
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def pin() -> None:
+        with lock:
+            n = next(counter)
+        target = set(slices[n % len(slices)])
+        try:
+            os.sched_setaffinity(0, target)
+        except OSError as e:
+            logger.warning("CPU pinning to %s failed: %s", sorted(target), e)
+
+    return pin
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import fcntl
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator
+
+
+class PersonLocks:
+    """
+    Kalit (person_id / sgb_person_id) bo'yicha process'lararo lock: template gallery read-modify-write (load -> pick_template_slot ->
+    upsert) bitta person uchun bir vaqtda bitta joyda (gunicorn worker'lar, queue worker'lar, reembed).
+
+    Bitta fayl, stripes ta bayt: person_id -> crc32 % stripes bo'lagi (fcntl.lockf byte-range). Bir nechta
+    person bitta chaqiruvda (bulk) — bo'laklar tartib bilan olinadi (deadlock yo'q). Bitta host doirasida.
+    lockf process ichida qayta kirishli — shuning uchun har bir bo'lakda threading.Lock ham (executor thread'lari).
+    """
+
+    def __init__(self, path: str, *, stripes: int = 4096):
+        self.path = path
+        self.stripes = max(1, int(stripes))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._guard = threading.Lock()
+        self._local: Dict[int, threading.Lock] = {}
+
+    def stripe(self, person_id: Any) -> int:
+        return zlib.crc32(str(person_id).encode("utf-8")) % self.stripes
+
+    @contextmanager
+    def hold(self, person_ids: Iterable[Any]) -> Iterator[None]:
+        stripes = sorted({self.stripe(pid) for pid in person_ids})
+        with self._guard:
+            local = [self._local.setdefault(s, threading.Lock()) for s in stripes]
+        locked = []
+        try:
+            for s, lock in zip(stripes, local):
+                lock.acquire()
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, s, os.SEEK_SET)
+                except BaseException:
+                    lock.release()
+                    raise
+                locked.append((s, lock))
+            yield
+        finally:
+            for s, lock in reversed(locked):
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, s, os.SEEK_SET)
+                lock.release()
+
+    def close(self) -> None:
+        os.close(self._fd)
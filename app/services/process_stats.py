@@ -0,0 +1,66 @@
+from __future__ import annotations
+import os
+from typing import Dict, Optional
+
+# /proc/self/smaps_rollup maydonlari (kB) -> javobdagi kalitlar (MB)
+_SMAPS_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",  # umumiy sahifalar worker'lar soniga bo'lingan — host xotirasini worker'larga taqsimlash uchun
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def process_uptime_sec() -> Optional[float]:
+    """Process boshlanganidan beri (Linux /proc): interpreter start + import'lar ham kiradi."""
+    try:
+        with open("/proc/self/stat") as fh:
+            fields = fh.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as fh:
+            uptime = float(fh.read().split()[0])
+        return round(uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"), 2)  # 22-maydon: starttime
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_usage() -> Optional[Dict[str, float]]:
+    """
+    Shu process (worker) xotirasi. Preload-and-fork rejimida og'irliklar shared_clean'da ko'rinadi;
+    worker sonini pss_mb + private_dirty_mb bo'yicha rejalashtirish kerak, rss_mb bo'yicha emas.
+    Linux 4.14+ (smaps_rollup) dan boshqa joyda None.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as fh:
+            lines = fh.readlines()
+    except OSError:
+        return None
+
+    usage: Dict[str, float] = {"pid": os.getpid()}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _SMAPS_FIELDS:
+            usage[_SMAPS_FIELDS[key]] = round(int(rest.split()[0]) / 1024.0, 1)
+    return usage
+
+
+def reset_peak_rss() -> bool:
+    """VmHWM (RSS cho'qqisi) ni joriy RSS ga tushiradi — keyingi peak_rss_mb shu paytdan beri cho'qqi."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
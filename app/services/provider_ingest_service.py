@@ -1,13 +1,27 @@
 # app/services/provider_ingest_service.py
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional
+import contextlib
+from dataclasses import dataclass, replace
+from typing import Any, Optional
 
 from app.repositories.faceid_repo import FaceIdRepo
 from app.services.utils import new_uuid
-from app.services.image_service import decode_base64, decode_cv2, save_bytes, zero_embedding, ImageError
-from app.services.face_pipeline import get_face_embedding_strict
+from app.services.image_service import decode_base64, decode_cv2, save_bytes, write_bytes, zero_embedding, ImageError
+from app.services.face_pipeline import get_face_embedding_strict, get_face_embeddings_strict_batch
+from app.services.quantization import pack_sign_bits
+from app.services.face_quality import QUALITY_SCALE
+from app.services.ivf import UNASSIGNED_CLUSTER
+from app.services.templates import (
+    CENTROID_SLOT, NO_DOCUMENT_ID, QUALITY_TOLERANCE, normalized_centroid, pick_template_slot,
+)
+from app.services.idempotency import idempotency_key
+from app.services.inference_gate import BusyError, LANE_INGEST
+from app.services.embedding_remote import EmbeddingServiceUnavailable
+from app.config import IDEMPOTENCY_DB_LOOKUP, EMBEDDING_MODEL_VERSION, QUALITY_MIN_BLUR
 import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 EMB_OK = 1
 EMB_NONE = 0
@@ -16,75 +30,347 @@ EMB_LOW_QUALITY = 2
 @dataclass
 class PhotoResult:
     face_url: Optional[str]
-    polygons: list[float]
+    polygons: Optional[list[float]]  # None -> hali yuklanmagan (document_id orqali, kerak bo'lsa)
     embedding_status: int
     det_score: float = 0.0
     blur: float = 0.0
     face_size: int = 0
     faces_found: int = 0
+    document_id: Optional[Any] = None
+    quality_scale: int = QUALITY_SCALE  # blur qaysi shkalada o'lchangan (bazadan o'qilganda — saqlangani)
+
+@dataclass
+class PhotoAnalysis:
+    img_bytes: Optional[bytes]
+    result: Any  # get_face_embedding_strict natijasi yoki None (low quality)
+    failed: bool = False  # decode / inference xatosi
 
-def quality_score(p: PhotoResult) -> float:
+def quality_score(p: PhotoResult, with_blur: bool = True) -> float:
     """
     Простой скоринг качества:
     - det_score самый важный
     - blur и face_size дают бонус
+    with_blur=False: rasmlar blur'i turli shkalada (quality_scale) — blur bonusi hisobga olinmaydi.
     """
-    return (p.det_score * 100.0) + (min(p.blur, 300.0) * 0.2) + (min(p.face_size, 200) * 0.5)
+    blur = min(p.blur, 300.0) * 0.2 if with_blur else 0.0
+    return (p.det_score * 100.0) + blur + (min(p.face_size, 200) * 0.5)
+
+def same_quality_scale(*photos: PhotoResult) -> bool:
+    return len({p.quality_scale for p in photos}) <= 1
+
+def unsaved_photo() -> PhotoResult:
+    """Rasm diskka yozilmadi: snapshot face_url'siz, embedding'siz (analiz xatosi bilan bir xil)."""
+    return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
 
 class ProviderIngestService:
-    def __init__(self, repo: FaceIdRepo, face_app, images_root: str = "images/persons"):
+    def __init__(
+        self,
+        repo: FaceIdRepo,
+        face_app,
+        images_root: str = "images/persons",
+        ann_index=None,
+        flat_store=None,
+        ivf_centroids=None,
+        sgb_map=None,
+        best_photo_cache=None,
+        read_cache=None,
+        idempotency=None,
+        embedding_models=None,
+        inference_gate=None,
+        inference_lane: str = LANE_INGEST,
+        embedding_client=None,
+        persons_via_mv: bool = False,
+        templates_per_person: int = 1,
+        template_locks=None,
+        sgb_locks=None,
+        db_executor=None,
+    ):
         self.repo = repo
         self.face_app = face_app
         self.images_root = images_root
+        self.ann_index = ann_index
+        self.flat_store = flat_store
+        self.ivf_centroids = ivf_centroids
+        self.sgb_map = sgb_map
+        self.best_photo_cache = best_photo_cache
+        self.read_cache = read_cache
+        self.idempotency = idempotency
+        self.embedding_models = embedding_models
+        self.inference_gate = inference_gate
+        self.inference_lane = inference_lane
+        self.embedding_client = embedding_client
+        self.persons_via_mv = persons_via_mv
+        # migrations 0003/0004 startup'da tekshirilmaguncha 1 (bitta template = best photo)
+        self.templates_per_person = max(1, int(templates_per_person))
+        self.template_locks = template_locks
+        self.sgb_locks = sgb_locks
+        self.db_executor = db_executor
+        self.model_version = embedding_models.primary if embedding_models is not None else EMBEDDING_MODEL_VERSION
 
     # 1) resolve/create person_id по sgb
-    def resolve_person_id(self, sgb_person_id: int) -> str:
-        pid = self.repo.get_person_id_by_sgb(sgb_person_id)
-        if pid:
-            return pid
+    # repo: lookup'lar db_executor thread'ida o'z ulanishi bilan bo'lsa (run_db) — o'sha repo, aks holda self.repo
+    def create_person(self, sgb_person_id: int, repo: Optional[FaceIdRepo] = None) -> str:
+        # persons_v2 qatori person_sgb_map_v2 dan MV orqali yoziladi (migrations/0005) — bitta insert;
+        # MV startup'da topilmagan bo'lsa (persons_via_mv=False) — eski yo'l, ikkala jadvalga
+        repo = repo or self.repo
         pid = new_uuid()
-        self.repo.insert_person(pid)
-        self.repo.upsert_sgb_map(sgb_person_id, pid, is_active=1)
+        if not self.persons_via_mv:
+            repo.insert_person(pid)
+        repo.upsert_sgb_map(sgb_person_id, pid, is_active=1)
         return pid
 
-    # 2) process_photo improved
-    async def process_photo(self, sgb_person_id: int, person_id: str, photo_b64: str) -> PhotoResult:
+    def create_person_locked(self, sgb_person_id: int, repo: Optional[FaceIdRepo] = None) -> str:
+        """
+        Lookup miss -> sgb bo'yicha process'lararo lock ostida qayta o'qish, hali ham yo'q bo'lsa create:
+        boshqa worker shu orada yaratgan bo'lsa — uning person_id'si (ikkinchi UUID yaratilmaydi).
+        """
+        repo = repo or self.repo
+        if self.sgb_locks is None:
+            return self.create_person(sgb_person_id, repo)
+        with self.sgb_locks.hold([sgb_person_id]):
+            pid = repo.get_person_id_by_sgb(sgb_person_id)
+            if pid:
+                return pid
+            return self.create_person(sgb_person_id, repo)
+
+    def resolve_person_id(self, sgb_person_id: int, repo: Optional[FaceIdRepo] = None) -> str:
+        repo = repo or self.repo
+        if self.sgb_map is not None:
+            return self.sgb_map.resolve(
+                sgb_person_id, repo.get_person_id_by_sgb, lambda sgb: self.create_person_locked(sgb, repo),
+            )
+
+        pid = repo.get_person_id_by_sgb(sgb_person_id)
+        if pid:
+            return pid
+        return self.create_person_locked(sgb_person_id, repo)
+
+    def lookup_person(self, sgb_person_id: int, repo: Optional[FaceIdRepo] = None) -> tuple[str, PhotoResult]:
+        """Ingest boshidagi lookup'lar: person_id (kerak bo'lsa yaratiladi) + hozirgi best photo meta."""
+        person_id = self.resolve_person_id(sgb_person_id, repo)
+        return person_id, self.fallback_photo_from_documents(person_id, repo)
+
+    def submit_inference(self, fn, *args, remote=None) -> asyncio.Future:
+        """
+        Gate bo'lsa — admission control (to'la bo'lsa BusyError darhol); aks holda default executor.
+        remote: embedding service varianti — service sozlangan va tirik bo'lsa avval u (lokal gate slotisiz,
+        admission control service'ning o'z gate'ida); service ulanmasa, band / tayyor emas bo'lsa yoki versiyani
+        yuklamagan bo'lsa — lokal fn.
+        """
+        client = self.embedding_client
+        if remote is not None and client is not None and (client.available or self.face_app is None):
+            return asyncio.ensure_future(self._remote_first(remote, fn, args))
+        if self.inference_gate is not None:
+            return self.inference_gate.submit(fn, *args, lane=self.inference_lane)
+        return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _remote_first(self, remote, fn, args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, remote, *args)
+        except (EmbeddingServiceUnavailable, BusyError, ValueError) as e:
+            # BusyError: service band yoki hali tayyor emas; ValueError: versiya yuklanmagan va h.k.
+            if self.face_app is None:  # lokal model yo'q (EMBED_LOCAL_MODEL=false) — keyinroq qayta urinish
+                if isinstance(e, EmbeddingServiceUnavailable):
+                    raise BusyError(self.embedding_client.retry_sec, "Embedding service is unavailable")
+                raise
+            logger.info("Embedding service rejected the request, using the local model: %s", e)
+        return await self.submit_inference(fn, *args)
+
+    # 2) photo: analiz (decode + inference, person_id'ga bog'liq emas) -> yo'l -> diskka yozish
+    def analyze_photo(self, photo_b64: str) -> PhotoAnalysis:
+        """Sync: executor'da ishlaydi. Xatolar PhotoAnalysis.failed sifatida qaytadi."""
         try:
             img_bytes = decode_base64(photo_b64)
             img = decode_cv2(img_bytes)
-
-            res = await asyncio.to_thread(
-                get_face_embedding_strict,
+            res = get_face_embedding_strict(
                 img,
                 self.face_app,
                 min_det_score=0.60,
                 min_face_size=80,
-                min_blur=60.0,
+                min_blur=QUALITY_MIN_BLUR,
+            )
+            return PhotoAnalysis(img_bytes=img_bytes, result=res)
+        except (ImageError, Exception):
+            return PhotoAnalysis(img_bytes=None, result=None, failed=True)
+
+    def analyze_secondary(self, photo_b64: str) -> dict[str, list[float]]:
+        """Dual-write: qo'shimcha model versiyalari embeddinglari (faqat person_embeddings uchun)."""
+        if self.embedding_models is None:
+            return {}
+        apps = self.embedding_models.secondary_write_apps()
+        if not apps:
+            return {}
+
+        out: dict[str, list[float]] = {}
+        try:
+            img = decode_cv2(decode_base64(photo_b64))
+        except (ImageError, Exception):
+            return out
+        for version, face_app in apps.items():
+            try:
+                res = get_face_embedding_strict(
+                    img,
+                    face_app,
+                    min_det_score=0.60,
+                    min_face_size=80,
+                    min_blur=QUALITY_MIN_BLUR,
+                )
+            except Exception as e:
+                logger.warning("Secondary embedding %s failed: %s", version, e)
+                continue
+            if res is not None:
+                out[version] = res.embedding
+        return out
+
+    def analyze_secondary_many(self, photos: list[Optional[str]]) -> list[dict[str, list[float]]]:
+        return [self.analyze_secondary(p) if p else {} for p in photos]
+
+    # embedding service variantlari (submit_inference(..., remote=...)): natija lokal analiz bilan bir xil
+    def remote_analyze_photos(self, photos: list[Optional[str]]) -> list[Optional[PhotoAnalysis]]:
+        outcomes = self.embedding_client.strict(
+            photos,
+            version=self.model_version,
+            lane=self.inference_lane,
+            min_det_score=0.60,
+            min_face_size=80,
+            min_blur=QUALITY_MIN_BLUR,
+        )
+        out: list[Optional[PhotoAnalysis]] = []
+        for photo_b64, (failed, res) in zip(photos, outcomes):
+            if not photo_b64:
+                out.append(None)
+            elif failed:
+                out.append(PhotoAnalysis(img_bytes=None, result=None, failed=True))
+            else:
+                out.append(PhotoAnalysis(img_bytes=decode_base64(photo_b64), result=res))
+        return out
+
+    def remote_analyze_photo(self, photo_b64: str) -> PhotoAnalysis:
+        return self.remote_analyze_photos([photo_b64])[0]
+
+    def remote_analyze_secondary_many(self, photos: list[Optional[str]]) -> list[dict[str, list[float]]]:
+        out: list[dict[str, list[float]]] = [{} for _ in photos]
+        if self.embedding_models is None:
+            return out
+        for version in self.embedding_models.secondary_write_apps():
+            outcomes = self.embedding_client.strict(
+                photos,
+                version=version,
+                lane=self.inference_lane,
+                min_det_score=0.60,
+                min_face_size=80,
+                min_blur=QUALITY_MIN_BLUR,
+            )
+            for i, (_, res) in enumerate(outcomes):
+                if res is not None:
+                    out[i][version] = res.embedding
+        return out
+
+    def remote_analyze_secondary(self, photo_b64: str) -> dict[str, list[float]]:
+        return self.remote_analyze_secondary_many([photo_b64])[0]
+
+    def photo_result(self, sgb_person_id: int, person_id: str, analysis: PhotoAnalysis) -> PhotoResult:
+        """Analiz natijasi -> PhotoResult (face_url hisoblanadi, fayl hali yozilmagan)."""
+        if analysis.failed:
+            return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
+
+        res = analysis.result
+        if res is None:
+            face_url = f"{self.images_root}/low_quality/{sgb_person_id}/{person_id}.jpg"
+            return PhotoResult(face_url=face_url, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
+
+        return PhotoResult(
+            face_url=f"{self.images_root}/{sgb_person_id}/{person_id}.jpg",
+            polygons=res.embedding,
+            embedding_status=EMB_OK,
+            det_score=res.meta.det_score,
+            blur=res.meta.blur,
+            face_size=res.meta.face_size,
+            faces_found=res.meta.faces_found,
+        )
+
+    def analyze_photos(self, photos: list[Optional[str]]) -> list[Optional[PhotoAnalysis]]:
+        """Bulk: decode har biri alohida, recognition bitta batch. Rasm yo'q -> None."""
+        out: list[Optional[PhotoAnalysis]] = [None] * len(photos)
+        images = [None] * len(photos)
+        blobs: list[Optional[bytes]] = [None] * len(photos)
+        for i, photo_b64 in enumerate(photos):
+            if not photo_b64:
+                continue
+            try:
+                blobs[i] = decode_base64(photo_b64)
+                images[i] = decode_cv2(blobs[i])
+            except (ImageError, Exception):
+                out[i] = PhotoAnalysis(img_bytes=None, result=None, failed=True)
+
+        try:
+            results = get_face_embeddings_strict_batch(
+                images,
+                self.face_app,
+                min_det_score=0.60,
+                min_face_size=80,
+                min_blur=QUALITY_MIN_BLUR,
             )
+        except Exception:
+            # batch yiqilsa — har bir rasm alohida (xato faqat o'sha yozuvga tegadi)
+            return [
+                out[i] if out[i] is not None or not photo_b64 else self.analyze_photo(photo_b64)
+                for i, photo_b64 in enumerate(photos)
+            ]
 
-            if res is None:
-                face_url = f"{self.images_root}/low_quality/{sgb_person_id}/{person_id}.jpg"
-                await save_bytes(face_url, img_bytes)
-                return PhotoResult(face_url=face_url, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
+        for i, res in enumerate(results):
+            if images[i] is not None:
+                out[i] = PhotoAnalysis(img_bytes=blobs[i], result=res)
+        return out
 
-            face_url = f"{self.images_root}/{sgb_person_id}/{person_id}.jpg"
-            await save_bytes(face_url, img_bytes)
+    async def process_photo(self, sgb_person_id: int, person_id: str, photo_b64: str) -> PhotoResult:
+        analysis = await self.submit_inference(self.analyze_photo, photo_b64, remote=self.remote_analyze_photo)
+        photo = self.photo_result(sgb_person_id, person_id, analysis)
+        if photo.face_url is None:
+            return photo
+        try:
+            await save_bytes(photo.face_url, analysis.img_bytes)
+        except Exception:
+            return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
+        return photo
+
+    # 3) fallback from docs: faqat metrikalar (cache -> ClickHouse), polygons lazy
+    def fallback_photo_from_documents(self, person_id: str, repo: Optional[FaceIdRepo] = None) -> PhotoResult:
+        meta = None
+        if self.best_photo_cache is not None:
+            meta = self.best_photo_cache.get(str(person_id))
+        if meta is None:
+            meta = (repo or self.repo).get_latest_face_meta(person_id)
+            if meta is not None and self.best_photo_cache is not None:
+                self.best_photo_cache.put(str(person_id), meta)
 
+        if meta and meta.get("embedding_status") == EMB_OK and meta.get("face_url"):
             return PhotoResult(
-                face_url=face_url,
-                polygons=res.embedding,
+                face_url=meta["face_url"],
+                polygons=None,
                 embedding_status=EMB_OK,
-                det_score=res.meta.det_score,
-                blur=res.meta.blur,
-                face_size=res.meta.face_size,
-                faces_found=res.meta.faces_found,
+                det_score=float(meta.get("det_score", 0.0)),
+                blur=float(meta.get("blur", 0.0)),
+                face_size=int(meta.get("face_size", 0)),
+                faces_found=int(meta.get("faces_found", 0)),
+                document_id=meta.get("document_id"),
+                quality_scale=int(meta.get("quality_scale", 0)),
             )
+        return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_NONE)
 
-        except (ImageError, Exception):
-            return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_LOW_QUALITY)
+    def load_old_photo(self, person_id: str, photo: PhotoResult) -> PhotoResult:
+        """Eski rasm g'olib bo'lganda — embedding snapshot'dan yuklanadi."""
+        if photo.polygons is not None:
+            return photo
+        polygons = None
+        if photo.document_id is not None:
+            polygons = self.repo.get_document_polygons(person_id, photo.document_id)
+        if polygons:
+            photo.polygons = polygons
+            return photo
+        return self.fallback_payload_from_documents(person_id)
 
-    # 3) fallback from docs (now includes metrics)
-    def fallback_photo_from_documents(self, person_id: str) -> PhotoResult:
+    def fallback_payload_from_documents(self, person_id: str) -> PhotoResult:
         latest = self.repo.get_latest_face_payload(person_id)
         if latest and latest.get("embedding_status") == EMB_OK and latest.get("face_url"):
             return PhotoResult(
@@ -95,6 +381,7 @@ class ProviderIngestService:
                 blur=float(latest.get("blur", 0.0)),
                 face_size=int(latest.get("face_size", 0)),
                 faces_found=int(latest.get("faces_found", 0)),
+                quality_scale=int(latest.get("quality_scale", 0)),
             )
         return PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_NONE)
 
@@ -109,19 +396,35 @@ class ProviderIngestService:
         if old_photo.embedding_status != EMB_OK:
             return new_photo
 
-        # сравниваем score
-        new_q = quality_score(new_photo)
-        old_q = quality_score(old_photo)
+        # сравниваем score (blur — только в одной шкале)
+        with_blur = same_quality_scale(new_photo, old_photo)
+        new_q = quality_score(new_photo, with_blur)
+        old_q = quality_score(old_photo, with_blur)
 
-        # если новый заметно хуже — оставляем старый
-        if new_q + 5.0 < old_q:  # порог "заметно"
+        # если новый заметно хуже — оставляем старый (порог общий с pick_template_slot)
+        if new_q + QUALITY_TOLERANCE < old_q:
             return old_photo
 
         return new_photo
 
+    def assign_cluster(self, photo: PhotoResult) -> int:
+        if self.ivf_centroids is None or photo.embedding_status != EMB_OK:
+            return UNASSIGNED_CLUSTER
+        return self.ivf_centroids.assign(photo.polygons)
+
     # 4) insert document snapshot WITH metrics
-    def insert_document_snapshot(self, person_id: str, payload, photo: PhotoResult) -> None:
-        self.repo.insert_document_snapshot({
+    def remember_best_photo(self, person_id: str, snapshot: dict) -> None:
+        if self.best_photo_cache is None:
+            return
+        self.best_photo_cache.put(str(person_id), {
+            "document_id": snapshot["id"],
+            **{k: snapshot[k] for k in (
+                "face_url", "embedding_status", "det_score", "blur", "face_size", "faces_found", "quality_scale",
+            )},
+        })
+
+    def document_snapshot_row(self, person_id: str, payload, photo: PhotoResult) -> dict:
+        return {
             "id": new_uuid(),
             "person_id": person_id,
             "citizen": payload.citizen,
@@ -133,16 +436,144 @@ class ProviderIngestService:
             "full_name": payload.full_name,
             "face_url": photo.face_url,
             "polygons": photo.polygons,
+            "polygons_bin": pack_sign_bits(photo.polygons),
+            "cluster_id": self.assign_cluster(photo),
             "embedding_status": photo.embedding_status,
             "det_score": float(photo.det_score or 0.0),
             "blur": float(photo.blur or 0.0),
             "face_size": int(photo.face_size or 0),
             "faces_found": int(photo.faces_found or 0),
-        })
+            "quality_scale": int(photo.quality_scale),
+            "model_version": self.model_version,
+        }
+
+    def insert_document_snapshot(self, person_id: str, payload, photo: PhotoResult) -> dict:
+        row = self.document_snapshot_row(person_id, payload, photo)
+        self.repo.insert_document_snapshot(row)
+        return row
+
+    # 4.1) template gallery: eng yaxshi K ta EMB_OK rasm + centroid (slot 0)
+    def update_templates(
+        self,
+        person_id: str,
+        document_id: str,
+        photo: PhotoResult,
+        secondary: Optional[dict[str, list[float]]] = None,
+    ) -> bool:
+        """
+        Yangi EMB_OK rasm best bo'lmasa ham template bo'la oladi (eski yaxshi rasmlar ham saqlanadi).
+        Qabul qilinsa: template + qayta hisoblangan centroid bitta insert bilan yoziladi.
+        secondary: dual-write versiyalari embeddinglari — o'sha insert'ga qo'shiladi.
+        """
+        with self.template_lock([person_id]):
+            rows = self.all_template_rows(person_id, document_id, photo, secondary)
+            if rows:
+                self.repo.upsert_person_embeddings(rows)
+        return bool(rows)
+
+    @staticmethod
+    def template_document_id(snapshot: dict, best_photo: PhotoResult, new_photo: PhotoResult) -> str:
+        """Template'ning document_id'si — faqat snapshot aynan shu embedding'ni saqlasa (best photo yangi rasm)."""
+        return snapshot["id"] if best_photo is new_photo else NO_DOCUMENT_ID
+
+    def template_lock(self, person_ids):
+        """Template to'plami load -> slot tanlash -> upsert: person bo'yicha boshqa process'lar bilan ketma-ket."""
+        if self.template_locks is None:
+            return contextlib.nullcontext()
+        return self.template_locks.hold(person_ids)
+
+    def all_template_rows(
+        self,
+        person_id: str,
+        document_id: str,
+        photo: PhotoResult,
+        secondary: Optional[dict[str, list[float]]] = None,
+    ) -> list[dict]:
+        rows = self.template_rows(person_id, document_id, photo)
+        # sifat metrikalari primary detektordan — har bir versiya bir xil rasmlarni template qiladi
+        for version, polygons in (secondary or {}).items():
+            rows.extend(self.template_rows(person_id, document_id, replace(photo, polygons=polygons), version))
+        return rows
+
+    def template_rows(
+        self,
+        person_id: str,
+        document_id: str,
+        photo: PhotoResult,
+        model_version: Optional[str] = None,
+    ) -> list[dict]:
+        model_version = model_version or self.model_version
+        # IVF centroidlar primary model embeddinglari ustida o'qitilgan
+        if model_version == self.model_version:
+            assign_cluster = self.assign_cluster
+        else:
+            assign_cluster = lambda p: UNASSIGNED_CLUSTER
+
+        templates = self.repo.load_person_templates(person_id, model_version)
+        stored = {
+            t["slot"]: PhotoResult(
+                face_url=t["face_url"],
+                polygons=t["polygons"],
+                embedding_status=EMB_OK,
+                det_score=t["det_score"],
+                blur=t["blur"],
+                face_size=t["face_size"],
+                faces_found=t["faces_found"],
+                quality_scale=t["quality_scale"],
+            )
+            for t in templates
+        }
+        # eski shkaladagi template bo'lsa, blur hech bir template uchun hisobga olinmaydi
+        with_blur = same_quality_scale(photo, *stored.values())
+        scores = {slot: quality_score(p, with_blur) for slot, p in stored.items()}
+        new_score = quality_score(photo, with_blur)
+
+        slot = pick_template_slot(scores, new_score, self.templates_per_person)
+        if slot is None:
+            return []
+
+        template = {
+            "person_id": person_id,
+            "slot": slot,
+            "document_id": document_id,
+            "face_url": photo.face_url,
+            "polygons": photo.polygons,
+            "polygons_bin": pack_sign_bits(photo.polygons),
+            "cluster_id": assign_cluster(photo),
+            "det_score": float(photo.det_score or 0.0),
+            "blur": float(photo.blur or 0.0),
+            "face_size": int(photo.face_size or 0),
+            "faces_found": int(photo.faces_found or 0),
+            "quality_scale": int(photo.quality_scale),
+            "is_active": 1,
+            "model_version": model_version,
+        }
+        kept = [t for t in templates if t["slot"] != slot] + [template]
+        scores[slot] = new_score
+        best = max(kept, key=lambda t: scores[t["slot"]])
+
+        # centroid: metadata eng yaxshi template'dan, vektor — normallashtirilgan o'rtacha
+        centroid = normalized_centroid([t["polygons"] for t in kept])
+        centroid_photo = PhotoResult(face_url=best["face_url"], polygons=centroid, embedding_status=EMB_OK)
+        return [
+            template,
+            {
+                **{k: best[k] for k in (
+                    "document_id", "face_url", "det_score", "blur", "face_size", "faces_found", "quality_scale",
+                )},
+                "person_id": person_id,
+                "slot": CENTROID_SLOT,
+                "polygons": centroid,
+                "polygons_bin": pack_sign_bits(centroid),
+                "cluster_id": assign_cluster(centroid_photo),
+                "is_active": 1,
+                "model_version": model_version,
+            },
+        ]
 
     # 5) insert border event
-    def insert_border_event(self, person_id: str, payload) -> None:
-        self.repo.insert_border_event({
+    def border_event_row(self, person_id: str, payload) -> dict:
+        return {
             "id": new_uuid(),
             "border_id": payload.border_id,
             "person_id": person_id,
@@ -156,17 +587,99 @@ class ProviderIngestService:
             "visa_date_to": payload.visa_date_to,
             "action": payload.action,
             "kpp": payload.kpp,
-        })
+        }
+
+    def insert_border_event(self, person_id: str, payload) -> None:
+        self.repo.insert_border_event(self.border_event_row(person_id, payload))
+
+    def update_vector_indexes(self, person_id: str, polygons: list[float], payload) -> None:
+        if self.ann_index is not None:
+            try:
+                self.ann_index.upsert(person_id, polygons)
+            except Exception:
+                pass  # index delta refresh orqali baribir yetib oladi
+        if self.flat_store is not None:
+            try:
+                # store boshqa model bilan qurilgan (yoki hali qurilmagan / eski format) bo'lsa yozilmaydi
+                if self.flat_store.model_version == self.model_version:
+                    self.flat_store.append([person_id], [polygons], [(payload.citizen, payload.date_of_birth)])
+            except Exception:
+                pass  # keyingi build_flat_index bilan tiklanadi
+
+    async def run_db(self, fn):
+        """fn(repo): db_executor bo'lsa — pool thread'ida o'z ulanishi bilan, aks holda event loop'da shared repo."""
+        if self.db_executor is None:
+            return fn(self.repo)
+        return await self.db_executor.run(lambda client: fn(FaceIdRepo(client)))
 
     # 6) ingest - ENDI TAYYOR
+    async def find_previous_ingest(self, payload) -> Optional[Any]:
+        """Shu border event allaqachon yozilganmi (provider retry) — person_id yoki None."""
+        if not IDEMPOTENCY_DB_LOOKUP:
+            return None
+        try:
+            return await self.run_db(lambda repo: repo.find_border_event_person(
+                payload.sgb_person_id, payload.border_id, payload.reg_date, payload.action,
+            ))
+        except Exception as e:
+            logger.warning("Idempotency lookup failed, ingesting: %s", e)
+            return None
+
+    async def find_previous_ingests(self, payloads: list) -> list[Optional[Any]]:
+        """find_previous_ingest butun partiya uchun — bitta so'rov."""
+        if not IDEMPOTENCY_DB_LOOKUP or not payloads:
+            return [None] * len(payloads)
+        events = [(p.sgb_person_id, p.border_id, p.reg_date, p.action) for p in payloads]
+        try:
+            return await self.run_db(lambda repo: repo.find_border_event_persons(events))
+        except Exception as e:
+            logger.warning("Idempotency lookup failed, ingesting: %s", e)
+            return [None] * len(payloads)
+
     async def ingest(self, payload) -> str:
-        # Qo'shimcha tekshiruvlar - agar validation endpointda qilinsa, bu yerda faqat service uchun
-        person_id = self.resolve_person_id(payload.sgb_person_id)
+        if self.idempotency is None:
+            return await self.ingest_once(payload)
+        return await self.idempotency.run(
+            idempotency_key(payload),
+            lambda: self.find_previous_ingest(payload),
+            lambda: self.ingest_once(payload),
+        )
 
-        old_best = self.fallback_photo_from_documents(person_id)
+    async def ingest_once(self, payload) -> str:
+        loop = asyncio.get_running_loop()
 
+        # decode + inference darhol executor'da boshlanadi (person_id kerak emas);
+        # DB lookup'lar shu orada db_executor'da (o'z ulanishi bilan, event loop band bo'lmaydi)
+        analysis = None
+        secondary = None
         if payload.photo:
-            new_photo = await self.process_photo(payload.sgb_person_id, person_id, payload.photo)
+            analysis = self.submit_inference(self.analyze_photo, payload.photo, remote=self.remote_analyze_photo)
+            if self.embedding_models is not None and self.embedding_models.secondary_write_apps():
+                try:
+                    secondary = self.submit_inference(
+                        self.analyze_secondary, payload.photo, remote=self.remote_analyze_secondary,
+                    )
+                except BusyError:
+                    analysis.cancel()
+                    raise
+
+        # Qo'shimcha tekshiruvlar - agar validation endpointda qilinsa, bu yerda faqat service uchun
+        try:
+            person_id, old_best = await self.run_db(lambda repo: self.lookup_person(payload.sgb_person_id, repo))
+        except BaseException:
+            # so'rov yiqildi — inference gate slotini band qilib turmasin
+            for future in (analysis, secondary):
+                if future is not None:
+                    future.cancel()
+            raise
+
+        image_write = None
+        if analysis is not None:
+            photo_analysis = await analysis
+            new_photo = self.photo_result(payload.sgb_person_id, person_id, photo_analysis)
+            # fayl yozish secondary inference bilan parallel; insert'lar yozilgandan keyin
+            if new_photo.face_url is not None:
+                image_write = loop.run_in_executor(None, write_bytes, new_photo.face_url, photo_analysis.img_bytes)
 #
 #             # Agar rasmda yuz aniqlanmasa, xato qaytarish
 #             if new_photo.embedding_status == EMB_LOW_QUALITY:
@@ -181,14 +694,251 @@ class ProviderIngestService:
         else:
             new_photo = PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_NONE)
 
+        secondary_embeddings = {}
+        if secondary is not None:
+            secondary_embeddings = await secondary
+
+        # snapshot / template'lar face_url'ga ishora qiladi -> fayl yozilmagan bo'lsa rasm yo'q deb yoziladi
+        if image_write is not None:
+            try:
+                await image_write
+            except Exception as e:
+                logger.error("Photo write failed for %s (%s): %s", person_id, new_photo.face_url, e)
+                new_photo = unsaved_photo()
+
         # выбираем лучшее (не ухудшаем)
         best_photo = self.choose_best_photo(new_photo, old_best)
+        if best_photo is old_best:
+            best_photo = self.load_old_photo(person_id, old_best)
+
+        embedding_changed = best_photo is new_photo and best_photo.embedding_status == EMB_OK
 
         # Database operatsiyalarini bajarish
         try:
-            self.insert_document_snapshot(person_id, payload, best_photo)
+            snapshot = self.insert_document_snapshot(person_id, payload, best_photo)
+            self.remember_best_photo(person_id, snapshot)
+            if new_photo.embedding_status == EMB_OK:
+                self.update_templates(
+                    person_id, self.template_document_id(snapshot, best_photo, new_photo), new_photo, secondary_embeddings,
+                )
             self.insert_border_event(person_id, payload)
         except Exception as e:
             raise ValueError(f"Database error: {str(e)}")
 
-        return person_id
\ No newline at end of file
+        # snapshot / map / border yozildi -> search read cache'dagi eski qiymatlar
+        if self.read_cache is not None:
+            self.read_cache.invalidate_person(person_id)
+
+        # yangi EMB_OK embedding tanlangan bo'lsa — in-process indexlar ham yangilanadi
+        if embedding_changed:
+            self.update_vector_indexes(person_id, best_photo.polygons, payload)
+
+        return person_id
+
+    # 7) bulk ingest: batch inference + columnar insert'lar
+    async def ingest_many(self, payloads: list) -> list[tuple[Optional[str], Optional[str]]]:
+        """
+        Har bir yozuv uchun (person_id, None) yoki (None, xato matni) — ingest() semantikasi bilan.
+        Inference band (BusyError) bo'lsa — yozilgan guruhlar natijasi saqlanadi, qolgan yozuvlar (None, BusyError).
+        Bir xil sgb_person_id bitta guruhga tushmaydi (best photo / template ketma-ketligi saqlanadi).
+        Idempotency: allaqachon yozilgan (yoki shu partiyada takrorlangan) border event'lar qayta ishlanmaydi.
+        """
+        results: list[Optional[tuple[Optional[str], Optional[str]]]] = [None] * len(payloads)
+        keys: list = [None] * len(payloads)
+        first_of: dict = {}
+        claimed: list = []  # shu partiya band qilgan kalitlar — oxirida albatta resolve
+        waiting: list = []  # (i, future): kalit boshqa ingest'da (single yoki boshqa partiya)
+        todo: list[int] = []
+        try:
+            for i, payload in enumerate(payloads):
+                if self.idempotency is not None:
+                    key = keys[i] = idempotency_key(payload)
+                    if key in first_of:
+                        continue
+                    first_of[key] = i
+                    person_id = self.idempotency.peek(key)
+                    if person_id is not None:
+                        results[i] = (person_id, None)
+                        continue
+                    flight = self.idempotency.claim(key)
+                    if flight is not None:
+                        waiting.append((i, flight))
+                        continue
+                    claimed.append(key)
+                todo.append(i)
+
+            # band qilingan kalitlar ClickHouse'da bitta so'rov bilan tekshiriladi (provider retry)
+            if self.idempotency is not None and todo:
+                remaining = []
+                for i, person_id in zip(todo, await self.find_previous_ingests([payloads[i] for i in todo])):
+                    if person_id is None:
+                        remaining.append(i)
+                        continue
+                    claimed.remove(keys[i])
+                    self.idempotency.resolve(keys[i], person_id, replay=True)
+                    results[i] = (person_id, None)
+                todo = remaining
+
+            groups: list[list[int]] = []
+            seen: set = set()
+            for i in todo:
+                if not groups or payloads[i].sgb_person_id in seen:
+                    groups.append([])
+                    seen = set()
+                groups[-1].append(i)
+                seen.add(payloads[i].sgb_person_id)
+            for n, group in enumerate(groups):
+                try:
+                    batch = await self._ingest_group([payloads[j] for j in group])
+                except BusyError as e:
+                    # oldingi guruhlar yozilgan — faqat qolgan yozuvlar band (qayta yuborish mumkin)
+                    for rest in groups[n:]:
+                        for j in rest:
+                            results[j] = (None, e)
+                    break
+                for j, r in zip(group, batch):
+                    results[j] = r
+        except BaseException as e:
+            for key in claimed:
+                self.idempotency.resolve(key, error=e)
+            raise
+
+        if self.idempotency is None:
+            return results
+
+        # o'z kalitlarimiz boshqalarni kutishdan oldin bo'shatiladi (partiyalar bir-birini kutib qolmaydi)
+        for key in claimed:
+            person_id, message = results[first_of[key]]
+            if person_id is not None:
+                self.idempotency.resolve(key, person_id)
+            elif isinstance(message, BusyError):
+                self.idempotency.resolve(key, error=message)
+            else:
+                self.idempotency.resolve(key, error=ValueError(message))
+        for i, flight in waiting:
+            try:
+                results[i] = (await asyncio.shield(flight), None)
+            except BusyError as e:
+                results[i] = (None, e)
+            except Exception as e:
+                results[i] = (None, str(e))
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = results[first_of[key]]
+        return results
+
+    async def _ingest_group(self, payloads: list) -> list[tuple[Optional[str], Optional[str]]]:
+        loop = asyncio.get_running_loop()
+        analyses = self.submit_inference(
+            self.analyze_photos, [p.photo for p in payloads], remote=self.remote_analyze_photos,
+        )
+        secondary = None
+        if self.embedding_models is not None and self.embedding_models.secondary_write_apps():
+            # dual-write butun guruh uchun bitta ish (gate'da bitta slot)
+            try:
+                secondary = self.submit_inference(
+                    self.analyze_secondary_many, [p.photo for p in payloads], remote=self.remote_analyze_secondary_many,
+                )
+            except BusyError:
+                analyses.cancel()
+                raise
+
+        # DB lookup'lar inference bilan parallel (db_executor'da, bitta ish butun guruh uchun)
+        def lookup_all(repo) -> list:
+            out = []
+            for payload in payloads:
+                try:
+                    out.append((*self.lookup_person(payload.sgb_person_id, repo), None))
+                except Exception as e:
+                    out.append((None, None, f"Database error: {str(e)}"))
+            return out
+
+        try:
+            lookups = await self.run_db(lookup_all)
+        except BaseException:
+            for future in (analyses, secondary):
+                if future is not None:
+                    future.cancel()
+            raise
+        person_ids: list[Optional[str]] = [person_id for person_id, _, _ in lookups]
+        old_bests: list[Optional[PhotoResult]] = [old_best for _, old_best, _ in lookups]
+        errors: list[Optional[str]] = [error for _, _, error in lookups]
+
+        photo_analyses = await analyses
+
+        # rasmlar avval yoziladi (parallel, secondary inference bilan): snapshot / template'lar faqat
+        # mavjud fayllarga ishora qiladi
+        new_photos: list[Optional[PhotoResult]] = [None] * len(payloads)
+        writes: list[tuple[int, asyncio.Future]] = []
+        for i, payload in enumerate(payloads):
+            if errors[i] is not None:
+                continue
+            analysis = photo_analyses[i]
+            if analysis is None:
+                new_photos[i] = PhotoResult(face_url=None, polygons=zero_embedding(), embedding_status=EMB_NONE)
+                continue
+            new_photos[i] = self.photo_result(payload.sgb_person_id, person_ids[i], analysis)
+            if new_photos[i].face_url is not None:
+                writes.append((i, loop.run_in_executor(None, write_bytes, new_photos[i].face_url, analysis.img_bytes)))
+
+        secondary_embeddings: list[dict] = [{}] * len(payloads)
+        if secondary is not None:
+            secondary_embeddings = await secondary
+
+        for (i, _), res in zip(writes, await asyncio.gather(*(w for _, w in writes), return_exceptions=True)):
+            if isinstance(res, Exception):
+                logger.error("Photo write failed (%s): %s", new_photos[i].face_url, res)
+                new_photos[i] = unsaved_photo()
+
+        snapshots: list[Optional[dict]] = [None] * len(payloads)
+        changed: list[bool] = [False] * len(payloads)
+        template_rows: list[dict] = []
+        # template'lar load'dan upsert'gacha shu person'lar uchun lock ostida
+        template_persons = [
+            person_ids[i] for i in range(len(payloads))
+            if errors[i] is None and new_photos[i].embedding_status == EMB_OK
+        ]
+        with self.template_lock(template_persons):
+            for i, payload in enumerate(payloads):
+                if errors[i] is not None:
+                    continue
+                person_id = person_ids[i]
+                new_photo = new_photos[i]
+                try:
+                    best_photo = self.choose_best_photo(new_photo, old_bests[i])
+                    if best_photo is old_bests[i]:
+                        best_photo = self.load_old_photo(person_id, old_bests[i])
+
+                    snapshots[i] = self.document_snapshot_row(person_id, payload, best_photo)
+                    changed[i] = best_photo is new_photo and best_photo.embedding_status == EMB_OK
+                    if new_photo.embedding_status == EMB_OK:
+                        template_rows.extend(self.all_template_rows(
+                            person_id, self.template_document_id(snapshots[i], best_photo, new_photo),
+                            new_photo, secondary_embeddings[i],
+                        ))
+                except Exception as e:
+                    snapshots[i] = None
+                    errors[i] = f"Database error: {str(e)}"
+
+            ok = [i for i in range(len(payloads)) if errors[i] is None]
+            try:
+                self.repo.insert_document_snapshots([snapshots[i] for i in ok])
+                if template_rows:
+                    self.repo.upsert_person_embeddings(template_rows)
+                self.repo.insert_border_events([self.border_event_row(person_ids[i], payloads[i]) for i in ok])
+            except Exception as e:
+                for i in ok:
+                    errors[i] = f"Database error: {str(e)}"
+                ok = []
+
+        for i in ok:
+            self.remember_best_photo(person_ids[i], snapshots[i])
+            if self.read_cache is not None:
+                self.read_cache.invalidate_person(person_ids[i])
+            if changed[i]:
+                self.update_vector_indexes(person_ids[i], snapshots[i]["polygons"], payloads[i])
+
+        return [
+            (person_ids[i], None) if errors[i] is None else (None, errors[i])
+            for i in range(len(payloads))
+        ]
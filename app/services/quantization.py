@@ -0,0 +1,27 @@
+from __future__ import annotations
+from typing import List, Sequence
+
+import numpy as np
+
+EMB_SIZE = 512
+SIGN_WORDS = EMB_SIZE // 64  # 8 x UInt64 = 64 bytes per row
+
+
+def pack_sign_bits(vec: Sequence[float]) -> List[int]:
+    """
+    Embedding -> sign bits (bit j of word w == vec[w*64 + j] > 0).
+    ClickHouse'da Array(UInt64) sifatida saqlanadi, Hamming = bitCount(bitXor).
+    """
+    arr = np.asarray(vec, dtype=np.float32).reshape(SIGN_WORDS, 64)
+    packed = np.packbits(arr > 0, axis=1, bitorder="little")  # (8, 8) uint8
+    return packed.view("<u8").reshape(SIGN_WORDS).tolist()
+
+
+# pack_sign_bits bilan aynan bir xil natija beradigan ClickHouse ifodasi (backfill uchun)
+SIGN_BITS_SQL = (
+    "arrayMap(w -> arraySum(arrayMap(j -> bitShiftLeft(toUInt64(polygons[w * 64 + j + 1] > 0), j), range(64))), "
+    f"range({SIGN_WORDS}))"
+)
+
+# polygons_bin va reference_bin orasidagi Hamming masofa
+HAMMING_SQL = "arraySum(arrayMap((x, y) -> bitCount(bitXor(x, y)), polygons_bin, reference_bin))"
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.lru import LruCache
+
+# cache'da "bazada yo'q" belgisi (har safar qayta so'ralmasligi uchun)
+_ABSENT = None
+
+
+class PersonReadCache:
+    """
+    Search natijalarini boyitish uchun person bo'yicha read cache:
+      profiles -> SearchRepo.load_profiles
+      sgb_ids  -> SearchRepo.load_sgb_ids
+      borders  -> SearchRepo.load_last_entry_exit
+
+    Kalit: str(person_id). Multi-get: faqat miss'lar ClickHouse'ga boradi.
+    Ingest yozgan person shu worker'da darhol invalidatsiya qilinadi; boshqa worker'larda — TTL.
+    bypass=True -> to'g'ridan-to'g'ri ClickHouse (audit).
+    """
+
+    KINDS = ("profiles", "sgb_ids", "borders")
+
+    def __init__(
+        self,
+        capacity: int,
+        *,
+        ttl_sec: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        bypass: bool = False,
+    ):
+        per_kind_bytes = max_bytes // len(self.KINDS) if max_bytes else None
+        self.caches: Dict[str, LruCache] = {
+            kind: LruCache(capacity, ttl_sec=ttl_sec, max_bytes=per_kind_bytes)
+            for kind in self.KINDS
+        }
+        self.bypass = bypass
+
+    def _load(self, kind: str, loader: Callable[[List[Any]], Dict[Any, Any]], person_ids: List[Any]) -> Dict[Any, Any]:
+        if self.bypass or not person_ids:
+            return loader(person_ids)
+
+        cache = self.caches[kind]
+        by_key = {str(pid): pid for pid in person_ids}
+        found, missing = cache.get_many(list(by_key))
+
+        if missing:
+            since = cache.epoch
+            loaded = loader([by_key[k] for k in missing])
+            fresh = {str(pid): value for pid, value in loaded.items()}
+            cache.put_many({k: fresh.get(k, _ABSENT) for k in missing}, since_epoch=since)
+            found.update(fresh)
+
+        return {by_key[k]: v for k, v in found.items() if v is not _ABSENT}
+
+    def load_profiles(self, repo, person_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        return self._load("profiles", repo.load_profiles, person_ids)
+
+    def load_sgb_ids(self, repo, person_ids: List[Any]) -> Dict[Any, int]:
+        return self._load("sgb_ids", repo.load_sgb_ids, person_ids)
+
+    def load_last_entry_exit(self, repo, person_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        return self._load("borders", repo.load_last_entry_exit, person_ids)
+
+    def invalidate_person(self, person_id: Any, kinds=KINDS) -> None:
+        key = str(person_id)
+        for kind in kinds:
+            self.caches[kind].invalidate(key)
+
+    def clear(self) -> None:
+        for cache in self.caches.values():
+            cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {kind: cache.stats() for kind, cache in self.caches.items()}
+        out["bypass"] = self.bypass
+        out["bytes"] = sum(c.bytes for c in self.caches.values())
+        return out
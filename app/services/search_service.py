@@ -1,16 +1,30 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
 import asyncio
-
+import functools
+import logging
+
+from app.config import (
+    SEARCH_NPROBE,
+    TEMPLATE_RERANK_CANDIDATES,
+    TEMPLATE_CENTROID_MAX_DISTANCE,
+    EMBEDDING_MODEL_VERSION,
+    QUALITY_MIN_BLUR,
+)
 from app.repositories.search_repo import SearchRepo
+from app.services.templates import rerank_by_templates
+from app.services.inference_gate import BusyError, LANE_SEARCH
+from app.services.embedding_remote import EmbeddingServiceUnavailable
 from app.services.image_service import decode_base64, decode_cv2, ImageError
 from app.services.face_search_pipeline import (
     detect_all_faces_with_quality,
     FaceCandidate,
 )
 
+logger = logging.getLogger(__name__)
+
 # ==========================================================
 # Match classification
 # ==========================================================
@@ -47,9 +61,208 @@ class SearchFilters:
 # ==========================================================
 
 class SearchService:
-    def __init__(self, repo: SearchRepo, face_app):
+    def __init__(
+        self,
+        repo: SearchRepo,
+        face_app,
+        ann_index=None,
+        flat_store=None,
+        ivf_centroids=None,
+        read_cache=None,
+        embedding_models=None,
+        inference_gate=None,
+        inference_lane: str = LANE_SEARCH,
+        embedding_client=None,
+        templates_per_person: int = 1,
+    ):
         self.repo = repo
         self.face_app = face_app
+        self.ann_index = ann_index
+        self.flat_store = flat_store
+        self.ivf_centroids = ivf_centroids
+        self.read_cache = read_cache
+        self.embedding_models = embedding_models
+        self.inference_gate = inference_gate
+        self.inference_lane = inference_lane
+        self.embedding_client = embedding_client
+        self.templates_per_person = templates_per_person  # migrations 0003/0004 tekshirilmaguncha 1
+        self.model_version = embedding_models.primary if embedding_models is not None else EMBEDDING_MODEL_VERSION
+
+    # ------------------------------------------------------
+    # Vector part: flat mmap (exact) -> in-process ANN -> ClickHouse
+    # ------------------------------------------------------
+    def find_candidates(
+        self,
+        embedding: List[float],
+        *,
+        top_k: int,
+        ef_search: Optional[int],
+        filters: SearchFilters,
+        nprobe: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        no_filters = filters.citizen is None and filters.dtb_from is None and filters.dtb_to is None
+
+        # flat store atribut filtrlarini o'zi bajaradi (bitmap / dtb index -> kandidatlar).
+        # Bo'sh yoki boshqa model bilan qurilgan store -> ANN / ClickHouse.
+        store = self.flat_store
+        if store is not None and len(store) > 0 and store.model_version == self.model_version:
+            try:
+                return self.rerank_with_templates(
+                    embedding,
+                    lambda k, max_distance: store.search(
+                        embedding,
+                        top_k=k,
+                        max_distance=max_distance,
+                        citizen=filters.citizen,
+                        dtb_from=filters.dtb_from,
+                        dtb_to=filters.dtb_to,
+                    ),
+                    top_k=top_k,
+                    max_distance=MAYBE_MATCH_MAX_DIST,
+                    model_version=self.model_version,
+                )
+            except Exception as e:
+                logger.warning("Flat index search failed, falling back: %s", e)
+
+        # ANN index faqat best embedding'ni biladi, atribut filtrlari -> ClickHouse
+        if self.ann_index is not None and self.ann_index.ready and no_filters:
+            try:
+                return self.rerank_with_templates(
+                    embedding,
+                    lambda k, max_distance: self.ann_index.search(
+                        embedding,
+                        top_k=k,
+                        max_distance=max_distance,
+                        ef_search=ef_search,
+                    ),
+                    top_k=top_k,
+                    max_distance=MAYBE_MATCH_MAX_DIST,
+                    model_version=self.model_version,
+                )
+            except Exception as e:
+                logger.warning("ANN search failed, falling back to ClickHouse: %s", e)
+
+        # IVF: faqat nprobe ta eng yaqin klaster (centroidlar yuklanmagan bo'lsa — to'liq scan)
+        nprobe = SEARCH_NPROBE if nprobe is None else nprobe
+        clusters = None
+        if nprobe and self.ivf_centroids is not None:
+            clusters = self.ivf_centroids.probe(embedding, nprobe)
+
+        return self.clickhouse_candidates(
+            embedding,
+            top_k=top_k,
+            ef_search=ef_search,
+            filters=filters,
+            clusters=clusters,
+            model_version=self.model_version,
+            max_distance=MAYBE_MATCH_MAX_DIST,
+        )
+
+    def clickhouse_candidates(
+        self,
+        embedding: List[float],
+        *,
+        top_k: int,
+        ef_search: Optional[int],
+        filters: SearchFilters,
+        clusters: Optional[List[int]],
+        model_version: str,
+        max_distance: float,
+    ) -> List[Dict[str, Any]]:
+        return self.rerank_with_templates(
+            embedding,
+            lambda k, max_distance: self.repo.search_similar_people(
+                embedding,
+                top_k=k,
+                ef_search=ef_search,
+                citizen=filters.citizen,
+                dtb_from=filters.dtb_from,
+                dtb_to=filters.dtb_to,
+                max_distance=max_distance,
+                clusters=clusters,
+                model_version=model_version,
+            ),
+            top_k=top_k,
+            max_distance=max_distance,
+            model_version=model_version,
+        )
+
+    def rerank_with_templates(
+        self,
+        embedding: List[float],
+        search: Callable[[int, float], List[Dict[str, Any]]],
+        *,
+        top_k: int,
+        max_distance: float,
+        model_version: str,
+    ) -> List[Dict[str, Any]]:
+        """
+        search(top_k, max_distance) — istalgan manba (flat / ANN / ClickHouse). Template'lar yoqilgan bo'lsa
+        kengroq kandidatlar olinadi va har bir person template'lari bilan rerank qilinadi.
+        """
+        if self.templates_per_person <= 1:
+            return search(top_k, max_distance)
+
+        # centroid / best qator template'lardan uzoqroq -> birinchi bosqich chegarasi kengroq
+        candidates = search(max(top_k, TEMPLATE_RERANK_CANDIDATES), max(TEMPLATE_CENTROID_MAX_DISTANCE, max_distance))
+        if not candidates:
+            return []
+
+        templates = self.repo.load_templates([c["person_id"] for c in candidates], model_version)
+        return rerank_by_templates(
+            embedding,
+            candidates,
+            templates,
+            top_k=top_k,
+            max_distance=max_distance,
+        )
+
+    def find_mixed_candidates(
+        self,
+        face: FaceCandidate,
+        *,
+        top_k: int,
+        ef_search: Optional[int],
+        filters: SearchFilters,
+        nprobe: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Migratsiya davri: primary natijalar + har bir qo'shimcha versiya bo'yicha ClickHouse qidiruvi.
+        Masofalar primary shkalasiga keltiriladi, person bo'yicha eng yaqini qoladi.
+        Versiyalar ketma-ket so'raladi — ClickHouse client bitta ulanish, thread-safe emas.
+        """
+        merged: Dict[Any, Dict[str, Any]] = {}
+        for c in self.find_candidates(face.embedding, top_k=top_k, ef_search=ef_search, filters=filters, nprobe=nprobe):
+            merged[c["person_id"]] = {**c, "model_version": self.model_version}
+
+        if self.embedding_models is None:
+            return list(merged.values())
+
+        for version in self.embedding_models.secondary_search_apps():
+            embedding = face.extra_embeddings.get(version)
+            if not embedding:
+                continue
+            try:
+                found = self.clickhouse_candidates(
+                    embedding,
+                    top_k=top_k,
+                    ef_search=ef_search,
+                    filters=filters,
+                    clusters=None,  # IVF centroidlar faqat primary model uchun
+                    model_version=version,
+                    max_distance=self.embedding_models.threshold(version, MAYBE_MATCH_MAX_DIST),
+                )
+            except Exception as e:
+                logger.warning("Search on model %s failed, skipping it: %s", version, e)
+                continue
+
+            for c in found:
+                distance = self.embedding_models.normalize_distance(version, c["distance"], MAYBE_MATCH_MAX_DIST)
+                prev = merged.get(c["person_id"])
+                if prev is None or distance < prev["distance"]:
+                    merged[c["person_id"]] = {"person_id": c["person_id"], "distance": distance, "model_version": version}
+
+        return sorted(merged.values(), key=lambda c: c["distance"])[:top_k]
 
     # ------------------------------------------------------
     # API entrypoint
@@ -66,8 +279,41 @@ class SearchService:
         return await self.search_by_image_b64(
             payload.photo_base64,
             filters=filters,
+            nprobe=payload.nprobe,
         )
 
+    # ------------------------------------------------------
+    # Detection: embedding service (bo'lsa) -> lokal inference
+    # ------------------------------------------------------
+    async def detect_faces(self, img, image_b64: str) -> List[FaceCandidate]:
+        params = dict(min_det_score=0.60, min_face_size=80, min_blur=QUALITY_MIN_BLUR, max_faces=10)
+        extra_models = self.embedding_models.secondary_search_apps() if self.embedding_models is not None else None
+
+        client = self.embedding_client
+        if client is not None and (client.available or self.face_app is None):
+            try:
+                return await asyncio.to_thread(
+                    client.detect,
+                    image_b64,
+                    version=self.model_version,
+                    extra_versions=list(extra_models or {}),
+                    lane=self.inference_lane,
+                    **params,
+                )
+            except (EmbeddingServiceUnavailable, BusyError, ValueError) as e:
+                # service band / tayyor emas / versiya yuklanmagan — lokal model bo'lsa u bilan
+                if self.face_app is None:  # lokal model yo'q — keyinroq qayta urinish
+                    if isinstance(e, EmbeddingServiceUnavailable):
+                        raise BusyError(client.retry_sec, "Embedding service is unavailable")
+                    raise
+                logger.info("Embedding service rejected the request, using the local model: %s", e)
+
+        detect = functools.partial(detect_all_faces_with_quality, img, self.face_app, extra_models=extra_models, **params)
+        # gate to'la bo'lsa BusyError (endpoint "busy, retry after" javobini qaytaradi)
+        if self.inference_gate is not None:
+            return await self.inference_gate.submit(detect, lane=self.inference_lane)
+        return await asyncio.to_thread(detect)
+
     # ------------------------------------------------------
     # Core search logic
     # ------------------------------------------------------
@@ -77,6 +323,7 @@ class SearchService:
         *,
         top_k: int = 10,
         ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
         filters: Optional[SearchFilters] = None,
     ) -> Dict[str, Any]:
 
@@ -95,15 +342,7 @@ class SearchService:
         # -------------------------
         # Detect faces with quality
         # -------------------------
-        faces: List[FaceCandidate] = await asyncio.to_thread(
-            detect_all_faces_with_quality,
-            img,
-            self.face_app,
-            min_det_score=0.60,
-            min_face_size=80,
-            min_blur=60.0,
-            max_faces=10,
-        )
+        faces = await self.detect_faces(img, image_b64)
 
         if not faces:
             return {
@@ -133,6 +372,7 @@ class SearchService:
                     "bbox": face.bbox,
                     "det_score": face.det_score,
                     "blur": face.blur,
+                    "brightness": face.brightness,
                     "face_size": face.face_size,
                 },
                 "matches": [],
@@ -152,13 +392,12 @@ class SearchService:
             # -------------------------
             # Search similar people
             # -------------------------
-            candidates = self.repo.search_similar_people(
-                face.embedding,
+            candidates = self.find_mixed_candidates(
+                face,
                 top_k=top_k,
                 ef_search=ef_search,
-                citizen=f.citizen,
-                dtb_from=f.dtb_from,
-                dtb_to=f.dtb_to,
+                filters=f,
+                nprobe=nprobe,
             )
 
             if not candidates:
@@ -171,9 +410,14 @@ class SearchService:
             person_ids = [c["person_id"] for c in candidates]
             uniq_ids = list(dict.fromkeys(person_ids))
 
-            profiles = self.repo.load_profiles(uniq_ids)
-            sgb_ids = self.repo.load_sgb_ids(uniq_ids)
-            borders = self.repo.load_last_entry_exit(uniq_ids)
+            if self.read_cache is not None:
+                profiles = self.read_cache.load_profiles(self.repo, uniq_ids)
+                sgb_ids = self.read_cache.load_sgb_ids(self.repo, uniq_ids)
+                borders = self.read_cache.load_last_entry_exit(self.repo, uniq_ids)
+            else:
+                profiles = self.repo.load_profiles(uniq_ids)
+                sgb_ids = self.repo.load_sgb_ids(uniq_ids)
+                borders = self.repo.load_last_entry_exit(uniq_ids)
 
             # -------------------------
             # Build matches
@@ -216,6 +460,7 @@ class SearchService:
                         "accuracy": distance_to_accuracy(distance),
                         "confidence": confidence,
                         "low_quality": low_quality,
+                        "model_version": c.get("model_version"),
                     },
                 })
 
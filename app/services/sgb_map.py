@@ -0,0 +1,129 @@
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SgbPersonMap:
+    """
+    sgb_person_id -> person_id in-process LRU (chegaralangan).
+
+    - startup'da bulk warm (oxirgi faol mappinglar)
+    - miss -> per-key single-flight: bir xil sgb uchun faqat bitta lookup/create,
+      qolganlar natijani kutadi (ikki xil UUID yaratilmaydi — bitta worker ichida; worker'lar orasida
+      create o'zi sgb lock ostida qayta o'qiydi: ProviderIngestService.create_person_locked)
+    - hits / misses / creates hisoblagichlari (/admin/sgb-map)
+    - ttl_sec: eski yozuvlar qayta lookup qilinadi (boshqa worker / tashqi jarayon mappingni o'zgartirgan
+      bo'lishi mumkin); invalidate() / clear() — darhol (POST /admin/sgb-map)
+    """
+
+    def __init__(self, capacity: int = 1_000_000, *, ttl_sec: Optional[float] = None):
+        self.capacity = int(capacity)
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[int, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.creates = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # self._lock ostida chaqiriladi
+    def _put(self, sgb_person_id: int, person_id: Any, now: float) -> None:
+        self._items[sgb_person_id] = (now, person_id)
+        self._items.move_to_end(sgb_person_id)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+    def _lookup(self, sgb_person_id: int, now: float) -> Optional[Any]:
+        item = self._items.get(sgb_person_id)
+        if item is None:
+            return None
+        stored_at, pid = item
+        if self.ttl_sec is not None and now - stored_at >= self.ttl_sec:
+            del self._items[sgb_person_id]
+            self.expired += 1
+            return None
+        self._items.move_to_end(sgb_person_id)
+        return pid
+
+    def get(self, sgb_person_id: int) -> Optional[Any]:
+        with self._lock:
+            return self._lookup(int(sgb_person_id), time.monotonic())
+
+    def put(self, sgb_person_id: int, person_id: Any) -> None:
+        with self._lock:
+            self._put(int(sgb_person_id), person_id, time.monotonic())
+
+    def invalidate(self, sgb_person_id: int) -> None:
+        with self._lock:
+            if self._items.pop(int(sgb_person_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._items)
+            self._items.clear()
+
+    def warm(self, rows: Iterable[Tuple[int, Any]]) -> int:
+        loaded = 0
+        now = time.monotonic()
+        with self._lock:
+            for sgb_person_id, person_id in rows:
+                self._put(int(sgb_person_id), person_id, now)
+                loaded += 1
+        return loaded
+
+    def resolve(
+        self,
+        sgb_person_id: int,
+        lookup: Callable[[int], Optional[Any]],
+        create: Callable[[int], Any],
+    ) -> Any:
+        sgb_person_id = int(sgb_person_id)
+        with self._lock:
+            pid = self._lookup(sgb_person_id, time.monotonic())
+            if pid is not None:
+                self.hits += 1
+                return pid
+            self.misses += 1
+            flight = self._inflight.setdefault(sgb_person_id, threading.Lock())
+
+        with flight:
+            # oldingi flight natijani allaqachon qo'ygan bo'lishi mumkin
+            pid = self.get(sgb_person_id)
+            if pid is None:
+                pid = lookup(sgb_person_id)
+                if pid is None:
+                    pid = create(sgb_person_id)
+                    with self._lock:
+                        self.creates += 1
+                self.put(sgb_person_id, pid)
+
+        with self._lock:
+            if self._inflight.get(sgb_person_id) is flight and not flight.locked():
+                self._inflight.pop(sgb_person_id, None)
+        return pid
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "creates": self.creates,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+                "ttl_sec": self.ttl_sec,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMB_SIZE = 512
+
+# person_embeddings slotlari: 0 -> normallashtirilgan centroid (search shuni scan qiladi),
+# 1..K -> alohida template'lar (rerank uchun)
+CENTROID_SLOT = 0
+FIRST_TEMPLATE_SLOT = 1
+
+# yangi rasm shuncha ball yomonroq bo'lsa ham qabul qilinadi: best photo (choose_best_photo) va template slot
+# bir xil qoida bilan — K=1 da slot 0 vektori snapshot'dagi best photo bilan bir xil qoladi
+QUALITY_TOLERANCE = 5.0
+# template rasmi hech bir snapshot'da best photo emas (embedding faqat person_embeddings'da)
+NO_DOCUMENT_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def normalized_centroid(vectors: Sequence[Sequence[float]]) -> List[float]:
+    """Template'larning (har biri normallashtirilgan) o'rtachasi, yana normallashtirilgan."""
+    mat = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, EMB_SIZE))
+    return _normalize(mat.mean(axis=0)).astype(np.float32).tolist()
+
+
+def pick_template_slot(
+    scores_by_slot: Dict[int, float],
+    new_score: float,
+    max_templates: int,
+) -> Optional[int]:
+    """
+    Yangi EMB_OK rasm qaysi slotga yoziladi:
+      - bo'sh slot bo'lsa -> birinchi bo'sh slot
+      - aks holda eng yomon template'dan QUALITY_TOLERANCE dan ko'p yomon bo'lmasa -> o'sha slot
+      - aks holda None (template to'plami o'zgarmaydi)
+    """
+    for slot in range(FIRST_TEMPLATE_SLOT, FIRST_TEMPLATE_SLOT + max_templates):
+        if slot not in scores_by_slot:
+            return slot
+
+    worst_slot = min(scores_by_slot, key=scores_by_slot.get)
+    if new_score + QUALITY_TOLERANCE >= scores_by_slot[worst_slot]:
+        return worst_slot
+    return None
+
+
+def rerank_by_templates(
+    ref_vec: Sequence[float],
+    candidates: List[Dict[str, Any]],
+    templates: Dict[Any, List[List[float]]],
+    *,
+    top_k: int,
+    max_distance: float,
+) -> List[Dict[str, Any]]:
+    """
+    Centroid bo'yicha topilgan kandidatlar -> har bir person template'lari bilan max similarity.
+    Barcha template'lar bitta matritsada: bitta matmul + reduceat.
+    Template'i yo'q kandidat centroid masofasini saqlaydi.
+    """
+    q = _normalize(np.asarray(ref_vec, dtype=np.float32).reshape(EMB_SIZE))
+
+    owners: List[Any] = []
+    starts: List[int] = []
+    rows: List[List[float]] = []
+    for c in candidates:
+        vecs = templates.get(c["person_id"])
+        if not vecs:
+            continue
+        owners.append(c["person_id"])
+        starts.append(len(rows))
+        rows.extend(vecs)
+
+    best: Dict[Any, float] = {}
+    if rows:
+        sims = _normalize(np.asarray(rows, dtype=np.float32).reshape(-1, EMB_SIZE)) @ q
+        for pid, sim in zip(owners, np.maximum.reduceat(sims, starts)):
+            best[pid] = 1.0 - float(sim)
+
+    out = []
+    for c in candidates:
+        distance = best.get(c["person_id"], c["distance"])
+        if distance <= max_distance:
+            out.append({"person_id": c["person_id"], "distance": distance})
+    out.sort(key=lambda r: r["distance"])
+    return out[:top_k]
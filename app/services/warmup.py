@@ -0,0 +1,93 @@
+from __future__ import annotations
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _synthetic(shape, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 255, shape, dtype=np.uint8)
+
+
+def warm_round(face_app, batch_sizes: Sequence[int]) -> None:
+    """
+    Bitta to'liq aylana: detection (det input size) + recognition (har bir batch o'lchami)
+    + qolgan modellar (landmark / genderage) — sintetik yuzlar bilan.
+    """
+    from insightface.app.common import Face
+
+    det = face_app.det_model
+    w, h = det.input_size or (640, 640)
+    image = _synthetic((h, w, 3), seed=0)
+    det.detect(image, max_num=0, metric="default")
+
+    rec = face_app.models.get("recognition")
+    if rec is not None:
+        size = rec.input_size[0]
+        crop = _synthetic((size, size, 3), seed=1)
+        for batch in batch_sizes:
+            rec.get_feat([crop] * max(1, int(batch)))
+
+    face = Face(
+        bbox=np.array([w * 0.3, h * 0.3, w * 0.7, h * 0.7], dtype=np.float32),
+        kps=None,
+        det_score=1.0,
+    )
+    for taskname, model in face_app.models.items():
+        if taskname in ("detection", "recognition"):
+            continue
+        model.get(image, face)
+
+
+def is_stable(rounds_ms: List[float], ratio: float, window: int = 3) -> bool:
+    """Oxirgi `window` ta aylana bir-biridan ratio martadan ko'p farq qilmaydi."""
+    if len(rounds_ms) < window:
+        return False
+    last = rounds_ms[-window:]
+    return max(last) <= min(last) * ratio
+
+
+def warm_up(
+    face_app,
+    *,
+    batch_sizes: Sequence[int],
+    min_rounds: int,
+    max_rounds: int,
+    stable_ratio: float,
+) -> Dict[str, Any]:
+    """
+    Latency barqarorlashguncha (yoki max_rounds gacha) aylanalar: ONNX session init, allocator o'sishi,
+    kernel tanlovi birinchi real so'rovga qolmaydi.
+    """
+    rounds_ms: List[float] = []
+    started = time.perf_counter()
+    for _ in range(max(1, max_rounds)):
+        t0 = time.perf_counter()
+        warm_round(face_app, batch_sizes)
+        rounds_ms.append((time.perf_counter() - t0) * 1000.0)
+        if len(rounds_ms) >= min_rounds and is_stable(rounds_ms, stable_ratio):
+            break
+
+    stable = is_stable(rounds_ms, stable_ratio)
+    report = {
+        "rounds": len(rounds_ms),
+        "stable": stable,
+        "first_ms": round(rounds_ms[0], 1),
+        "last_ms": round(rounds_ms[-1], 1),
+        "median_ms": round(statistics.median(rounds_ms), 1),
+        "total_sec": round(time.perf_counter() - started, 2),
+    }
+    if not stable:
+        logger.warning("Model warm-up latency did not stabilize: %s", report)
+    return report
+
+
+def unstable_versions(reports: Any) -> List[str]:
+    """warm_up hisobotlari ({version: report}) ichida latency barqarorlashmagan versiyalar."""
+    if not isinstance(reports, dict):
+        return []
+    return sorted(v for v, r in reports.items() if isinstance(r, dict) and r.get("stable") is False)
@@ -1,6 +1,8 @@
 # app/utils/response.py
 from typing import Any, Dict
 
+from fastapi.responses import JSONResponse
+
 def success(data: Any = None, message: str = "Success", **kwargs) -> Dict:
     """Success response formatter"""
     response = {
@@ -21,4 +23,13 @@ def error(message: str = "Error", code: str = None, **kwargs) -> Dict:
     }
     if code:
         response["code"] = code
-    return response
\ No newline at end of file
+    return response
+
+
+def busy(retry_after: float, message: str = "Server is busy, retry later", **kwargs) -> JSONResponse:
+    """Load shedding: error() konverti + code="busy" + Retry-After header (HTTP 200, boshqa javoblar kabi)"""
+    return JSONResponse(
+        status_code=200,
+        content=error(message=message, code="busy", retry_after=retry_after, **kwargs),
+        headers={"Retry-After": str(max(1, int(round(retry_after))))},
+    )
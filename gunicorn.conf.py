@@ -0,0 +1,38 @@
+"""
+Ko'p worker'li rejim: og'irliklar master'da bir marta, worker'lar ularni copy-on-write bo'lishadi.
+
+    SERVER_WORKERS=4 gunicorn -c gunicorn.conf.py app.main:app
+
+Master ONNX session / thread pool yaratmaydi (thread'lar fork'dan o'tmaydi) — session'lar har bir worker'ning
+startup'ida (create_face_app) shu og'irliklar ustiga quriladi. Worker xotirasi: /health/ready -> data.memory.
+"""
+import logging
+
+from app.config import (
+    SERVER_BIND, SERVER_WORKERS, SERVER_TIMEOUT_SEC, MODEL_PRELOAD, EMBED_SERVICE_URL, EMBED_LOCAL_MODEL,
+    EMBEDDING_MODEL_VERSION, EMBEDDING_DUAL_WRITE, EMBEDDING_SEARCH_VERSIONS,
+)
+
+bind = SERVER_BIND
+workers = max(1, SERVER_WORKERS)
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = SERVER_TIMEOUT_SEC  # model yuklash + warm-up worker startup'ida
+preload_app = True  # app kodi ham master'da import qilinadi (sahifalar umumiy)
+
+
+def on_starting(server):
+    if not MODEL_PRELOAD or (EMBED_SERVICE_URL and not EMBED_LOCAL_MODEL):
+        return  # API node'da model yo'q (inference embedding service'da)
+    from app.services.embedding_models import parse_versions
+    from app.services.face_recognition import preload_face_models
+
+    names = [EMBEDDING_MODEL_VERSION] + parse_versions(EMBEDDING_DUAL_WRITE) + parse_versions(EMBEDDING_SEARCH_VERSIONS)
+    try:
+        preload_face_models(names)
+    except Exception as e:
+        # worker'lar o'z og'irliklarini o'zi yuklaydi (eski xatti-harakat)
+        logging.getLogger("gunicorn.error").error(f"Model weight preload failed: {e}")
+
+
+def post_fork(server, worker):
+    server.log.info(f"Worker {worker.pid} forked (shared weights: {MODEL_PRELOAD})")
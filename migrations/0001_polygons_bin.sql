@@ -0,0 +1,6 @@
+-- Quantized (sign-bit) embedding column for two-stage search.
+-- 512 float -> 8 x UInt64 (64 bytes per row instead of ~2 KB).
+-- Existing rows: python -m scripts.backfill_polygons_bin
+
+ALTER TABLE person_documents_v2
+    ADD COLUMN IF NOT EXISTS polygons_bin Array(UInt64) DEFAULT [] AFTER polygons;
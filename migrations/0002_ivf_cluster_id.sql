@@ -0,0 +1,25 @@
+-- IVF coarse partitioning (python -m scripts.train_ivf).
+-- cluster_id = 0 -> hali tayinlanmagan; haqiqiy klasterlar 1..nlist.
+
+CREATE TABLE IF NOT EXISTS ivf_centroids
+(
+    version    UInt32,
+    cluster_id UInt32,
+    centroid   Array(Float32),
+    created_at DateTime DEFAULT now()
+)
+ENGINE = MergeTree
+ORDER BY (version, cluster_id);
+
+ALTER TABLE person_documents_v2
+    ADD COLUMN IF NOT EXISTS cluster_id UInt32 DEFAULT 0 AFTER polygons_bin;
+
+-- cluster_id bo'yicha saralangan nusxa: WHERE cluster_id IN (...) primary-key pruning bilan o'qiydi
+ALTER TABLE person_documents_v2
+    ADD PROJECTION IF NOT EXISTS p_by_cluster
+    (
+        SELECT *
+        ORDER BY cluster_id
+    );
+
+ALTER TABLE person_documents_v2 MATERIALIZE PROJECTION p_by_cluster;
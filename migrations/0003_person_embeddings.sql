@@ -0,0 +1,51 @@
+-- Per-person embedding store: search shu jadvalni scan qiladi (person_documents_v2 emas).
+-- Yangi qator faqat best photo o'zgarganda yoziladi; (person_id, slot) bo'yicha replace.
+
+CREATE TABLE IF NOT EXISTS person_embeddings
+(
+    person_id    UUID,
+    slot         UInt8 DEFAULT 0,
+    document_id  UUID,
+    face_url     Nullable(String),
+    polygons     Array(Float32),
+    polygons_bin Array(UInt64) DEFAULT [],
+    cluster_id   UInt32 DEFAULT 0,
+    det_score    Float32 DEFAULT 0,
+    blur         Float32 DEFAULT 0,
+    face_size    UInt32 DEFAULT 0,
+    faces_found  UInt16 DEFAULT 0,
+    is_active    UInt8 DEFAULT 1,
+    version      DateTime64(3) DEFAULT now64(3),
+
+    -- cluster_id bo'yicha saralangan to'liq nusxa (512 float polygons ham) — jadval diskda ~2x.
+    PROJECTION p_by_cluster
+    (
+        SELECT *
+        ORDER BY cluster_id
+    )
+)
+ENGINE = ReplacingMergeTree(version)
+ORDER BY (person_id, slot)
+-- ClickHouse 24.8+: ReplacingMergeTree'dagi projection bu sozlamasiz rad etiladi (merge'da projection qayta quriladi)
+SETTINGS deduplicate_merge_projection_mode = 'rebuild';
+
+-- Backfill: har bir person uchun oxirgi EMB_OK snapshot
+INSERT INTO person_embeddings
+    (person_id, slot, document_id, face_url, polygons, polygons_bin, cluster_id,
+     det_score, blur, face_size, faces_found, is_active)
+SELECT
+    person_id,
+    0,
+    argMax(id, version),
+    argMax(face_url, version),
+    argMax(polygons, version),
+    argMax(polygons_bin, version),
+    argMax(cluster_id, version),
+    argMax(det_score, version),
+    argMax(blur, version),
+    argMax(face_size, version),
+    argMax(faces_found, version),
+    1
+FROM person_documents_v2
+WHERE has_embedding = 1
+GROUP BY person_id;
@@ -0,0 +1,13 @@
+-- Multi-template gallery: person_embeddings slot 0 = centroid, slot 1..K = template'lar.
+-- 0003 backfill'idagi yagona embedding slot 1 ga template sifatida ko'chiriladi
+-- (bitta template'ning centroidi — o'zi, shuning uchun slot 0 o'zgarmaydi).
+
+INSERT INTO person_embeddings
+    (person_id, slot, document_id, face_url, polygons, polygons_bin, cluster_id,
+     det_score, blur, face_size, faces_found, is_active)
+SELECT
+    person_id, 1, document_id, face_url, polygons, polygons_bin, cluster_id,
+    det_score, blur, face_size, faces_found, is_active
+FROM person_embeddings FINAL
+WHERE slot = 0
+  AND person_id NOT IN (SELECT person_id FROM person_embeddings WHERE slot > 0);
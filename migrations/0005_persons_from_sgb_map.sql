@@ -0,0 +1,9 @@
+-- Yangi person yaratish = bitta insert (person_sgb_map_v2); persons_v2 qatori MV orqali yoziladi.
+-- Shundan keyin FaceIdRepo.insert_person ingest yo'lida chaqirilmaydi.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS persons_v2_from_sgb_map
+TO persons_v2
+AS
+SELECT person_id AS id
+FROM person_sgb_map_v2
+WHERE is_active = 1;
@@ -0,0 +1,15 @@
+-- Embedding model versiyasi: har bir snapshot va person_embeddings qatori qaysi model bilan olinganini saqlaydi.
+-- person_embeddings: (person_id, slot, model_version) — dual-write paytida har bir versiya o'z qatorlariga ega.
+
+ALTER TABLE person_documents_v2
+    ADD COLUMN IF NOT EXISTS model_version LowCardinality(String) DEFAULT 'buffalo_l';
+
+-- Sort key'ga faqat shu ALTER'da qo'shilgan va DEFAULT'siz ustun qo'shiladi
+-- ("Newly added column ... has a default expression" xatosi), default keyingi ALTER'da.
+ALTER TABLE person_embeddings
+    ADD COLUMN IF NOT EXISTS model_version LowCardinality(String),
+    MODIFY ORDER BY (person_id, slot, model_version);
+
+-- Ustuni yo'q eski part'lar o'qilganda joriy DEFAULT ifodasi qo'llanadi -> mavjud qatorlar 'buffalo_l'.
+ALTER TABLE person_embeddings
+    MODIFY COLUMN model_version LowCardinality(String) DEFAULT 'buffalo_l';
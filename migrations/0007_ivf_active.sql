@@ -0,0 +1,15 @@
+-- IVF versiyalarini faollashtirish: train_ivf yangi centroidlarni "pending" sifatida chiqaradi,
+-- mavjud qatorlar qayta tayinlanib (apply_assignments) mutation'lar tugagandan keyingina shu yerga yozadi.
+-- Worker'lar faol + pending versiyalarni birga probe qiladi, eski versiya faqat faollashtirishdan keyin tushadi.
+
+CREATE TABLE IF NOT EXISTS ivf_active
+(
+    version      UInt32,
+    activated_at DateTime DEFAULT now()
+)
+ENGINE = MergeTree
+ORDER BY version;
+
+-- shu migratsiyagacha chiqarilgan oxirgi versiya (qatorlari allaqachon tayinlangan) faol hisoblanadi
+INSERT INTO ivf_active (version)
+SELECT max(version) FROM ivf_centroids HAVING count() > 0;
@@ -0,0 +1,8 @@
+-- Blur shkalasi versiyasi: 0 — eski o'lchov (asl rasmdagi crop), 1 — QUALITY_CHIP_SIZE chip (face_quality.QUALITY_SCALE).
+-- Mavjud qatorlar 0 bo'lib qoladi: ingest ularning blur'ini yangi rasmlar blur'i bilan solishtirmaydi.
+
+ALTER TABLE person_documents_v2
+    ADD COLUMN IF NOT EXISTS quality_scale UInt8 DEFAULT 0;
+
+ALTER TABLE person_embeddings
+    ADD COLUMN IF NOT EXISTS quality_scale UInt8 DEFAULT 0;
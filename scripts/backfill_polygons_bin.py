@@ -0,0 +1,69 @@
+"""
+polygons_bin backfill (migrations/0001_polygons_bin.sql dan keyin).
+
+    python -m scripts.backfill_polygons_bin            # mutation + kutish
+    python -m scripts.backfill_polygons_bin --dry-run  # nechta qator qolganini ko'rsatadi
+
+Sign bits ClickHouse ichida hisoblanadi (SIGN_BITS_SQL), natija
+app.services.quantization.pack_sign_bits bilan bit-ma-bit bir xil.
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from app.services.database import client
+from app.services.quantization import SIGN_BITS_SQL, EMB_SIZE
+
+PENDING_WHERE = f"length(polygons_bin) = 0 AND length(polygons) = {EMB_SIZE}"
+
+
+def count_pending() -> int:
+    rows = client.execute(f"SELECT count() FROM person_documents_v2 WHERE {PENDING_WHERE}")
+    return int(rows[0][0]) if rows else 0
+
+
+def wait_mutations(poll_sec: float) -> None:
+    while True:
+        rows = client.execute(
+            """
+            SELECT count(), sum(parts_to_do), any(latest_fail_reason)
+            FROM system.mutations
+            WHERE database = currentDatabase()
+              AND table IN ('person_documents_v2', 'person_embeddings')
+              AND is_done = 0
+            """
+        )
+        running, parts_to_do, fail_reason = rows[0]
+        if not running:
+            return
+        if fail_reason:
+            raise RuntimeError(f"Mutation failed: {fail_reason}")
+        print(f"mutations running={running} parts_to_do={parts_to_do}")
+        time.sleep(poll_sec)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill person_documents_v2.polygons_bin")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--no-wait", action="store_true")
+    parser.add_argument("--poll-sec", type=float, default=5.0)
+    args = parser.parse_args()
+
+    pending = count_pending()
+    print(f"rows without polygons_bin: {pending}")
+    if args.dry_run or pending == 0:
+        return
+
+    started = time.perf_counter()
+    client.execute(
+        f"ALTER TABLE person_documents_v2 UPDATE polygons_bin = {SIGN_BITS_SQL} WHERE {PENDING_WHERE}"
+    )
+    if args.no_wait:
+        return
+
+    wait_mutations(args.poll_sec)
+    print(f"done in {time.perf_counter() - started:.1f}s, still pending: {count_pending()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Inference throughput / latency: ONNX Runtime thread sozlamalari x parallel so'rovlar soni.
+
+    python -m scripts.bench_inference --images 'data/bench/*.jpg' --requests 200 \\
+        --concurrency 1,2,4,8 --intra 0,1,2,4
+
+--intra 0 -> avtomatik (cpu_count / concurrency). Har bir (intra, concurrency) uchun model qayta yuklanadi.
+--images berilmasa sintetik rasmlar (faqat detection ishlaydi — recognition o'lchanmaydi).
+"""
+from __future__ import annotations
+import argparse
+import glob
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import List
+
+import numpy as np
+
+from app.services.face_recognition import create_face_app, default_ort_config
+from app.services.onnx_runtime import parse_cpu_list, pinning_initializer
+
+
+def load_images(pattern: str, n: int) -> List[np.ndarray]:
+    import cv2
+
+    images = []
+    for path in sorted(glob.glob(pattern))[:n]:
+        img = cv2.imread(path)
+        if img is not None:
+            images.append(img)
+    return images
+
+
+def synthetic_images(n: int, size: int = 640) -> List[np.ndarray]:
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run(face_app, images: List[np.ndarray], requests: int, concurrency: int, cores: List[int], intra: int):
+    latencies: List[float] = []
+
+    def one(i: int) -> None:
+        t0 = time.perf_counter()
+        face_app.get(images[i % len(images)])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    pool = ThreadPoolExecutor(
+        max_workers=concurrency,
+        initializer=pinning_initializer(cores, cores_per_thread=max(1, intra)),
+    )
+    with pool:
+        list(pool.map(one, range(min(concurrency, requests))))  # warm-up
+        latencies.clear()
+        started = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ONNX Runtime inference throughput benchmark")
+    parser.add_argument("--model", default="buffalo_l")
+    parser.add_argument("--images", default="", help="glob of face photos")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--intra", default="0", help="ORT intra-op threads per session (0 = auto)")
+    parser.add_argument("--execution-mode", default=None, choices=["sequential", "parallel"])
+    parser.add_argument("--graph-opt", default=None, choices=["disable", "basic", "extended", "all"])
+    parser.add_argument("--no-mem-arena", action="store_true")
+    parser.add_argument("--cpu-cores", default="", help="pin inference threads, e.g. 0-7")
+    args = parser.parse_args()
+
+    images = load_images(args.images, 64) if args.images else []
+    if not images:
+        print("no images given/found, using synthetic images (detection only)")
+        images = synthetic_images(16)
+
+    base = default_ort_config()
+    if args.execution_mode:
+        base = replace(base, execution_mode=args.execution_mode)
+    if args.graph_opt:
+        base = replace(base, graph_optimization_level=args.graph_opt)
+    if args.no_mem_arena:
+        base = replace(base, cpu_mem_arena=False)
+    cores = parse_cpu_list(args.cpu_cores)
+
+    print(f"{'intra':>6} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for intra in (int(v) for v in args.intra.split(",") if v.strip()):
+        for concurrency in (int(v) for v in args.concurrency.split(",") if v.strip()):
+            config = replace(base, intra_op_threads=intra)
+            face_app = create_face_app(args.model, ort_config=config, concurrency=concurrency)
+            throughput, lat = run(face_app, images, args.requests, concurrency, cores, intra)
+            label = str(intra) if intra else f"a{config.resolved_intra_threads(concurrency)}"
+            print(
+                f"{label:>6} {concurrency:>5} {throughput:>8.1f} "
+                f"{statistics.median(lat):>9.1f} {percentile(lat, 0.99):>9.1f}"
+            )
+            del face_app
+
+
+if __name__ == "__main__":
+    main()
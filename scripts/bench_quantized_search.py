@@ -0,0 +1,80 @@
+"""
+Recall@k vs latency: exact scan vs polygons_bin two-stage scan.
+
+    python -m scripts.bench_quantized_search --queries 200 --top-k 10 \\
+        --candidates 100,200,300,500,1000
+
+Query sifatida bazadagi tasodifiy embeddinglar ishlatiladi;
+ground truth = exact scan (coarse_candidates=0).
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import time
+from typing import List
+
+from app.services.database import client
+from app.repositories.search_repo import SearchRepo
+
+
+def sample_queries(n: int) -> List[List[float]]:
+    rows = client.execute(
+        """
+        SELECT polygons
+        FROM person_documents_v2
+        WHERE has_embedding = 1
+        ORDER BY rand()
+        LIMIT %(n)s
+        """,
+        {"n": n},
+    )
+    return [list(r[0]) for r in rows]
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run(repo: SearchRepo, queries, top_k: int, max_distance: float, coarse: int):
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        rows = repo.search_similar_people(
+            q, top_k=top_k, max_distance=max_distance, coarse_candidates=coarse,
+        )
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        results.append([r["person_id"] for r in rows])
+    return results, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Quantized two-stage search benchmark")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--max-distance", type=float, default=2.0)
+    parser.add_argument("--candidates", default="100,200,300,500,1000")
+    args = parser.parse_args()
+
+    repo = SearchRepo(client)
+    queries = sample_queries(args.queries)
+    if not queries:
+        print("no embeddings found")
+        return
+
+    truth, exact_lat = run(repo, queries, args.top_k, args.max_distance, 0)
+    print(f"{'mode':>12} {'recall@k':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    print(f"{'exact':>12} {1.0:>9.4f} {statistics.median(exact_lat):>9.1f} {percentile(exact_lat, 0.95):>9.1f}")
+
+    for coarse in (int(c) for c in args.candidates.split(",") if c.strip()):
+        got, lat = run(repo, queries, args.top_k, args.max_distance, coarse)
+        hits = total = 0
+        for t, g in zip(truth, got):
+            total += len(t)
+            hits += len(set(t) & set(g))
+        recall = hits / total if total else 1.0
+        print(f"{'bin@' + str(coarse):>12} {recall:>9.4f} {statistics.median(lat):>9.1f} {percentile(lat, 0.95):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
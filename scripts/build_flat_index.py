@@ -0,0 +1,44 @@
+"""
+Flat mmap index'ni ClickHouse'dan to'liq qayta qurish (har bir person uchun oxirgi embedding).
+
+    python -m scripts.build_flat_index [--path data/flat_index] [--dtype float16]
+
+Ishlab turgan worker'lar yangi generation'ni MANIFEST.json orqali o'zi ko'radi.
+MANIFEST format versiyasi (flat_index.FORMAT_VERSION) mos kelmasa worker'lar index'ni ochmaydi
+(ClickHouse / ANN fallback) — shu skript uni yangi formatda qayta quradi, eski tail tashlanadi.
+"""
+from __future__ import annotations
+import argparse
+import time
+
+from app.config import FLAT_INDEX_PATH, FLAT_INDEX_DTYPE, EMBEDDING_MODEL_VERSION
+from app.services.database import client
+from app.repositories.search_repo import SearchRepo
+from app.services.flat_index import FlatEmbeddingStore
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build flat mmap embedding index")
+    parser.add_argument("--path", default=FLAT_INDEX_PATH)
+    parser.add_argument("--dtype", default=FLAT_INDEX_DTYPE, choices=("float16", "float32"))
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--model-version", default=EMBEDDING_MODEL_VERSION)
+    args = parser.parse_args()
+
+    store = FlatEmbeddingStore(args.path, dtype=args.dtype)
+    repo = SearchRepo(client)
+
+    started = time.perf_counter()
+    rows = (
+        (person_id, polygons, citizen, dtb)
+        for person_id, polygons, _, citizen, dtb in repo.iter_best_embeddings(
+            batch_size=args.batch_size, model_version=args.model_version,
+        )
+    )
+    total = store.write_base(rows, model_version=args.model_version, chunk=args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"written {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s): {store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Saqlangan rasmlarni qayta embedding qilish (offline backfill), trafikni qayta yubormasdan.
+
+    # quality gate'lar yumshatilgandan keyin EMB_LOW_QUALITY qatorlar
+    python -m scripts.reembed --statuses 2 --min-blur 10 --workers 8
+
+    # model yangilangandan keyin hammasi
+    python -m scripts.reembed --statuses all --workers 8
+
+    python -m scripts.reembed --dry-run --limit 10000   # hech narsa yozmaydi
+    python -m scripts.reembed --resume                  # checkpoint'dan davom etish
+
+Tartib:
+  1) person_documents_v2 dan har bir person'ning oxirgi snapshot'i — person_id bo'yicha sahifalab
+  2) face_url rasmlari thread'larda oldindan o'qiladi (read-ahead)
+  3) get_face_embedding_strict — process pool'da, chunk'lar bilan
+  4) yangi EMB_OK natijalar: snapshot'lar bitta columnar insert, template/centroid qatorlari bitta insert
+  5) har bir chunk tartib bilan yozilgach checkpoint (oxirgi person_id) yangilanadi
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import EMBEDDING_MODEL_VERSION, QUALITY_MIN_BLUR, TEMPLATES_PER_PERSON, TEMPLATE_LOCK_PATH
+from app.services.database import client
+from app.repositories.faceid_repo import FaceIdRepo
+from app.repositories.ivf_repo import IvfRepo
+from app.services.ivf import IvfCentroids
+from app.services.quantization import pack_sign_bits
+from app.services.face_quality import QUALITY_SCALE
+from app.services.person_locks import PersonLocks
+from app.services.utils import new_uuid
+from app.services.provider_ingest_service import ProviderIngestService, PhotoResult, EMB_OK
+
+# ----------------------------------------------------------
+# process pool worker (har bir process o'z modelini bir marta yuklaydi)
+# ----------------------------------------------------------
+_face_app = None
+_gates: Dict[str, float] = {}
+
+
+def _init_worker(gates: Dict[str, float], workers: int) -> None:
+    global _face_app, _gates
+    from app.services.face_recognition import create_face_app
+
+    # core'lar process'lar orasida bo'linadi (ORT_INTRA_OP_THREADS berilmagan bo'lsa)
+    _face_app = create_face_app(EMBEDDING_MODEL_VERSION, concurrency=workers)
+    _gates = gates
+
+
+def _embed_chunk(items: List[Tuple[int, Optional[bytes]]]) -> List[Tuple[int, Any]]:
+    from app.services.image_service import decode_cv2
+    from app.services.face_pipeline import get_face_embedding_strict
+
+    out = []
+    for key, data in items:
+        res = None
+        if data is not None:
+            try:
+                res = get_face_embedding_strict(decode_cv2(data), _face_app, **_gates)
+            except Exception:
+                res = None
+        out.append((key, res))
+    return out
+
+
+# ----------------------------------------------------------
+# checkpoint
+# ----------------------------------------------------------
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w") as fh:
+        json.dump(state, fh, default=str)
+    os.replace(path + ".tmp", path)
+
+
+def read_image(base_dir: str, face_url: str) -> Optional[bytes]:
+    try:
+        with open(os.path.join(base_dir, face_url), "rb") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def snapshot_row(doc: Dict[str, Any], res, ivf: IvfCentroids) -> Dict[str, Any]:
+    polygons = res.embedding
+    return {
+        "id": new_uuid(),
+        "person_id": doc["person_id"],
+        "citizen": doc["citizen"],
+        "citizen_sgb": doc["citizen_sgb"],
+        "dtb": doc["dtb"],
+        "passport": doc["passport"],
+        "passport_expired": doc["passport_expired"],
+        "sex": doc["sex"],
+        "full_name": doc["full_name"],
+        "face_url": doc["face_url"],
+        "polygons": polygons,
+        "polygons_bin": pack_sign_bits(polygons),
+        "cluster_id": ivf.assign(polygons),
+        "embedding_status": EMB_OK,
+        "det_score": float(res.meta.det_score),
+        "blur": float(res.meta.blur),
+        "face_size": int(res.meta.face_size),
+        "faces_found": int(res.meta.faces_found),
+        "quality_scale": QUALITY_SCALE,
+        "model_version": EMBEDDING_MODEL_VERSION,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-embed stored photos and write new snapshots")
+    parser.add_argument("--statuses", default="2", help="comma-separated embedding_status values, or 'all'")
+    parser.add_argument("--base-dir", default=".", help="face_url paths are relative to this directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--chunk-size", type=int, default=32, help="images per process-pool task")
+    parser.add_argument("--page-size", type=int, default=5000, help="persons per ClickHouse page")
+    parser.add_argument("--read-ahead", type=int, default=16, help="image reader threads")
+    parser.add_argument("--min-det-score", type=float, default=0.60)
+    parser.add_argument("--min-face-size", type=int, default=80)
+    parser.add_argument("--min-blur", type=float, default=QUALITY_MIN_BLUR)
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many persons (0 = all)")
+    parser.add_argument("--checkpoint", default="data/reembed.checkpoint.json")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    statuses = None if args.statuses == "all" else [int(s) for s in args.statuses.split(",")]
+    gates = {"min_det_score": args.min_det_score, "min_face_size": args.min_face_size, "min_blur": args.min_blur}
+
+    repo = FaceIdRepo(client)
+    # API bilan bir xil: migrations 0003/0004 bo'lmasa bitta template; lock — ishlayotgan ingest bilan ketma-ket
+    templates_per_person = TEMPLATES_PER_PERSON if repo.person_templates_ready() else 1
+    if templates_per_person != TEMPLATES_PER_PERSON:
+        print("person_embeddings templates are missing (migrations/0003, 0004), TEMPLATES_PER_PERSON=1")
+    service = ProviderIngestService(
+        repo,
+        face_app=None,
+        templates_per_person=templates_per_person,
+        template_locks=PersonLocks(TEMPLATE_LOCK_PATH),
+    )
+    ivf = IvfCentroids()
+    try:
+        ivf.refresh(IvfRepo(client))
+    except Exception as e:
+        print(f"IVF centroids not loaded, cluster_id=0: {e}")
+    service.ivf_centroids = ivf
+
+    state = load_checkpoint(args.checkpoint) if args.resume else {}
+    after = state.get("after_person_id")
+    totals = {"seen": 0, "ok": 0, "failed": 0, "missing": 0, "written": 0}
+    if after is not None:
+        print(f"resuming after person_id={after}")
+
+    started = time.perf_counter()
+    readers = ThreadPoolExecutor(max_workers=args.read_ahead)
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(gates, args.workers))
+    inflight: deque = deque()  # (docs, future) — submission tartibida yoziladi
+
+    def drain_one() -> None:
+        nonlocal after
+        docs, future = inflight.popleft()
+        snapshots, templates = [], []
+        for key, res in future.result():
+            if res is None:
+                totals["failed"] += 1
+                continue
+            totals["ok"] += 1
+            snapshots.append(snapshot_row(docs[key], res, ivf))
+
+        if not args.dry_run:
+            # template'lar load'dan upsert'gacha lock ostida (ishlayotgan ingest bilan bir person'ga yozilmasin)
+            with service.template_lock([row["person_id"] for row in snapshots]):
+                for row in snapshots:
+                    templates.extend(service.template_rows(
+                        row["person_id"],
+                        row["id"],
+                        PhotoResult(
+                            face_url=row["face_url"],
+                            polygons=row["polygons"],
+                            embedding_status=EMB_OK,
+                            det_score=row["det_score"],
+                            blur=row["blur"],
+                            face_size=row["face_size"],
+                            faces_found=row["faces_found"],
+                        ),
+                    ))
+                repo.insert_document_snapshots(snapshots)
+                if templates:
+                    repo.upsert_person_embeddings(templates)
+            totals["written"] += len(snapshots)
+            after = docs[-1]["person_id"]
+            save_checkpoint(args.checkpoint, {"after_person_id": after, **totals})
+
+        elapsed = time.perf_counter() - started
+        print(
+            f"seen={totals['seen']} ok={totals['ok']} failed={totals['failed']} "
+            f"missing={totals['missing']} written={totals['written']} "
+            f"({totals['seen'] / max(elapsed, 1e-9):.1f} photos/s)"
+        )
+
+    page_after = after  # sahifa kursori; checkpoint (after) faqat yozilgan chunk'lar bo'yicha suriladi
+    try:
+        while not (args.limit and totals["seen"] >= args.limit):
+            page = repo.page_latest_snapshots(after_person_id=page_after, limit=args.page_size, statuses=statuses)
+            if not page:
+                break
+            page_after = page[-1]["person_id"]
+            if args.limit:
+                page = page[: args.limit - totals["seen"]]
+
+            # read-ahead: butun sahifa rasmlari thread'larda o'qila boshlaydi
+            reads = [readers.submit(read_image, args.base_dir, doc["face_url"]) for doc in page]
+
+            for start in range(0, len(page), args.chunk_size):
+                docs = page[start:start + args.chunk_size]
+                items = []
+                for i in range(len(docs)):
+                    data = reads[start + i].result()
+                    if data is None:
+                        totals["missing"] += 1
+                        continue
+                    items.append((i, data))
+                totals["seen"] += len(docs)
+                inflight.append((docs, pool.submit(_embed_chunk, items)))
+                while len(inflight) > args.workers * 2:
+                    drain_one()
+
+        while inflight:
+            drain_one()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        readers.shutdown(wait=False)
+
+    elapsed = time.perf_counter() - started
+    mode = "dry-run, nothing written" if args.dry_run else f"checkpoint: {args.checkpoint}"
+    print(f"done in {elapsed:.1f}s: {totals} ({mode})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+IVF centroidlarini o'qitish va person_documents_v2 / person_embeddings cluster_id ni to'ldirish.
+
+    python -m scripts.train_ivf --nlist 1024 --sample 500000
+    python -m scripts.train_ivf --nlist 1024 --dry-run   # faqat o'qitish + klaster hajmlari
+
+Tartib:
+  1) namunadagi polygons bo'yicha spherical k-means
+  2) yangi version bilan ivf_centroids ga yozish ("pending": worker'lar eski + yangi versiyani birga probe qiladi)
+  3) worker'lar yangi centroidlarni olishini kutish (ingest yangi qatorlarni o'zi tayinlaydi)
+  4) mavjud qatorlar: Python'da assign -> Join jadval -> ALTER UPDATE (joinGet); person_documents_v2 id bo'yicha,
+     person_embeddings (person_id, slot, version) bo'yicha — har bir qator o'z vektoridan (slot 0 = centroid)
+  5) mutation'lar tugagach versiya ivf_active ga yoziladi — eski centroidlar shundan keyingina tushadi
+  6) Join jadvallar mutation'lar tugagandan keyingina o'chiriladi (aks holda nomi chiqariladi)
+"""
+from __future__ import annotations
+import argparse
+import time
+from typing import Any, Callable, Iterable, List, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.config import IVF_REFRESH_SEC, EMBEDDING_MODEL_VERSION
+from app.services.database import client
+from app.repositories.ivf_repo import IvfRepo
+from app.services.ivf import train_kmeans, assign_clusters, cluster_ids_for
+from scripts.backfill_polygons_bin import wait_mutations
+
+
+# person_embeddings qatori kaliti numpy'da ixcham: person_id baytlari, slot, version (ms)
+EMBEDDING_KEY_DTYPE = np.dtype([("person_id", "V16"), ("slot", "u1"), ("version", "datetime64[ms]")])
+
+
+def document_keys(rows: List[Tuple[Any, List[float]]]) -> np.ndarray:
+    return np.frombuffer(b"".join(row_id.bytes for row_id, _ in rows), dtype=np.uint8).reshape(-1, 16)
+
+
+def embedding_keys(rows: List[Tuple[Any, int, Any, List[float]]]) -> np.ndarray:
+    return np.array(
+        [(person_id.bytes, slot, version) for person_id, slot, version, _ in rows], dtype=EMBEDDING_KEY_DTYPE,
+    )
+
+
+def assign_all(
+    rows: Iterable[tuple],
+    pack_keys: Callable[[list], np.ndarray],
+    centroids: np.ndarray,
+    cluster_ids: np.ndarray,
+    batch_size: int,
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Barcha qatorlar uchun cluster_id (kalit numpy'da ixcham + klaster); qatorning oxirgi ustuni — polygons.
+    execute_iter stream'i oxirigacha o'qiladi: ochiq stream ustida shu client'da boshqa so'rov yuborib bo'lmaydi,
+    shuning uchun INSERT'lar faqat shundan keyin (insert_all).
+    """
+    keys: List[np.ndarray] = []
+    clusters: List[np.ndarray] = []
+    batch: list = []
+    total = 0
+    started = time.perf_counter()
+
+    def flush() -> int:
+        keys.append(pack_keys(batch))
+        assign = assign_clusters(np.asarray([row[-1] for row in batch], dtype=np.float32), centroids)
+        clusters.append(cluster_ids[assign - 1].astype(np.uint32))
+        return len(batch)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += flush()
+            batch = []
+            print(f"assigned {total} rows ({total / (time.perf_counter() - started):.0f} rows/s)")
+    if batch:
+        total += flush()
+
+    if not keys:
+        return 0, pack_keys([]), np.empty(0, dtype=np.uint32)
+    return total, np.concatenate(keys), np.concatenate(clusters)
+
+
+def insert_all(repo: IvfRepo, table: str, ids: np.ndarray, clusters: np.ndarray, *, batch_size: int) -> None:
+    for start in range(0, len(ids), batch_size):
+        repo.insert_assignments(
+            table,
+            [
+                {"id": UUID(bytes=raw.tobytes()), "cluster_id": int(c)}
+                for raw, c in zip(ids[start:start + batch_size], clusters[start:start + batch_size])
+            ],
+        )
+
+
+def insert_embedding_all(repo: IvfRepo, table: str, keys: np.ndarray, clusters: np.ndarray, *, batch_size: int) -> None:
+    for start in range(0, len(keys), batch_size):
+        repo.insert_embedding_assignments(
+            table,
+            [
+                {
+                    "person_id": UUID(bytes=key["person_id"].tobytes()),
+                    "slot": int(key["slot"]),
+                    "version": key["version"].item(),
+                    "cluster_id": int(c),
+                }
+                for key, c in zip(keys[start:start + batch_size], clusters[start:start + batch_size])
+            ],
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train IVF centroids and backfill cluster_id")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--sample", type=int, default=500000)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--publish-wait", type=float, default=IVF_REFRESH_SEC + 5.0)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    repo = IvfRepo(client)
+
+    started = time.perf_counter()
+    samples = np.asarray(repo.sample_embeddings(args.sample, EMBEDDING_MODEL_VERSION), dtype=np.float32)
+    print(f"sampled {len(samples)} embeddings")
+    centroids = train_kmeans(samples, args.nlist, iters=args.iters)
+    sizes = np.bincount(assign_clusters(samples, centroids) - 1, minlength=args.nlist)
+    print(
+        f"trained nlist={args.nlist} in {time.perf_counter() - started:.1f}s; "
+        f"cluster size min={sizes.min()} median={int(np.median(sizes))} max={sizes.max()}"
+    )
+    if args.dry_run:
+        return
+
+    version = repo.next_centroid_version()
+    cluster_ids = cluster_ids_for(version, len(centroids))
+    repo.insert_centroids(version, cluster_ids.tolist(), centroids.tolist())
+    print(f"published centroids version={version}, waiting {args.publish_wait:.0f}s for workers")
+    time.sleep(args.publish_wait)
+
+    table = f"ivf_assign_v{version}"
+    embeddings_table = f"ivf_assign_emb_v{version}"
+    tables = (table, embeddings_table)
+    repo.create_assignment_table(table)
+    repo.create_embedding_assignment_table(embeddings_table)
+    applied = False
+    try:
+        rows = repo.iter_embedding_rows(EMBEDDING_MODEL_VERSION, batch_size=args.batch_size)
+        total, ids, clusters = assign_all(rows, document_keys, centroids, cluster_ids, args.batch_size)
+        print(f"assigned {total} snapshot rows, inserting into {table}")
+        insert_all(repo, table, ids, clusters, batch_size=args.batch_size)
+
+        rows = repo.iter_person_embedding_rows(EMBEDDING_MODEL_VERSION, batch_size=args.batch_size)
+        emb_total, keys, clusters = assign_all(rows, embedding_keys, centroids, cluster_ids, args.batch_size)
+        print(f"assigned {emb_total} person_embeddings rows, inserting into {embeddings_table}")
+        insert_embedding_all(repo, embeddings_table, keys, clusters, batch_size=args.batch_size)
+
+        repo.apply_assignments(table, embeddings_table, EMBEDDING_MODEL_VERSION)
+        applied = True
+        wait_mutations(5.0)
+        repo.activate_centroids(version)
+        print(f"cluster_id backfilled for {total} + {emb_total} rows, centroids version={version} is active")
+    except BaseException:
+        if applied:
+            # mutation'lar joinGet orqali shu jadvallarni o'qiydi — ular tugaguncha o'chirib bo'lmaydi
+            print(f"mutations are not finished, leaving Join tables {', '.join(tables)}; drop them after they complete")
+        else:
+            for name in tables:
+                try:
+                    repo.drop_table(name)
+                except Exception:
+                    print(f"could not drop Join table {name}, drop it manually")
+        raise
+    for name in tables:
+        repo.drop_table(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.services.face_quality import QUALITY_CHIP_SIZE, QUALITY_SCALE, measure
+from app.services.provider_ingest_service import (
+    EMB_OK, PhotoResult, ProviderIngestService, quality_score,
+)
+
+S = QUALITY_CHIP_SIZE
+
+
+def reflect(i, n):
+    # cv2 BORDER_REFLECT_101: -1 -> 1, n -> n - 2
+    return -i if i < 0 else 2 * (n - 1) - i if i >= n else i
+
+
+def reference_laplacian_var(gray):
+    h, w = gray.shape
+    lap = np.empty_like(gray, dtype=np.float64)
+    for y in range(h):
+        for x in range(w):
+            lap[y, x] = (
+                gray[reflect(y - 1, h), x] + gray[reflect(y + 1, h), x]
+                + gray[y, reflect(x - 1, w)] + gray[y, reflect(x + 1, w)]
+                - 4.0 * gray[y, x]
+            )
+    return lap.var()
+
+
+def test_empty_input():
+    assert measure([], []) == []
+
+
+def test_uniform_chip_has_no_blur_score():
+    chip = np.full((S, S, 3), 200, dtype=np.uint8)
+    (q,) = measure([chip], [150])
+    assert q.blur == pytest.approx(0.0, abs=1e-3)
+    assert q.brightness == pytest.approx(200.0, rel=1e-4)
+    assert q.face_size == 150
+
+
+def test_gray_uses_bgr_weights():
+    chip = np.zeros((S, S, 3), dtype=np.uint8)
+    chip[..., 0] = 255  # faqat B kanal
+    (q,) = measure([chip], [100])
+    assert q.brightness == pytest.approx(0.114 * 255, rel=1e-4)
+
+
+def test_blur_matches_reflect101_laplacian():
+    rng = np.random.default_rng(3)
+    chips = rng.integers(0, 256, (2, 16, 16, 3), dtype=np.uint8)
+    results = measure(list(chips), [80, 90])
+    for chip, q in zip(chips, results):
+        gray = chip.astype(np.float64) @ np.array([0.114, 0.587, 0.299])
+        assert q.blur == pytest.approx(reference_laplacian_var(gray), rel=1e-3)
+
+
+def test_sharp_chip_scores_higher_than_smoothed():
+    yy, xx = np.mgrid[:S, :S]
+    sharp = (((yy // 4) + (xx // 4)) % 2 * 255).astype(np.uint8)
+    smooth = sharp.astype(np.float32)
+    for _ in range(3):  # 3x3 box blur
+        padded = np.pad(smooth, 1, mode="edge")
+        smooth = sum(padded[dy:dy + S, dx:dx + S] for dy in range(3) for dx in range(3)) / 9.0
+    chips = [np.repeat(img[..., None], 3, axis=2).astype(np.uint8) for img in (sharp, smooth)]
+    sharp_q, smooth_q = measure(chips, [S, S])
+    assert sharp_q.blur > 4 * smooth_q.blur
+
+
+def ok_photo(det_score, blur, face_size, quality_scale=QUALITY_SCALE):
+    return PhotoResult(
+        face_url="x.jpg", polygons=None, embedding_status=EMB_OK,
+        det_score=det_score, blur=blur, face_size=face_size, quality_scale=quality_scale,
+    )
+
+
+def test_blur_is_ignored_across_quality_scales():
+    service = ProviderIngestService(repo=None, face_app=None)
+    new = ok_photo(0.9, 20.0, 120)
+    # eski shkaladagi blur (asl crop) chip'dagidan ancha katta — solishtirilsa yangi rasm yutqazadi
+    legacy = ok_photo(0.9, 250.0, 120, quality_scale=0)
+    assert quality_score(new) + 5.0 < quality_score(legacy)
+    assert service.choose_best_photo(new, legacy) is new
+
+    same_scale = ok_photo(0.9, 250.0, 120)
+    assert service.choose_best_photo(new, same_scale) is same_scale
@@ -0,0 +1,129 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.idempotency import IdempotencyGuard, idempotency_key
+
+KEY = (1, 2, "2024-01-01", 1)
+
+
+def test_key_normalizes_reg_date():
+    payload = SimpleNamespace(border_id="1", sgb_person_id=2, reg_date=date(2024, 1, 1), action=1)
+    assert idempotency_key(payload) == KEY
+    payload.reg_date = "2024-01-01"
+    assert idempotency_key(payload) == KEY
+
+
+def test_concurrent_requests_share_one_ingest():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+        calls = []
+        gate = asyncio.Event()
+
+        async def ingest():
+            calls.append(1)
+            await gate.wait()
+            return "person-1"
+
+        first = asyncio.ensure_future(guard.run(KEY, None, ingest))
+        second = asyncio.ensure_future(guard.run(KEY, None, ingest))
+        await asyncio.sleep(0)
+        gate.set()
+        results = await asyncio.gather(first, second)
+        # keyingi retry — LRU'dan, ingest chaqirilmaydi
+        again = await guard.run(KEY, None, ingest)
+        return results, again, calls, guard.stats()
+
+    results, again, calls, stats = asyncio.run(scenario())
+    assert results == ["person-1", "person-1"]
+    assert again == "person-1"
+    assert calls == [1]
+    assert stats["replays"] == 2
+    assert stats["inflight"] == 0
+
+
+def test_lookup_hit_skips_ingest():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+
+        async def ingest():
+            raise AssertionError("must not ingest")
+
+        person_id = await guard.run(KEY, lambda: "person-db", ingest)
+        return person_id, guard.peek(KEY), guard.replays
+
+    person_id, peeked, replays = asyncio.run(scenario())
+    assert person_id == "person-db"
+    assert peeked == "person-db"
+    assert replays == 2  # lookup + peek
+
+
+def test_failure_is_shared_and_not_remembered():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise ValueError("Database error")
+
+        first = asyncio.ensure_future(guard.run(KEY, None, failing))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(guard.run(KEY, None, failing))
+        await asyncio.sleep(0)
+        gate.set()
+        outcomes = await asyncio.gather(first, waiter, return_exceptions=True)
+        return outcomes, guard.peek(KEY), guard.stats()
+
+    outcomes, peeked, stats = asyncio.run(scenario())
+    assert all(isinstance(o, ValueError) for o in outcomes)
+    assert peeked is None
+    assert stats["inflight"] == 0
+
+
+def test_claim_and_resolve_for_bulk_callers():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+        assert guard.claim(KEY) is None  # kalit shu chaqiruvchiga band
+        flight = guard.claim(KEY)  # boshqa ingest natijani kutadi
+        assert flight is not None
+
+        single = asyncio.ensure_future(guard.run(KEY, None, None))
+        await asyncio.sleep(0)
+        guard.resolve(KEY, "person-1")
+        return await flight, await single, guard.peek(KEY), guard.stats()
+
+    flight_result, single_result, peeked, stats = asyncio.run(scenario())
+    assert flight_result == single_result == peeked == "person-1"
+    assert stats["inflight"] == 0
+
+
+def test_resolve_error_reaches_waiters():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+        assert guard.claim(KEY) is None
+        flight = guard.claim(KEY)
+        guard.resolve(KEY, error=ValueError("boom"))
+        with pytest.raises(ValueError):
+            await flight
+        # kalit bo'shadi — keyingi so'rov o'zi ingest qiladi
+        assert guard.claim(KEY) is None
+
+    asyncio.run(scenario())
+
+
+def test_async_lookup_is_awaited():
+    async def scenario():
+        guard = IdempotencyGuard(10)
+
+        async def lookup():
+            return "person-db"
+
+        async def ingest():
+            raise AssertionError("must not ingest")
+
+        return await guard.run(KEY, lookup, ingest)
+
+    assert asyncio.run(scenario()) == "person-db"
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.inference_gate import BusyError, InferenceGate, LANE_INGEST, LANE_SEARCH, lane_hint
+
+
+def make_gate(**kwargs):
+    params = dict(max_concurrency=1, max_queue=8, queue_timeout_sec=5.0, retry_after_sec=2.0)
+    params.update(kwargs)
+    return InferenceGate(**params)
+
+
+async def settle():
+    # submit qilingan task'lar _acquire'da kutishga o'tguncha
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_sheds_when_lane_queue_is_full():
+    async def scenario():
+        gate = make_gate(max_queue=1)
+        release = threading.Event()
+        running = gate.submit(release.wait, lane=LANE_INGEST)
+        queued = gate.submit(lambda: "queued", lane=LANE_INGEST)
+        with pytest.raises(BusyError) as exc:
+            gate.submit(lambda: "shed", lane=LANE_INGEST)
+        assert exc.value.retry_after == 2.0
+
+        # boshqa lane'ning navbati alohida
+        search = gate.submit(lambda: "search", lane=LANE_SEARCH)
+
+        release.set()
+        assert await queued == "queued"
+        assert await search == "search"
+        await running
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["lanes"][LANE_INGEST]["shed"] == 1
+    assert stats["lanes"][LANE_INGEST]["served"] == 2
+    assert stats["lanes"][LANE_SEARCH]["shed"] == 0
+    assert stats["shed"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_queue_timeout_counts_as_shed():
+    async def scenario():
+        gate = make_gate(queue_timeout_sec=0.05)
+        release = threading.Event()
+        running = gate.submit(release.wait)
+        waiting = gate.submit(lambda: None)
+        with pytest.raises(BusyError):
+            await waiting
+        release.set()
+        await running
+        return gate.stats()
+
+    stats = asyncio.run(scenario())
+    lane = stats["lanes"][LANE_SEARCH]
+    assert lane["timed_out"] == 1
+    assert lane["shed"] == 1
+    assert lane["served"] == 1
+    assert lane["queue_depth"] == 0
+
+
+def run_order(ingest_min_share):
+    async def scenario():
+        gate = make_gate(ingest_min_share=ingest_min_share)
+        release = threading.Event()
+        order = []
+        blocker = gate.submit(release.wait)
+        await settle()
+        tasks = [
+            gate.submit(order.append, name, lane=lane)
+            for name, lane in (
+                ("i1", LANE_INGEST), ("i2", LANE_INGEST),
+                ("s1", LANE_SEARCH), ("s2", LANE_SEARCH), ("s3", LANE_SEARCH),
+            )
+        ]
+        await settle()
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    return asyncio.run(scenario())
+
+
+def test_search_lane_goes_first_without_ingest_share():
+    assert run_order(0.0) == ["s1", "s2", "s3", "i1", "i2"]
+
+
+def test_ingest_lane_gets_its_min_share():
+    # 0.5 -> search ketma-ket bitta slotdan keyin navbat ingest'niki
+    assert run_order(0.5) == ["s1", "i1", "s2", "i2", "s3"]
+
+
+def test_cancelled_before_start_frees_queue_slot():
+    async def scenario():
+        gate = make_gate(max_queue=1)
+        release = threading.Event()
+        running = gate.submit(release.wait)
+        queued = gate.submit(time.sleep, 0)
+        queued.cancel()
+        await settle()
+        # bekor qilingan ish navbat hisobidan chiqdi — yangi ish qabul qilinadi
+        again = gate.submit(lambda: "ok")
+        release.set()
+        await running
+        return await again, gate.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "ok"
+    assert stats["shed"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_lane_hint_only_downgrades():
+    assert lane_hint(None, LANE_SEARCH) == LANE_SEARCH
+    assert lane_hint(" Ingest ", LANE_SEARCH) == LANE_INGEST
+    assert lane_hint("search", LANE_INGEST) == LANE_INGEST
+    assert lane_hint("bogus", LANE_SEARCH) == LANE_SEARCH
@@ -0,0 +1,94 @@
+import time
+
+from app.services.ingest_queue import (
+    IngestQueue, STATUS_DONE, STATUS_ERROR, STATUS_PROCESSING, STATUS_QUEUED,
+)
+
+
+def make_queue(tmp_path, **kwargs):
+    return IngestQueue(str(tmp_path / "queue" / "ingest.db"), **kwargs)
+
+
+def test_claim_is_fifo_and_exclusive(tmp_path):
+    queue = make_queue(tmp_path)
+    receipts = [queue.enqueue({"n": n}) for n in range(3)]
+
+    first = queue.claim(2)
+    assert [r for r, _ in first] == receipts[:2]
+    assert [p["n"] for _, p in first] == [0, 1]
+    assert queue.status(receipts[0])["status"] == STATUS_PROCESSING
+    assert queue.status(receipts[0])["attempts"] == 1
+
+    # boshqa worker faqat qolganini oladi
+    other = IngestQueue(queue.path)
+    assert [r for r, _ in other.claim(10)] == receipts[2:]
+    assert queue.claim(10) == []
+
+
+def test_finish_records_result(tmp_path):
+    queue = make_queue(tmp_path)
+    ok, bad = queue.enqueue({}), queue.enqueue({})
+    queue.claim(2)
+    queue.finish([(ok, "person-1", None), (bad, None, "Database error")])
+
+    assert queue.status(ok)["status"] == STATUS_DONE
+    assert queue.status(ok)["person_id"] == "person-1"
+    assert queue.status(bad)["status"] == STATUS_ERROR
+    assert queue.status(bad)["message"] == "Database error"
+    assert queue.stats() == {STATUS_DONE: 1, STATUS_ERROR: 1}
+
+
+def test_release_requeues_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2)
+    receipt = queue.enqueue({})
+
+    queue.claim(1)
+    queue.release([receipt], "temporary")
+    assert queue.status(receipt)["status"] == STATUS_QUEUED
+
+    queue.claim(1)
+    queue.release([receipt], "temporary again")
+    status = queue.status(receipt)
+    assert status["status"] == STATUS_ERROR
+    assert status["message"] == "temporary again"
+    assert status["attempts"] == 2
+
+
+def test_release_without_counting_attempt(tmp_path):
+    # inference band (load shedding) — urinish sarflanmaydi
+    queue = make_queue(tmp_path, max_attempts=1)
+    receipt = queue.enqueue({})
+    for _ in range(3):
+        assert queue.claim(1)
+        queue.release([receipt], "busy", count_attempt=False)
+    status = queue.status(receipt)
+    assert status["status"] == STATUS_QUEUED
+    assert status["attempts"] == 0
+
+
+def test_stale_processing_job_is_requeued_then_failed(tmp_path):
+    queue = make_queue(tmp_path, visibility_sec=0.0, max_attempts=2)
+    receipt = queue.enqueue({})
+
+    assert queue.claim(1)  # worker yiqildi: finish / release yo'q
+    time.sleep(0.01)
+    assert [r for r, _ in queue.claim(1)] == [receipt]
+    assert queue.status(receipt)["attempts"] == 2
+
+    time.sleep(0.01)
+    assert queue.claim(1) == []
+    status = queue.status(receipt)
+    assert status["status"] == STATUS_ERROR
+    assert status["attempts"] == 2
+
+
+def test_purge_keeps_unfinished_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    done, pending = queue.enqueue({}), queue.enqueue({})
+    queue.claim(1)
+    queue.finish([(done, "person-1", None)])
+    time.sleep(0.01)
+
+    assert queue.purge(0.0) == 1
+    assert queue.status(done) is None
+    assert queue.status(pending)["status"] == STATUS_QUEUED
@@ -0,0 +1,62 @@
+import time
+
+from app.services.lru import LruCache
+
+
+def test_put_many_skips_keys_invalidated_after_epoch():
+    cache = LruCache(10)
+    since = cache.epoch
+    # loader so'rov yuborgan paytda "a" o'zgardi
+    cache.invalidate("a")
+    cache.put_many({"a": "stale", "b": "fresh"}, since_epoch=since)
+    assert cache.get("a") is None
+    assert cache.get("b") == "fresh"
+
+    # invalidatsiyadan keyin olingan epoch bilan yozish mumkin
+    cache.put_many({"a": "new"}, since_epoch=cache.epoch)
+    assert cache.get("a") == "new"
+
+
+def test_put_many_without_epoch_always_writes():
+    cache = LruCache(10)
+    cache.invalidate("a")
+    cache.put_many({"a": 1})
+    assert cache.get("a") == 1
+
+
+def test_invalidate_removes_value_and_counts():
+    cache = LruCache(10)
+    cache.put("a", [1, 2, 3])
+    assert cache.bytes > 0
+    cache.invalidate("a")
+    assert cache.get("a", "missing") == "missing"
+    assert cache.bytes == 0
+    assert cache.stats()["invalidations"] == 1
+    assert cache.epoch == 1
+
+
+def test_none_values_are_cached():
+    cache = LruCache(10)
+    cache.put("a", None)
+    found, missing = cache.get_many(["a", "b"])
+    assert found == {"a": None}
+    assert missing == ["b"]
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = LruCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expires_entries():
+    cache = LruCache(10, ttl_sec=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,37 @@
+import numpy as np
+
+from app.services.quantization import EMB_SIZE, SIGN_WORDS, pack_sign_bits
+
+
+def unpack(words):
+    """pack_sign_bits teskarisi: bit j of word w -> index w*64 + j."""
+    return np.array([(int(words[i // 64]) >> (i % 64)) & 1 for i in range(EMB_SIZE)], dtype=bool)
+
+
+def test_layout_is_word_major_little_endian():
+    vec = np.full(EMB_SIZE, -1.0, dtype=np.float32)
+    vec[0] = 1.0  # word 0, bit 0
+    vec[63] = 1.0  # word 0, bit 63
+    vec[64 * 5 + 3] = 1.0  # word 5, bit 3
+    words = pack_sign_bits(vec.tolist())
+
+    assert len(words) == SIGN_WORDS
+    assert words[0] == 1 | (1 << 63)
+    assert words[5] == 1 << 3
+    assert all(w == 0 for i, w in enumerate(words) if i not in (0, 5))
+
+
+def test_zero_is_not_positive():
+    assert pack_sign_bits([0.0] * EMB_SIZE) == [0] * SIGN_WORDS
+    assert pack_sign_bits([1.0] * EMB_SIZE) == [2 ** 64 - 1] * SIGN_WORDS
+
+
+def test_roundtrip_and_hamming_match_sign_disagreements():
+    rng = np.random.default_rng(7)
+    a, b = rng.standard_normal((2, EMB_SIZE)).astype(np.float32)
+    wa, wb = pack_sign_bits(a), pack_sign_bits(b)
+
+    assert (unpack(wa) == (a > 0)).all()
+    # ClickHouse: arraySum(bitCount(bitXor(x, y)))
+    hamming = sum(bin(x ^ y).count("1") for x, y in zip(wa, wb))
+    assert hamming == int(((a > 0) != (b > 0)).sum())
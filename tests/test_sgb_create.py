@@ -0,0 +1,42 @@
+import threading
+import time
+
+from app.services.person_locks import PersonLocks
+from app.services.provider_ingest_service import ProviderIngestService
+
+
+class FakeRepo:
+    def __init__(self):
+        self.sgb_map = {}
+        self.inserts = 0
+
+    def get_person_id_by_sgb(self, sgb_person_id):
+        return self.sgb_map.get(sgb_person_id)
+
+    def insert_person(self, pid):
+        pass
+
+    def upsert_sgb_map(self, sgb_person_id, pid, is_active=1):
+        time.sleep(0.01)  # boshqa thread shu orada lookup qiladi
+        self.inserts += 1
+        self.sgb_map[sgb_person_id] = pid
+
+
+def test_concurrent_misses_create_one_person(tmp_path):
+    repo = FakeRepo()
+    locks = PersonLocks(str(tmp_path / "sgb.lock"))
+    # ikki xil service (worker'lar) — map yo'q, ikkalasi ham lookup miss ko'radi
+    services = [ProviderIngestService(repo=repo, face_app=None, sgb_locks=locks) for _ in range(2)]
+    results = []
+    threads = [
+        threading.Thread(target=lambda s=s: results.append(s.create_person_locked(7))) for s in services
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    locks.close()
+
+    assert repo.inserts == 1
+    assert len(set(results)) == 1
+    assert results[0] == repo.sgb_map[7]
@@ -0,0 +1,28 @@
+from app.services.face_quality import QUALITY_SCALE
+from app.services.provider_ingest_service import (
+    EMB_OK, PhotoResult, ProviderIngestService, quality_score,
+)
+from app.services.templates import FIRST_TEMPLATE_SLOT, pick_template_slot
+
+
+def ok_photo(det_score):
+    return PhotoResult(
+        face_url="x.jpg", polygons=None, embedding_status=EMB_OK,
+        det_score=det_score, blur=20.0, face_size=120, quality_scale=QUALITY_SCALE,
+    )
+
+
+def test_free_slot_is_used_first():
+    assert pick_template_slot({}, 10.0, 3) == FIRST_TEMPLATE_SLOT
+    assert pick_template_slot({1: 90.0, 3: 80.0}, 10.0, 3) == 2
+
+
+def test_single_template_follows_best_photo():
+    # K=1: slot 1 (va centroid) snapshot'dagi best photo bilan bir xil qoida bo'yicha almashadi
+    service = ProviderIngestService(repo=None, face_app=None)
+    old = ok_photo(0.90)
+    for det_score in (0.97, 0.90, 0.87, 0.80):
+        new = ok_photo(det_score)
+        keeps_new = service.choose_best_photo(new, old) is new
+        slot = pick_template_slot({1: quality_score(old)}, quality_score(new), 1)
+        assert keeps_new == (slot == 1), det_score